@@ -0,0 +1,433 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from .ncf_service import LoadedNCFModel, UNKNOWN_INDEX, top_k_indices, catalog_mask
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Observed (user, movie) pairs per gather when computing row dot products, bounding memory
+DOT_CHUNK = 1 << 18
+
+def interaction_weights():
+    """
+    (user_ids, movie_ids, weights) per observed pair, from Rating and UserInteraction
+    Each event is weighted like preference learning (RealTimePreferenceService._calculate_boost_factor)
+    and repeated events on the same pair add up, including those coalesced into one row's
+    count. 'rate' interactions are skipped since the Rating row already counts them.
+    """
+    from users.models import Rating, UserInteraction
+    from users.preference_service import RealTimePreferenceService
+
+    boost = RealTimePreferenceService._calculate_boost_factor
+
+    ratings = np.array(list(Rating.objects.values_list('user_id', 'movie_id', 'rating')), dtype=np.int64).reshape(-1, 3)
+    rating_weights = np.array([boost('rate', value) for value in range(6)], dtype=np.float32)
+
+    interactions = list(
+        UserInteraction.objects.exclude(interaction_type='rate').values_list('user_id', 'movie_id', 'interaction_type', 'count')
+    )
+    type_weights = {interaction_type: boost(interaction_type) for interaction_type in {row[2] for row in interactions}}
+
+    user_ids = np.concatenate([ratings[:, 0], np.fromiter((row[0] for row in interactions), np.int64, len(interactions))])
+    movie_ids = np.concatenate([ratings[:, 1], np.fromiter((row[1] for row in interactions), np.int64, len(interactions))])
+    weights = np.concatenate([
+        rating_weights[np.clip(ratings[:, 2], 0, 5)],
+        np.fromiter((type_weights[row[2]] * row[3] for row in interactions), np.float32, len(interactions)),
+    ])
+    return user_ids, movie_ids, weights
+
+def build_confidence_matrix(user_ids, movie_ids, weights, alpha=40.0):
+    """
+    Users x movies CSR of confidence - 1 (alpha * summed weight) for pairs with a positive total
+    Pairs whose events net out negative (low ratings, watchlist removals) carry no preference
+    and are left unobserved. Returns (user index -> id, movie index -> id, matrix).
+    """
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    movies, movie_index = np.unique(movie_ids, return_inverse=True)
+
+    summed = sparse.coo_matrix(
+        (weights.astype(np.float32), (user_index, movie_index)), shape=(len(users), len(movies))
+    ).tocsr()
+    summed.sum_duplicates()
+    summed.data[summed.data < 0] = 0
+    summed.eliminate_zeros()
+    summed.data *= alpha
+
+    # Drop users and movies left without any positive pair
+    user_keep = np.flatnonzero(np.diff(summed.indptr))
+    summed = summed[user_keep]
+    movie_keep = np.flatnonzero(np.bincount(summed.indices, minlength=len(movies)))
+    summed = summed[:, movie_keep].tocsr()
+    summed.sort_indices()
+    return users[user_keep], movies[movie_keep], summed.astype(np.float32)
+
+def _row_dots(row_vectors, col_vectors, rows, cols):
+    """row_vectors[rows[n]] . col_vectors[cols[n]] for every observed pair n"""
+    dots = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), DOT_CHUNK):
+        stop = start + DOT_CHUNK
+        dots[start:stop] = np.einsum('ij,ij->i', row_vectors[rows[start:stop]], col_vectors[cols[start:stop]])
+    return dots
+
+def _least_squares_cg(confidence, X, Y, regularization, cg_steps):
+    """
+    One ALS half-step: update every row of X in place given the fixed factors Y
+    Row u solves (YtY + Y^T (C_u - I) Y + reg I) x_u = Y^T C_u p_u. All rows run the same few
+    warm-started conjugate-gradient steps together, so each step is a dense matmul plus one
+    sparse matmul instead of a per-user solve.
+    """
+    YtY = Y.T @ Y + regularization * np.eye(Y.shape[1], dtype=np.float32)
+    rows = np.repeat(np.arange(confidence.shape[0]), np.diff(confidence.indptr))
+
+    def apply(P):
+        dots = _row_dots(P, Y, rows, confidence.indices)
+        weighted = sparse.csr_matrix((confidence.data * dots, confidence.indices, confidence.indptr), shape=confidence.shape)
+        return P @ YtY + weighted @ Y
+
+    b = sparse.csr_matrix((confidence.data + 1, confidence.indices, confidence.indptr), shape=confidence.shape) @ Y
+    residual = b - apply(X)
+    direction = residual.copy()
+    rs_old = np.einsum('ij,ij->i', residual, residual)
+
+    for _ in range(cg_steps):
+        step = apply(direction)
+        curvature = np.einsum('ij,ij->i', direction, step)
+        alpha = np.divide(rs_old, curvature, out=np.zeros_like(rs_old), where=curvature > 1e-20)
+        X += alpha[:, None] * direction
+        residual -= alpha[:, None] * step
+
+        rs_new = np.einsum('ij,ij->i', residual, residual)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 1e-20)
+        direction = residual + beta[:, None] * direction
+        rs_old = rs_new
+
+def train_als(confidence, factors=64, regularization=0.05, iterations=15, cg_steps=3, seed=0, progress=None):
+    """
+    Implicit-feedback ALS (Hu, Koren & Volinsky) on a users x movies CSR of confidence - 1
+    Returns (user_factors, item_factors) as float32. progress(iteration, seconds) is called
+    after every full iteration.
+    """
+    rng = np.random.default_rng(seed)
+    n_users, n_movies = confidence.shape
+    user_factors = rng.normal(0, 0.01, (n_users, factors)).astype(np.float32)
+    item_factors = rng.normal(0, 0.01, (n_movies, factors)).astype(np.float32)
+    by_movie = confidence.T.tocsr()
+
+    for iteration in range(iterations):
+        started = time.time()
+        _least_squares_cg(confidence, user_factors, item_factors, regularization, cg_steps)
+        _least_squares_cg(by_movie, item_factors, user_factors, regularization, cg_steps)
+        if progress:
+            progress(iteration + 1, time.time() - started)
+
+    return user_factors, item_factors
+
+def save_als_model(path, user_ids, movie_ids, user_factors, item_factors, meta):
+    """Write the factors and ID arrays to one .npz, swapped in atomically for running workers"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    meta = dict(meta, version=f"als-{timezone.now().strftime('%Y%m%dT%H%M%S')}")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            user_ids=np.asarray(user_ids, dtype=np.int64),
+            movie_ids=np.asarray(movie_ids, dtype=np.int64),
+            user_factors=user_factors,
+            item_factors=item_factors,
+            meta=np.array(json.dumps(meta)),
+        )
+    os.replace(tmp_path, path)
+    return meta
+
+def als_model_stamp(path=None):
+    """Cheap identity of the installed factors file (None if there is none), for cache keys"""
+    path = path or getattr(settings, 'ALS_MODEL_PATH', None)
+    try:
+        return f"als-{os.stat(path).st_mtime_ns}"
+    except (OSError, TypeError):
+        return None
+
+class LoadedALSModel:
+    """
+    One immutable set of ALS factors
+    Mirrors LoadedNCFModel's lookups (movie_ids, user_lookup, movie_lookup, item_embeddings),
+    so code written against a loaded NCF model can rank with it too.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.meta = json.loads(str(data['meta']))
+            self.user_ids = data['user_ids']
+            self.movie_ids = data['movie_ids']
+            self.user_factors = data['user_factors']
+            self.item_factors = data['item_factors']
+
+        self.version = self.meta.get('version', 'als')
+        self.stamp = als_model_stamp(path)
+        self.serving_key = self.stamp or self.version
+        self.user_lookup = LoadedNCFModel._compile_lookup(self.user_ids)
+        self.movie_lookup = LoadedNCFModel._compile_lookup(self.movie_ids)
+
+        # Unit-length rows for cosine similarity
+        norms = np.linalg.norm(self.item_factors, axis=1, keepdims=True)
+        self.item_embeddings = self.item_factors / np.maximum(norms, 1e-12)
+
+        # Gram matrix reused by every fold-in solve
+        self.item_gram = self.item_factors.T @ self.item_factors
+
+    def encode_user_id(self, user_id):
+        return LoadedNCFModel._lookup_one(self.user_lookup, user_id)
+
+    def encode_movie_id(self, movie_id):
+        return LoadedNCFModel._lookup_one(self.movie_lookup, movie_id)
+
+    def encode_user_ids(self, user_ids):
+        return LoadedNCFModel._lookup_many(self.user_lookup, user_ids)
+
+    def encode_movie_ids(self, movie_ids):
+        return LoadedNCFModel._lookup_many(self.movie_lookup, movie_ids)
+
+    def score_matrix(self, user_encoded, movie_encoded):
+        """(len(user_encoded), len(movie_encoded)) predicted preferences"""
+        return self.user_factors[np.asarray(user_encoded)] @ self.item_factors[np.asarray(movie_encoded)].T
+
+class ALSModelService:
+    """
+    Implicit ALS recommendation service with the same interface as NCFModelService
+    Serves the factors trained by `manage.py train_als` from ALS_MODEL_PATH and picks up a
+    retrained file on the next request after it is replaced. Scoring is a dot product of
+    user and movie factors, so it runs on CPU without TensorFlow.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    _current = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super(ALSModelService, cls).__new__(cls)
+                    instance._setup(getattr(settings, 'ALS_MODEL_PATH', None))
+                    cls._instance = instance
+        return cls._instance
+
+    def _setup(self, path):
+        self._path = path
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self._last_check = time.monotonic()
+        self._current = self._load()
+
+    def _load(self):
+        """Load the factors file (None if missing or unreadable)"""
+        if not self._path or not os.path.exists(self._path):
+            logger.warning(f"No ALS model at {self._path}; run `manage.py train_als`")
+            return None
+        try:
+            loaded = LoadedALSModel(self._path)
+            logger.info(
+                f"ALS model {loaded.version} loaded: {len(loaded.user_ids):,} users x "
+                f"{len(loaded.movie_ids):,} movies, {loaded.item_factors.shape[1]} factors"
+            )
+            return loaded
+        except Exception as e:
+            logger.error(f"Error loading ALS model: {e}")
+            return None
+
+    def check_for_update(self, force=False):
+        """Start a background load if the factors file changed (checked every NCF_RELOAD_CHECK_INTERVAL s)
+
+        As with NCFModelService, requests keep the old factors until the new ones are loaded.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < getattr(settings, 'NCF_RELOAD_CHECK_INTERVAL', 30):
+            return
+        self._last_check = now
+
+        stamp = als_model_stamp(self._path)
+        current = self._current
+        if stamp is None or (current is not None and current.stamp == stamp):
+            return
+
+        with self._reload_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return
+            self._reload_thread = threading.Thread(target=self._reload, name='als-model-reload', daemon=True)
+            self._reload_thread.start()
+
+    def _reload(self):
+        """Background reload: load fully, then swap the reference atomically"""
+        loaded = self._load()
+        if loaded is not None:
+            previous = self._current
+            self._current = loaded
+            logger.info(f"Swapped ALS model {previous.serving_key if previous else None} -> {loaded.serving_key}")
+
+    def current_model(self):
+        """The LoadedALSModel to use for one request; a replaced factors file is loaded in the background"""
+        self.check_for_update()
+        return self._current
+
+    @property
+    def model_version(self):
+        current = self._current
+        return current.version if current is not None else None
+
+    def is_model_loaded(self):
+        return self.current_model() is not None
+
+    def encode_user_id(self, user_id):
+        model = self.current_model()
+        return model.encode_user_id(user_id) if model is not None else None
+
+    def encode_movie_id(self, movie_id):
+        model = self.current_model()
+        return model.encode_movie_id(movie_id) if model is not None else None
+
+    def encode_user_ids(self, user_ids):
+        return LoadedNCFModel._lookup_many(getattr(self.current_model(), 'user_lookup', None), user_ids)
+
+    def encode_movie_ids(self, movie_ids):
+        return LoadedNCFModel._lookup_many(getattr(self.current_model(), 'movie_lookup', None), movie_ids)
+
+    def predict_single(self, user_id, movie_id):
+        model = self.current_model()
+        if model is None:
+            return None
+        user_encoded = model.encode_user_id(user_id)
+        movie_encoded = model.encode_movie_id(movie_id)
+        if user_encoded is None or movie_encoded is None:
+            return None
+        return float(model.user_factors[user_encoded] @ model.item_factors[movie_encoded])
+
+    def score_candidates(self, user_id, movie_ids):
+        """Scores aligned with movie_ids, NaN where a movie is unknown; None for an unknown user"""
+        model = self.current_model()
+        if model is None:
+            return None
+        user_encoded = model.encode_user_id(user_id)
+        if user_encoded is None:
+            return None
+
+        movie_encoded = model.encode_movie_ids(movie_ids)
+        valid = movie_encoded != UNKNOWN_INDEX
+        scores = np.full(len(movie_encoded), np.nan, dtype=np.float32)
+        scores[valid] = model.item_factors[movie_encoded[valid]] @ model.user_factors[user_encoded]
+        return scores
+
+    def predict_batch(self, user_id, movie_ids):
+        movie_ids = np.asarray(list(movie_ids), dtype=np.int64)
+        scores = self.score_candidates(user_id, movie_ids)
+        if scores is None:
+            return {}
+        valid = ~np.isnan(scores)
+        return dict(zip(movie_ids[valid].tolist(), scores[valid].astype(float).tolist()))
+
+    def get_top_recommendations(self, user_id, candidate_movie_ids, top_k=20):
+        candidate_movie_ids = np.asarray(list(candidate_movie_ids), dtype=np.int64)
+        scores = self.score_candidates(user_id, candidate_movie_ids)
+        if scores is None:
+            return []
+        scores = np.where(np.isnan(scores), -np.inf, scores)
+        top = top_k_indices(scores, top_k)
+        return candidate_movie_ids[top[np.isfinite(scores[top])]].tolist()
+
+    def _rank(self, model, scores, excluded, top_k):
+        scores[excluded[excluded != UNKNOWN_INDEX]] = -np.inf
+        scores[~catalog_mask(model)] = -np.inf
+        top = top_k_indices(scores, top_k)
+        top = top[np.isfinite(scores[top])]
+        return list(zip(model.movie_ids[top].tolist(), scores[top].astype(float).tolist()))
+
+    def recommend(self, user_id, exclude_movie_ids=(), top_k=20, chunk_size=None):
+        """Rank the whole catalog for a user with one mat-vec, returning [(movie_id, score), ...] best first"""
+        model = self.current_model()
+        if model is None:
+            return []
+        user_encoded = model.encode_user_id(user_id)
+        if user_encoded is None:
+            return []
+
+        scores = model.item_factors @ model.user_factors[user_encoded]
+        return self._rank(model, scores, model.encode_movie_ids(list(exclude_movie_ids)), top_k)
+
+    def recommend_many(self, user_ids, exclude_movie_ids=None, top_k=20, block_users=64):
+        """Yield (user_id, [(movie_id, score), ...]) per user; each block is one user x movie factor product"""
+        model = self.current_model()
+        if model is None:
+            return
+
+        exclude_movie_ids = exclude_movie_ids or {}
+        user_ids = np.asarray(list(user_ids), dtype=np.int64)
+        user_encoded = model.encode_user_ids(user_ids)
+
+        for block_start in range(0, len(user_ids), block_users):
+            block_ids = user_ids[block_start:block_start + block_users]
+            block_encoded = user_encoded[block_start:block_start + block_users]
+            known = block_encoded != UNKNOWN_INDEX
+            scores = model.user_factors[block_encoded[known]] @ model.item_factors.T
+
+            rows = iter(scores)
+            for user_id, is_known in zip(block_ids.tolist(), known.tolist()):
+                if not is_known:
+                    yield user_id, []
+                    continue
+                excluded = model.encode_movie_ids(list(exclude_movie_ids.get(user_id, ())))
+                yield user_id, self._rank(model, next(rows), excluded, top_k)
+
+    def fold_in_user(self, movie_ids, weights):
+        """Factors for a user the model has never seen: one ALS user solve against the fixed movie factors
+
+        Only positively weighted movies count as observed, as in training. Returns None if no
+        such movie is known to the model.
+        """
+        model = self.current_model()
+        if model is None:
+            return None
+
+        movie_encoded = model.encode_movie_ids(movie_ids)
+        weights = np.asarray(weights, dtype=np.float32)
+        observed = (movie_encoded != UNKNOWN_INDEX) & (weights > 0)
+        if not observed.any():
+            return None
+
+        Y = model.item_factors[movie_encoded[observed]]
+        confidence = model.meta.get('alpha', 40.0) * weights[observed]
+        regularization = model.meta.get('regularization', 0.05)
+        A = model.item_gram + (Y.T * confidence) @ Y + regularization * np.eye(Y.shape[1], dtype=np.float32)
+        return np.linalg.solve(A, (confidence + 1) @ Y).astype(np.float32)
+
+    def recommend_for_vector(self, user_vector, exclude_movie_ids=(), top_k=20):
+        """Rank the catalog against folded-in user factors"""
+        model = self.current_model()
+        if model is None or user_vector is None or len(user_vector) != model.item_factors.shape[1]:
+            return []
+        scores = model.item_factors @ np.asarray(user_vector, dtype=np.float32)
+        return self._rank(model, scores, model.encode_movie_ids(list(exclude_movie_ids)), top_k)
+
+    def get_similar_movies(self, movie_id, top_k=10):
+        """[(movie_id, cosine similarity), ...] of the movie's factors, most similar first"""
+        model = self.current_model()
+        if model is None:
+            return []
+        movie_encoded = model.encode_movie_id(movie_id)
+        if movie_encoded is None:
+            return []
+
+        scores = model.item_embeddings @ model.item_embeddings[movie_encoded]
+        return self._rank(model, scores, np.array([movie_encoded]), top_k)
+
+def get_als_service():
+    """Return the process-wide ALS service, loading the factors on first call"""
+    return ALSModelService()
+
+# Global instance - resolved lazily like ncf_service
+als_service = SimpleLazyObject(get_als_service)
@@ -0,0 +1,153 @@
+import os
+import json
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IVFIndex:
+    """
+    Inverted-file index for approximate maximum-inner-product search over item vectors
+    k-means centroids act as a coarse quantizer; each item lives in the inverted list of its
+    nearest centroid, and list members are stored contiguously so probing a list is one slice
+    and one mat-vec. A query scans only the `nprobe` lists whose centroids score highest.
+    An optional query_projection maps raw user features to a query vector (see fit_query_projection).
+    """
+
+    CENTROIDS_FILE = 'centroids.npy'      # (n_lists, dims)
+    OFFSETS_FILE = 'list_offsets.npy'     # (n_lists + 1,) start of each list in the arrays below
+    ITEMS_FILE = 'list_items.npy'         # (n_items,) item index, grouped by list
+    VECTORS_FILE = 'list_vectors.npy'     # (n_items, dims) item vectors in the same order
+    PROJECTION_FILE = 'query_projection.npy'  # (feature dims + 1, dims), optional
+    META_FILE = 'meta.json'               # written last, marks a complete index
+
+    def __init__(self, centroids, list_offsets, list_items, list_vectors, meta=None, query_projection=None):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_items = list_items
+        self.list_vectors = list_vectors
+        self.meta = meta or {}
+        self.query_projection = query_projection
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.list_items)
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, seed=0, max_train_points=100000):
+        """Cluster `vectors` into n_lists lists (default ~sqrt(n)) with k-means"""
+        from sklearn.cluster import MiniBatchKMeans
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n_items = len(vectors)
+        n_lists = min(n_lists or max(1, int(np.sqrt(n_items))), n_items)
+
+        # Fit on a sample for large catalogs; assignment below still covers every item
+        rng = np.random.default_rng(seed)
+        sample = vectors
+        if n_items > max_train_points:
+            sample = vectors[rng.choice(n_items, max_train_points, replace=False)]
+
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=seed, n_init=3, batch_size=4096)
+        kmeans.fit(sample)
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        assignments = kmeans.predict(vectors)
+
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        return cls(centroids, list_offsets, order.astype(np.int32), vectors[order])
+
+    def query_vector(self, features):
+        """Map raw user features to a query through query_projection (features are used as-is without one)"""
+        features = np.asarray(features, dtype=np.float32)
+        if self.query_projection is None:
+            return features
+        return features @ self.query_projection[:-1] + self.query_projection[-1]
+
+    def search(self, query, n_candidates=300, nprobe=16):
+        """(item indices, inner products) of the best n_candidates items in the nprobe closest lists"""
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = min(nprobe, self.n_lists)
+
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        segments = [
+            np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in probe
+            if self.list_offsets[i + 1] > self.list_offsets[i]
+        ]
+        if not segments:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        positions = np.concatenate(segments)
+        scores = self.list_vectors[positions] @ query
+
+        n_candidates = min(n_candidates, len(positions))
+        best = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return self.list_items[positions[best]].astype(np.int64), scores[best]
+
+    def save(self, directory, meta):
+        """Persist the index; each array is swapped in atomically and meta.json goes last"""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            self.CENTROIDS_FILE: self.centroids,
+            self.OFFSETS_FILE: self.list_offsets,
+            self.ITEMS_FILE: self.list_items,
+            self.VECTORS_FILE: self.list_vectors,
+        }
+        if self.query_projection is not None:
+            arrays[self.PROJECTION_FILE] = self.query_projection
+        for filename, array in arrays.items():
+            tmp_path = os.path.join(directory, filename + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_path, os.path.join(directory, filename))
+
+        self.meta = dict(meta, n_items=len(self), n_lists=self.n_lists, dims=int(self.centroids.shape[1]))
+        tmp_path = os.path.join(directory, self.META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(directory, self.META_FILE))
+
+    @classmethod
+    def load(cls, directory):
+        """Memory-map a saved index, or return None if there is no complete index in directory"""
+        if not directory:
+            return None
+        try:
+            with open(os.path.join(directory, cls.META_FILE)) as f:
+                meta = json.load(f)
+        except OSError:
+            return None
+
+        projection_path = os.path.join(directory, cls.PROJECTION_FILE)
+        return cls(
+            np.load(os.path.join(directory, cls.CENTROIDS_FILE)),
+            np.load(os.path.join(directory, cls.OFFSETS_FILE)),
+            np.load(os.path.join(directory, cls.ITEMS_FILE), mmap_mode='r'),
+            np.load(os.path.join(directory, cls.VECTORS_FILE), mmap_mode='r'),
+            meta,
+            np.load(projection_path) if os.path.exists(projection_path) else None,
+        )
+
+def fit_query_projection(item_vectors, user_features, user_scores, ridge=1e-2):
+    """
+    Linear map from raw user features to a query q with item_vectors @ q ~ the user's scores
+    NCF scores come from an MLP, not an inner product, so the best query for each sampled
+    user is solved by least squares on their (mean-centred) exact scores, then a ridge
+    regression learns to predict it from the user's embeddings. Returns (feature dims + 1, dims),
+    the last row being the bias.
+    """
+    item_vectors = np.asarray(item_vectors, dtype=np.float64)
+    user_scores = np.asarray(user_scores, dtype=np.float64)
+    user_scores = user_scores - user_scores.mean(axis=1, keepdims=True)
+
+    targets = user_scores @ np.linalg.pinv(item_vectors).T
+    features = np.hstack([np.asarray(user_features, dtype=np.float64), np.ones((len(user_features), 1))])
+
+    gram = features.T @ features + ridge * np.eye(features.shape[1])
+    return np.linalg.solve(gram, features.T @ targets).astype(np.float32)
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _PendingRequest:
+    """One caller's (user, candidates) scoring request waiting for its slice of a batch"""
+
+    __slots__ = ('key', 'user_array', 'movie_array', 'result', 'error', 'done', 'abandoned')
+
+    def __init__(self, key, user_array, movie_array):
+        self.key = key
+        self.user_array = user_array
+        self.movie_array = movie_array
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.abandoned = False
+
+    def __len__(self):
+        return len(self.movie_array)
+
+class InferenceBatcher:
+    """
+    Dynamic micro-batching for model scoring
+    Requests submitted from concurrent threads within a short window are
+    concatenated into one forward pass and each caller gets its own slice back.
+    score_fn(key, user_array, movie_array) is called once per distinct key in a batch,
+    so requests encoded against different model versions are never mixed.
+    """
+
+    def __init__(self, score_fn, window_ms=3, max_batch_size=16384, max_queue_size=256, timeout=1.0):
+        self._score_fn = score_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+
+        self._worker = threading.Thread(target=self._run, name='ncf-inference-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, user_array, movie_array, key=None):
+        """Queue encoded (user, movie) pairs and block until their scores are ready"""
+        request = _PendingRequest(key, np.asarray(user_array), np.asarray(movie_array))
+
+        try:
+            self._queue.put(request, timeout=self.timeout)
+        except queue.Full:
+            raise RuntimeError("NCF inference queue is full")
+
+        if not request.done.wait(self.timeout):
+            # Let the worker skip it if it hasn't been picked up yet
+            request.abandoned = True
+            raise TimeoutError(f"NCF inference timed out after {self.timeout:.3f}s")
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _run(self):
+        """Worker loop: gather requests for up to one window, then score them together"""
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0])
+            deadline = time.monotonic() + self.window
+
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request)
+
+            self._execute(batch)
+
+    def _execute(self, batch):
+        """Run one forward pass per key in the batch and hand each caller its slice"""
+        groups = {}
+        for request in batch:
+            if not request.abandoned:
+                groups.setdefault(id(request.key), []).append(request)
+
+        for group in groups.values():
+            try:
+                scores = self._score_fn(
+                    group[0].key,
+                    np.concatenate([request.user_array for request in group]),
+                    np.concatenate([request.movie_array for request in group])
+                )
+                offset = 0
+                for request in group:
+                    request.result = scores[offset:offset + len(request)]
+                    offset += len(request)
+            except Exception as e:
+                logger.error(f"Batched inference error: {e}")
+                for request in group:
+                    request.error = e
+
+            for request in group:
+                request.done.set()
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import tracemalloc
+import numpy as np
+import joblib
+from django.test.utils import override_settings
+from django.utils import timezone
+from .numpy_engine import NumpyNCFEngine, TOPOLOGY_KEY, export_keras_model, quantize_embeddings
+from .registry import ModelRegistry, get_model_registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_VERSION = 'benchmark'
+
+# Keys that identify one benchmark case when two result files are compared
+CASE_KEYS = ('path', 'catalog_size', 'batch_size', 'threads')
+
+def default_keras_model(n_users, n_movies, gmf_dims=32, mlp_dims=64, hidden=(128, 64, 32)):
+    """Randomly initialised GMF + MLP NCF model, used when no trained model is installed"""
+    import tensorflow as tf
+
+    user_input = tf.keras.Input(shape=(1,), name='user_input')
+    movie_input = tf.keras.Input(shape=(1,), name='movie_input')
+
+    def embed(inp, size, dims, name):
+        return tf.keras.layers.Flatten()(tf.keras.layers.Embedding(size, dims, name=name)(inp))
+
+    gmf = tf.keras.layers.Multiply()([
+        embed(user_input, n_users, gmf_dims, 'user_embedding_gmf'),
+        embed(movie_input, n_movies, gmf_dims, 'movie_embedding_gmf'),
+    ])
+    x = tf.keras.layers.Concatenate()([
+        embed(user_input, n_users, mlp_dims, 'user_embedding_mlp'),
+        embed(movie_input, n_movies, mlp_dims, 'movie_embedding_mlp'),
+    ])
+    for units in hidden:
+        x = tf.keras.layers.Dense(units, activation='relu')(x)
+        x = tf.keras.layers.BatchNormalization()(x)
+    output = tf.keras.layers.Dense(1, activation='sigmoid')(tf.keras.layers.Concatenate()([gmf, x]))
+    return tf.keras.Model([user_input, movie_input], output)
+
+def _resized_keras_model(path, n_users, n_movies):
+    """The architecture of a trained .keras model with resized embeddings and fresh random weights"""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(path)
+    user_name, movie_name = [tensor._keras_history[0].name for tensor in model.inputs]
+
+    def clone_layer(layer):
+        config = layer.get_config()
+        if isinstance(layer, tf.keras.layers.Embedding):
+            inbound = layer._inbound_nodes[0].input_tensors[0]._keras_history[0].name
+            config['input_dim'] = n_users if inbound == user_name else n_movies
+        return layer.__class__.from_config(config)
+
+    return tf.keras.models.clone_model(model, clone_function=clone_layer)
+
+def _resized_numpy_export(path, output, n_users, n_movies, rng):
+    """Copy of an exported .npz topology with resized embeddings and fresh random weights (no TensorFlow)"""
+    engine = NumpyNCFEngine.load(path)
+    user_name, movie_name = engine.inputs[:2]
+
+    weights = {}
+    for spec in engine.layers:
+        name = spec['name']
+        if spec['class'] == 'Embedding':
+            rows = n_users if spec['inbound'][0] == user_name else n_movies
+            dims = engine.weights[f"{name}/embeddings"].shape[1]
+            table = rng.normal(0, 0.05, (rows, dims)).astype(np.float32)
+            for key, array in quantize_embeddings(table, spec.get('dtype', 'float32')).items():
+                weights[f"{name}/{key}"] = array
+            continue
+
+        for key, array in engine.weights.items():
+            if not key.startswith(name + '/'):
+                continue
+            suffix = key.split('/')[-1]
+            if suffix == 'kernel':
+                limit = np.sqrt(6.0 / sum(array.shape[-2:]))
+                weights[key] = rng.uniform(-limit, limit, array.shape).astype(np.float32)
+            elif suffix in ('moving_variance', 'gamma'):
+                weights[key] = np.ones(array.shape, dtype=np.float32)
+            else:
+                weights[key] = np.zeros(array.shape, dtype=np.float32)
+
+    with open(output, 'wb') as f:
+        np.savez(f, **{TOPOLOGY_KEY: np.array(json.dumps(engine.topology))}, **weights)
+
+def build_synthetic_registry(root, n_users, n_movies, backend='keras', seed=0):
+    """
+    Registry under root with one randomly initialised model of the served architecture
+    Encoders map IDs 1..n to indices. These aren't movies in the database, so serve it with
+    NCFModelService.for_registry(registry, filter_catalog=False). The architecture comes
+    from the installed model when there is one (the .npz export for the numpy backend, so
+    TensorFlow isn't needed), otherwise from default_keras_model.
+    """
+    from sklearn.preprocessing import LabelEncoder
+
+    registry = ModelRegistry(root)
+    paths = registry.paths(BENCHMARK_VERSION)
+    os.makedirs(registry.version_dir(BENCHMARK_VERSION), exist_ok=True)
+
+    joblib.dump(LabelEncoder().fit(np.arange(1, n_users + 1)), paths['user_encoder'])
+    joblib.dump(LabelEncoder().fit(np.arange(1, n_movies + 1)), paths['movie_encoder'])
+
+    served = get_model_registry()
+    served_paths = served.paths(served.current_version())
+    rng = np.random.default_rng(seed)
+
+    if backend == 'numpy' and os.path.exists(served_paths['numpy_weights']):
+        _resized_numpy_export(served_paths['numpy_weights'], paths['numpy_weights'], n_users, n_movies, rng)
+    else:
+        if os.path.exists(served_paths['model']):
+            model = _resized_keras_model(served_paths['model'], n_users, n_movies)
+        else:
+            model = default_keras_model(n_users, n_movies)
+        model.save(paths['model'])
+        if backend == 'numpy':
+            export_keras_model(model, paths['numpy_weights'], metadata={'source': 'benchmark'})
+
+    registry.activate(BENCHMARK_VERSION)
+    return registry
+
+def summarize(latencies, elapsed, pairs_per_call):
+    """Latency percentiles (ms) and throughput for one case"""
+    latencies = np.asarray(latencies) * 1000
+    calls = len(latencies)
+    return {
+        'iterations': calls,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 4),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 4),
+        'mean_ms': round(float(latencies.mean()), 4),
+        'calls_per_s': round(calls / elapsed, 2),
+        'pairs_per_s': round(calls * pairs_per_call / elapsed, 1),
+    }
+
+def run_case(fn, iterations, threads=1, warmup=3):
+    """Call fn() `iterations` times on each of `threads` threads; returns (latencies, wall time)"""
+    for _ in range(warmup):
+        fn()
+
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(samples):
+        barrier.wait()
+        for _ in range(iterations):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=worker, args=(samples,)) for samples in latencies]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return [latency for samples in latencies for latency in samples], elapsed
+
+def peak_memory_kb(fn):
+    """Peak Python/NumPy heap allocated by one call (tracemalloc; TensorFlow's own allocator isn't seen)"""
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+def benchmark_service(service, n_users, n_movies, batch_sizes, thread_counts, iterations, seed=0):
+    """Result rows for every path x batch size x thread count on one loaded service"""
+    rng = np.random.default_rng(seed)
+    user_ids = rng.integers(1, n_users + 1, 1024)
+    cursor = iter(range(10 ** 9))
+
+    def next_user():
+        return int(user_ids[next(cursor) % len(user_ids)])
+
+    cases = [('predict_single', 1, lambda: service.predict_single(next_user(), int(rng.integers(1, n_movies + 1))))]
+    for batch_size in sorted({min(size, n_movies) for size in batch_sizes}):
+        candidates = rng.choice(np.arange(1, n_movies + 1), batch_size, replace=False)
+        cases.append(('predict_batch', batch_size, lambda c=candidates: service.predict_batch(next_user(), c)))
+        cases.append((
+            'get_top_recommendations', batch_size,
+            lambda c=candidates: service.get_top_recommendations(next_user(), c, top_k=20)
+        ))
+    cases.append(('recommend', n_movies, lambda: service.recommend(next_user(), top_k=20)))
+
+    # A catalog scan that finds no candidates would time an empty loop
+    if not service.recommend(next_user(), top_k=20):
+        raise RuntimeError(f"recommend scored no candidates over the synthetic catalog of {n_movies} movies")
+
+    results = []
+    for path, batch_size, fn in cases:
+        memory = peak_memory_kb(fn)
+        for threads in thread_counts:
+            latencies, elapsed = run_case(fn, iterations, threads)
+            row = {'path': path, 'catalog_size': n_movies, 'batch_size': batch_size, 'threads': threads}
+            row.update(summarize(latencies, elapsed, batch_size))
+            row['peak_memory_kb'] = memory
+            results.append(row)
+            logger.info(f"{path} catalog={n_movies} batch={batch_size} threads={threads}: p50 {row['p50_ms']} ms")
+    return results
+
+def run_benchmarks(root, backend='keras', catalog_sizes=(1000, 10000), n_users=1000, batch_sizes=(1, 10, 100, 1000),
+                   thread_counts=(1, 4), iterations=200, batching=False, seed=0, progress=None):
+    """Build a synthetic model per catalog size under root and benchmark it; returns the JSON-ready report"""
+    from .ncf_service import NCFModelService
+
+    results = []
+    for n_movies in catalog_sizes:
+        if progress:
+            progress(f"catalog of {n_movies:,} movies")
+        registry = build_synthetic_registry(os.path.join(root, str(n_movies)), n_users, n_movies, backend, seed)
+
+        with override_settings(NCF_BACKEND=backend, NCF_SHARED_ARRAYS=False, NCF_ANN_ENABLED=False,
+                               NCF_BATCHING_ENABLED=batching):
+            service = NCFModelService.for_registry(registry, filter_catalog=False)
+            if service.current_model() is None:
+                raise RuntimeError(f"Synthetic model for {n_movies} movies failed to load")
+            results.extend(
+                benchmark_service(service, n_users, n_movies, batch_sizes, thread_counts, iterations, seed)
+            )
+
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'backend': backend,
+            'batching': batching,
+            'n_users': n_users,
+            'iterations': iterations,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'max_rss_kb': _max_rss_kb(),
+        },
+        'results': results,
+    }
+
+def _max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def compare_results(baseline, current):
+    """[(case, metric, before, after, change), ...] for the latency and throughput of cases in both reports"""
+    def key(row):
+        return tuple(row[name] for name in CASE_KEYS)
+
+    before = {key(row): row for row in baseline['results']}
+    rows = []
+    for row in current['results']:
+        old = before.get(key(row))
+        if old is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms', 'calls_per_s'):
+            change = (row[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            rows.append((key(row), metric, old[metric], row[metric], change))
+    return rows
@@ -0,0 +1,149 @@
+import os
+import json
+import numpy as np
+from scipy import sparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+META_KEY = '__meta__'
+MOVIE_IDS_KEY = 'movie_ids'
+ROWS_PREFIX = 'rows/'
+
+# Relative weight of each content signal when matching a new movie to trained ones
+GENRE_WEIGHT = 1.0
+TAG_WEIGHT = 0.5
+ERA_WEIGHT = 0.5
+
+# New movies compared against the trained catalog per matrix product
+SIMILARITY_BLOCK = 1024
+
+def _normalise_rows(matrix):
+    """Sparse matrix with every non-empty row scaled to unit L2 norm"""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).reshape(-1))
+    return sparse.diags(1.0 / np.maximum(norms, 1e-12)).astype(np.float32) @ matrix
+
+def content_features(movie_ids):
+    """
+    Sparse content vectors (genres, shared tags, release decade) for movie_ids, one CSR row each
+    Each signal is L2-normalised on its own and weighted before the rows are normalised,
+    so the dot product of two rows is a weighted cosine similarity.
+    """
+    from movies.models import Movie, MovieTag
+
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    row_of = {movie_id: row for row, movie_id in enumerate(movie_ids.tolist())}
+
+    genre_pairs = [
+        (row_of[movie_id], genre_id)
+        for movie_id, genre_id in Movie.genres.through.objects.values_list('movie_id', 'genre_id')
+        if movie_id in row_of
+    ]
+    tag_pairs = [
+        (row_of[movie_id], tag)
+        for movie_id, tag in MovieTag.objects.values_list('movie_id', 'tag')
+        if movie_id in row_of
+    ]
+    decade_pairs = [
+        (row_of[movie_id], year // 10)
+        for movie_id, year in Movie.objects.values_list('id', 'release_year')
+        if movie_id in row_of and year
+    ]
+
+    # Tags only help if more than one movie carries them
+    tag_counts = {}
+    for row, tag in tag_pairs:
+        tag_counts[tag] = tag_counts.get(tag, 0) + 1
+    tag_pairs = [(row, tag) for row, tag in tag_pairs if tag_counts[tag] > 1]
+
+    blocks = []
+    for pairs, weight in ((genre_pairs, GENRE_WEIGHT), (tag_pairs, TAG_WEIGHT), (decade_pairs, ERA_WEIGHT)):
+        columns = {value: column for column, value in enumerate(sorted({value for row, value in pairs}))}
+        block = sparse.csr_matrix(
+            (
+                np.ones(len(pairs), dtype=np.float32),
+                ([row for row, value in pairs], [columns[value] for row, value in pairs]),
+            ),
+            shape=(len(movie_ids), len(columns)),
+        )
+        blocks.append(weight * _normalise_rows(block))
+
+    return _normalise_rows(sparse.hstack(blocks, format='csr')).tocsr()
+
+def synthetic_rows(tables, trained_features, new_features, neighbors=50):
+    """
+    Embedding rows for movies the model never saw, one per row of new_features
+    Each new row is the similarity-weighted mean of the trained rows of its `neighbors`
+    most similar trained movies, taken from every table in `tables` ({name: (n_trained, dims)}).
+    Features may be dense or sparse (content_features). Returns (kept, {name: rows}); kept
+    marks new movies with any content overlap.
+    """
+    n_new = new_features.shape[0]
+    neighbors = min(neighbors, trained_features.shape[0])
+    rows = {name: np.zeros((n_new, table.shape[1]), dtype=np.float32) for name, table in tables.items()}
+    kept = np.zeros(n_new, dtype=bool)
+
+    if neighbors <= 0:
+        return kept, rows
+
+    trained_t = trained_features.T
+    for start in range(0, n_new, SIMILARITY_BLOCK):
+        stop = min(start + SIMILARITY_BLOCK, n_new)
+        similarity = new_features[start:stop] @ trained_t
+        if sparse.issparse(similarity):
+            similarity = similarity.toarray()
+
+        nearest = np.argpartition(-similarity, neighbors - 1, axis=1)[:, :neighbors]
+        weights = np.maximum(np.take_along_axis(similarity, nearest, axis=1), 0)
+        totals = weights.sum(axis=1)
+        has_overlap = totals > 1e-6
+        weights = weights / np.maximum(totals, 1e-6)[:, None]
+
+        for name, table in tables.items():
+            # (block, neighbors, dims) gathered once per table, then one weighted sum
+            rows[name][start:stop] = np.einsum('bn,bnd->bd', weights, np.asarray(table)[nearest])
+        kept[start:stop] = has_overlap
+
+    return kept, {name: table[kept] for name, table in rows.items()}
+
+def write_cold_start(path, movie_ids, rows, meta):
+    """Persist cold-start vectors next to a model version (atomic replace)"""
+    arrays = {ROWS_PREFIX + name: np.asarray(table, dtype=np.float32) for name, table in rows.items()}
+    arrays[MOVIE_IDS_KEY] = np.asarray(movie_ids, dtype=np.int64)
+    arrays[META_KEY] = np.array(json.dumps(meta))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_cold_start(path):
+    """(movie_ids, {table name: rows}, meta) from write_cold_start, or None if there is no file"""
+    if not path or not os.path.exists(path):
+        return None
+
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data[META_KEY]))
+        movie_ids = data[MOVIE_IDS_KEY]
+        rows = {key[len(ROWS_PREFIX):]: data[key] for key in data.files if key.startswith(ROWS_PREFIX)}
+    return movie_ids, rows, meta
+
+def extend_keras_model(model, rows, n_trained):
+    """Clone a Keras model with `rows` appended to the named embedding layers"""
+    import tensorflow as tf
+
+    def clone_layer(layer):
+        config = layer.get_config()
+        if layer.name in rows:
+            config['input_dim'] = n_trained + len(rows[layer.name])
+        return layer.__class__.from_config(config)
+
+    extended = tf.keras.models.clone_model(model, clone_function=clone_layer)
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if layer.name in rows:
+            if len(weights[0]) != n_trained:
+                raise ValueError(f"Cold-start vectors were built for {n_trained} movies, {layer.name} has {len(weights[0])}")
+            weights = [np.vstack([weights[0], rows[layer.name]])]
+        extended.get_layer(layer.name).set_weights(weights)
+    return extended
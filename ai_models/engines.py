@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+# Values accepted for settings.RECOMMENDATION_ENGINE
+ENGINES = ('ncf', 'als')
+
+def selected_engine():
+    engine = getattr(settings, 'RECOMMENDATION_ENGINE', 'ncf')
+    return engine if engine in ENGINES else 'ncf'
+
+def get_recommendation_engine():
+    """Collaborative-filtering service behind the hybrid: NCFModelService or ALSModelService"""
+    if selected_engine() == 'als':
+        from .als_service import get_als_service
+        return get_als_service()
+
+    from .ncf_service import get_ncf_service
+    return get_ncf_service()
+
+def served_model_key():
+    """serving_key of the model the selected engine serves in this process (None if none is loaded)
+
+    Cache keys and precomputed results are matched against this rather than the registry's
+    CURRENT pointer, which moves before a background reload has finished.
+    """
+    model = recommendation_engine.current_model()
+    return model.serving_key if model is not None else None
+
+# Resolved lazily on first use, like ncf_service
+recommendation_engine = SimpleLazyObject(get_recommendation_engine)
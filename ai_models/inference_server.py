@@ -0,0 +1,238 @@
+import os
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Wire format (little-endian). Request: header, model version (utf-8), then for OP_SCORE
+# `count` int32 user indices followed by `count` int32 movie indices.
+# Response: header, then `length` payload bytes (float32 scores, JSON or an error message).
+MAGIC = b'NCF1'
+REQUEST_HEADER = struct.Struct('<4sBxHI')     # magic, op, pad, version length, pair count
+RESPONSE_HEADER = struct.Struct('<BI')        # status, payload length
+EMBEDDINGS_HEADER = struct.Struct('<II')      # rows, dims
+
+OP_SCORE = 1
+OP_INFO = 2
+OP_EMBEDDINGS = 3
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_VERSION_MISMATCH = 2
+
+# Upper bound on pairs per request so a bad client can't make the server allocate gigabytes
+MAX_PAIRS = 1 << 22
+
+class InferenceServerError(RuntimeError):
+    """The inference server rejected a request or returned a malformed response"""
+
+class VersionMismatchError(InferenceServerError):
+    """The server serves another model version (or cold-start revision) than the request was encoded for"""
+
+def _recv_exact(sock, size):
+    """Read exactly `size` bytes, raising ConnectionError if the peer closes first"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError("NCF inference connection closed")
+        received += n
+    return bytes(buffer)
+
+class _InferenceHandler(socketserver.BaseRequestHandler):
+    """Serves requests on one persistent client connection until it is closed"""
+
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                header = _recv_exact(sock, REQUEST_HEADER.size)
+            except ConnectionError:
+                return
+
+            magic, op, version_length, count = REQUEST_HEADER.unpack(header)
+            if magic != MAGIC:
+                logger.warning("NCF inference server: bad request magic, dropping connection")
+                return
+            version = _recv_exact(sock, version_length).decode()
+
+            payload = b''
+            if op == OP_SCORE:
+                if count > MAX_PAIRS:
+                    self._reply(STATUS_ERROR, f"Too many pairs ({count} > {MAX_PAIRS})".encode())
+                    return
+                payload = _recv_exact(sock, count * 8)
+
+            try:
+                status, body = STATUS_OK, self.server.dispatch(op, version, count, payload)
+            except VersionMismatchError as e:
+                status, body = STATUS_VERSION_MISMATCH, str(e).encode()
+            except Exception as e:
+                status, body = STATUS_ERROR, str(e).encode()
+            self._reply(status, body)
+
+    def _reply(self, status, body):
+        self.request.sendall(RESPONSE_HEADER.pack(status, len(body)) + body)
+
+class NCFInferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix domain socket server that owns the NCF model
+    One thread per client connection; concurrent requests meet in the service's
+    InferenceBatcher, so scoring still runs as few large forward passes.
+    """
+
+    daemon_threads = True
+    # Web workers open connections in bursts; the default backlog of 5 makes connect() fail with EAGAIN
+    request_queue_size = 128
+
+    def __init__(self, socket_path, service):
+        self.service = service
+        if os.path.exists(socket_path):
+            # Left behind by a server that didn't shut down cleanly
+            os.unlink(socket_path)
+        super().__init__(socket_path, _InferenceHandler)
+        os.chmod(socket_path, 0o660)
+
+    def dispatch(self, op, version, count, payload):
+        """Run one request against the served model and return the response payload"""
+        model = self.service.current_model()
+        if model is None:
+            raise InferenceServerError("No NCF model loaded")
+
+        if op == OP_INFO:
+            return json.dumps({
+                'version': model.version,
+                'serving_key': model.serving_key,
+                'params': int(model.count_params()),
+                'n_movies': len(model.movie_ids),
+                'pid': os.getpid(),
+            }).encode()
+
+        # Indices were encoded by the client against its own model version (and cold-start revision)
+        if version != model.serving_key:
+            raise VersionMismatchError(f"Model version mismatch: server has {model.serving_key}, request is for {version}")
+
+        if op == OP_SCORE:
+            pairs = np.frombuffer(payload, dtype='<i4')
+            scores = self.service._score_pairs(model, pairs[:count], pairs[count:])
+            return np.asarray(scores, dtype='<f4').tobytes()
+
+        if op == OP_EMBEDDINGS:
+            if model.item_embeddings is None:
+                raise InferenceServerError("Model has no item embeddings")
+            embeddings = np.asarray(model.item_embeddings, dtype='<f4')
+            return EMBEDDINGS_HEADER.pack(*embeddings.shape) + embeddings.tobytes()
+
+        raise InferenceServerError(f"Unknown op {op}")
+
+class NCFInferenceClient:
+    """
+    Pooled client for NCFInferenceServer
+    Keeps up to pool_size idle connections for reuse; a thread that finds the pool
+    empty opens a fresh one. Every socket operation is bounded by `timeout`.
+    """
+
+    def __init__(self, socket_path, pool_size=8, timeout=1.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _release(self, sock):
+        try:
+            self._pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def _request(self, op, version='', count=0, payload=b''):
+        """Send one request and return the response payload, raising InferenceServerError on failure"""
+        version = version.encode()
+        message = REQUEST_HEADER.pack(MAGIC, op, len(version), count) + version + payload
+
+        for attempt in range(2):
+            try:
+                sock, reused = self._pool.get_nowait(), True
+            except queue.Empty:
+                sock, reused = self._connect(), False
+
+            try:
+                sock.sendall(message)
+                status, length = RESPONSE_HEADER.unpack(_recv_exact(sock, RESPONSE_HEADER.size))
+                body = _recv_exact(sock, length)
+            except ConnectionError:
+                sock.close()
+                # An idle pooled connection may have been dropped by a server restart: retry once fresh
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                sock.close()
+                raise
+
+            self._release(sock)
+            if status == STATUS_VERSION_MISMATCH:
+                raise VersionMismatchError(body.decode(errors='replace'))
+            if status != STATUS_OK:
+                raise InferenceServerError(body.decode(errors='replace'))
+            return body
+
+    def score(self, version, user_array, movie_array):
+        """Score encoded (user, movie) pairs on the server, returning a flat float32 array"""
+        user_array = np.asarray(user_array, dtype='<i4').reshape(-1)
+        movie_array = np.asarray(movie_array, dtype='<i4').reshape(-1)
+        if len(user_array) != len(movie_array):
+            raise ValueError("user_array and movie_array must have the same length")
+
+        body = self._request(OP_SCORE, version, len(user_array), user_array.tobytes() + movie_array.tobytes())
+        return np.frombuffer(body, dtype='<f4').astype(np.float32)
+
+    def info(self):
+        """{'version', 'serving_key', 'params', 'n_movies', 'pid'} of the model the server is serving"""
+        return json.loads(self._request(OP_INFO))
+
+    def item_embeddings(self, version):
+        """The server's L2-normalised item embedding matrix for `version`"""
+        body = self._request(OP_EMBEDDINGS, version)
+        rows, dims = EMBEDDINGS_HEADER.unpack_from(body)
+        return np.frombuffer(body, dtype='<f4', offset=EMBEDDINGS_HEADER.size).reshape(rows, dims).copy()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_inference_client():
+    """Process-wide client for the socket in settings.NCF_SERVER_SOCKET"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = NCFInferenceClient(
+                    settings.NCF_SERVER_SOCKET,
+                    pool_size=getattr(settings, 'NCF_SERVER_POOL_SIZE', 8),
+                    timeout=getattr(settings, 'NCF_SERVER_TIMEOUT', 1.0),
+                )
+    return _client
@@ -0,0 +1,109 @@
+import sys
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from users.models import User
+from users.model_service import HybridModelService
+
+class Command(BaseCommand):
+    help = 'Compute NCF top-K recommendations for many users in blocks and stream them out as JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=str,
+            default=None,
+            help='Comma-separated user ids'
+        )
+        parser.add_argument(
+            '--user-file',
+            type=str,
+            default=None,
+            help='File with one user id per line'
+        )
+        parser.add_argument(
+            '--all-users',
+            action='store_true',
+            help='Every active user'
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=20,
+            help='Recommendations per user (default: 20)'
+        )
+        parser.add_argument(
+            '--batch-users',
+            type=int,
+            default=64,
+            help='Users scored together per block (default: 64)'
+        )
+        parser.add_argument(
+            '--include-rated',
+            action='store_true',
+            help='Keep movies the user has already rated'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='JSON lines output file (default: stdout)'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = self.get_user_ids(options)
+        if not user_ids:
+            raise CommandError("No users given; pass --users, --user-file or --all-users")
+
+        start = time.time()
+        self.stderr.write(f"📬 Batch NCF recommendations for {len(user_ids):,} users...")
+
+        output = open(options['output'], 'w') if options['output'] else sys.stdout
+        written = empty = 0
+        try:
+            recommendations = HybridModelService.get_ncf_recommendations_batch(
+                user_ids,
+                limit=options['top_k'],
+                exclude_rated=not options['include_rated'],
+                block_users=options['batch_users'],
+            )
+            for user_id, ranked in recommendations:
+                output.write(json.dumps({
+                    'user_id': user_id,
+                    'movie_ids': [movie_id for movie_id, score in ranked],
+                    'scores': [round(score, 6) for movie_id, score in ranked],
+                }) + '\n')
+                written += 1
+                empty += not ranked
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if not written:
+            raise CommandError("NCF model is not loaded")
+
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"✅ {written:,} users in {time.time() - start:.1f}s "
+                f"({empty:,} unknown to the model or without results)"
+            )
+        )
+
+    def get_user_ids(self, options):
+        if options['all_users']:
+            return list(User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+
+        values = []
+        if options['users']:
+            values.extend(options['users'].split(','))
+        if options['user_file']:
+            try:
+                with open(options['user_file']) as f:
+                    values.extend(f.read().split())
+            except OSError as e:
+                raise CommandError(f"Could not read {options['user_file']}: {e}")
+
+        try:
+            return list(dict.fromkeys(int(value) for value in values if value.strip()))
+        except ValueError as e:
+            raise CommandError(f"Invalid user id: {e}")
@@ -0,0 +1,117 @@
+import json
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ai_models.benchmark import run_benchmarks, compare_results
+
+def _int_list(value):
+    return [int(part) for part in value.split(',') if part]
+
+class Command(BaseCommand):
+    help = 'Benchmark NCF scoring paths on a synthetic model of the served architecture'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=['keras', 'numpy'],
+            default=None,
+            help='Backend to benchmark (default: settings.NCF_BACKEND)'
+        )
+        parser.add_argument(
+            '--catalog-sizes',
+            type=_int_list,
+            default=[1000, 10000],
+            help='Comma-separated catalog sizes, one synthetic model each (default: 1000,10000)'
+        )
+        parser.add_argument(
+            '--batch-sizes',
+            type=_int_list,
+            default=[1, 10, 100, 1000],
+            help='Comma-separated candidate counts for predict_batch / get_top_recommendations (default: 1,10,100,1000)'
+        )
+        parser.add_argument(
+            '--threads',
+            type=_int_list,
+            default=[1, 4],
+            help='Comma-separated numbers of concurrent calling threads (default: 1,4)'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=1000,
+            help='Users in the synthetic model (default: 1000)'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Calls per thread per case (default: 200)'
+        )
+        parser.add_argument(
+            '--batching',
+            action='store_true',
+            help='Run with cross-request micro-batching enabled'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='Write the results as JSON to this path'
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            default=None,
+            metavar='BASELINE_JSON',
+            help='Print the change against an earlier --output file'
+        )
+
+    def handle(self, *args, **options):
+        backend = options['backend'] or getattr(settings, 'NCF_BACKEND', 'keras')
+        if backend not in ('keras', 'numpy'):
+            raise CommandError(f"Backend {backend} runs no model in this process; pass --backend keras or numpy")
+
+        self.stdout.write(f"⏱️ Benchmarking NCF ({backend} backend)...")
+        with tempfile.TemporaryDirectory(prefix='ncf-benchmark-') as root:
+            report = run_benchmarks(
+                root,
+                backend=backend,
+                catalog_sizes=options['catalog_sizes'],
+                n_users=options['users'],
+                batch_sizes=options['batch_sizes'],
+                thread_counts=options['threads'],
+                iterations=options['iterations'],
+                batching=options['batching'],
+                progress=lambda message: self.stdout.write(f"   Building {message}..."),
+            )
+
+        self.stdout.write(
+            f"\n   {'path':<24} {'catalog':>8} {'batch':>6} {'thr':>4} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'calls/s':>10} {'pairs/s':>12} {'peak KB':>9}"
+        )
+        for row in report['results']:
+            self.stdout.write(
+                f"   {row['path']:<24} {row['catalog_size']:>8} {row['batch_size']:>6} {row['threads']:>4} "
+                f"{row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f} "
+                f"{row['calls_per_s']:>10.1f} {row['pairs_per_s']:>12.0f} {row['peak_memory_kb']:>9.1f}"
+            )
+
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read baseline {options['compare']}: {e}")
+
+            self.stdout.write(f"\n📊 Change against {options['compare']}:")
+            for case, metric, before, after, change in compare_results(baseline, report):
+                path, catalog_size, batch_size, threads = case
+                self.stdout.write(
+                    f"   {path:<24} {catalog_size:>8} {batch_size:>6} {threads:>4} {metric:<12} "
+                    f"{before:>10.3f} → {after:>10.3f} ({change:+.1%})"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Results written to {options['output']}"))
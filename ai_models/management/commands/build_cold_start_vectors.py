@@ -0,0 +1,96 @@
+import os
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ai_models.cold_start import content_features, synthetic_rows, write_cold_start
+from ai_models.registry import get_model_registry
+from ai_models.shared_arrays import prune_shared_stores, shared_store_dir
+from movies.models import Movie
+
+class Command(BaseCommand):
+    help = (
+        'Build NCF vectors for movies added after training (e.g. by populate_popular_movies) '
+        'from trained movies with similar genres, tags and release era'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model-version',
+            type=str,
+            default=None,
+            help='Registry version to build for (default: the CURRENT version)'
+        )
+        parser.add_argument(
+            '--neighbors',
+            type=int,
+            default=None,
+            help='Trained movies averaged into each vector (default: settings.NCF_COLD_START_NEIGHBORS)'
+        )
+
+    def handle(self, *args, **options):
+        start = time.time()
+        registry = get_model_registry()
+        version = options['model_version'] or registry.current_version()
+        paths = registry.paths(version)
+        neighbors = options['neighbors'] or getattr(settings, 'NCF_COLD_START_NEIGHBORS', 50)
+
+        # The embedding tables have to be read locally, even where web workers use the inference server
+        if getattr(settings, 'NCF_BACKEND', 'keras') == 'remote':
+            settings.NCF_BACKEND = 'keras'
+
+        from ai_models.ncf_service import LoadedNCFModel
+
+        self.stdout.write(f"🧊 Building cold-start vectors for NCF model {version}...")
+        try:
+            model = LoadedNCFModel(version, paths)
+        except Exception as e:
+            raise CommandError(f"Could not load NCF model {version}: {e}")
+
+        # Only trained rows are used as sources; previously built vectors are replaced
+        n_trained = model.n_trained_movies
+        tables = {name: np.asarray(table[:n_trained]) for name, table in model.movie_embedding_tables()}
+        if not tables:
+            raise CommandError("Model has no movie embedding layer")
+
+        trained_ids = np.asarray(model.movie_ids[:n_trained], dtype=np.int64)
+        catalog_ids = np.fromiter(Movie.objects.values_list('id', flat=True), dtype=np.int64)
+        new_ids = catalog_ids[~np.isin(catalog_ids, trained_ids)]
+
+        if not len(new_ids):
+            if os.path.exists(paths['cold_start']):
+                os.remove(paths['cold_start'])
+            self.stdout.write(self.style.SUCCESS("✅ Every catalog movie is known to the model, nothing to build"))
+            return
+
+        # Workers keep serving from the arrays derived from the current files until they reload
+        version_dir = registry.version_dir(version)
+        served_store = shared_store_dir(version_dir, paths.values())
+
+        features = content_features(np.concatenate([trained_ids, new_ids]))
+        kept, rows = synthetic_rows(tables, features[:n_trained], features[n_trained:], neighbors)
+
+        write_cold_start(paths['cold_start'], new_ids[kept], rows, meta={
+            'model_version': version,
+            'n_trained_movies': int(n_trained),
+            'neighbors': neighbors,
+            'tables': sorted(rows),
+            'built_at': timezone.now().isoformat(),
+        })
+
+        # Derived arrays are keyed by source fingerprint, so the new vectors get a fresh store;
+        # only stores that neither the served files nor the new ones map to are removed
+        prune_shared_stores([version_dir], [served_store, shared_store_dir(version_dir, paths.values())])
+
+        skipped = int((~kept).sum())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Built vectors for {int(kept.sum())} new movies from {n_trained} trained ones "
+                f"in {time.time() - start:.1f}s → {paths['cold_start']}"
+            )
+        )
+        if skipped:
+            self.stdout.write(
+                self.style.WARNING(f"⚠️ {skipped} movies share no genre, tag or era with the trained catalog")
+            )
@@ -0,0 +1,159 @@
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ai_models.ann_index import IVFIndex, fit_query_projection
+from ai_models.registry import get_model_registry
+
+class Command(BaseCommand):
+    help = 'Build the IVF retrieval index over NCF item embeddings and report recall@k against exact scoring'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model-version',
+            type=str,
+            default=None,
+            help='Registry version to index (default: the CURRENT version)'
+        )
+        parser.add_argument(
+            '--lists',
+            type=int,
+            default=None,
+            help='Number of inverted lists (default: ~sqrt(catalog size))'
+        )
+        parser.add_argument(
+            '--fit-users',
+            type=int,
+            default=2000,
+            help='Users whose exact scores the query projection is fitted on (default: 2000)'
+        )
+        parser.add_argument(
+            '--sample-users',
+            type=int,
+            default=200,
+            help='Held-out users used for the recall check (default: 200)'
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=20,
+            help='k for recall@k (default: 20)'
+        )
+        parser.add_argument(
+            '--candidates',
+            type=int,
+            default=None,
+            help='Candidates fully scored per query in the recall check (default: settings.NCF_ANN_CANDIDATES)'
+        )
+        parser.add_argument(
+            '--nprobe',
+            type=str,
+            default='1,2,4,8,16',
+            help='Comma-separated nprobe values to evaluate (default: 1,2,4,8,16)'
+        )
+        parser.add_argument(
+            '--min-recall',
+            type=float,
+            default=0.9,
+            help='Refuse to save an index whose recall@k at the served NCF_ANN_NPROBE is below this (default: 0.9)'
+        )
+
+    def handle(self, *args, **options):
+        registry = get_model_registry()
+        version = options['model_version'] or registry.current_version()
+        paths = registry.paths(version)
+
+        if getattr(settings, 'NCF_BACKEND', 'keras') == 'remote':
+            settings.NCF_BACKEND = 'keras'
+
+        from ai_models.ncf_service import LoadedNCFModel, UNKNOWN_INDEX, top_k_indices
+
+        try:
+            model = LoadedNCFModel(version, paths, revision=registry.revision(version))
+        except Exception as e:
+            raise CommandError(f"Could not load NCF model {version}: {e}")
+        if model.item_embeddings is None:
+            raise CommandError("Model has no movie embeddings to index")
+        if model.user_query_layers is None:
+            raise CommandError("Model has no user embedding layer to build retrieval queries from")
+
+        start = time.time()
+        self.stdout.write(f"🗂️ Clustering {len(model.movie_ids):,} movie embeddings ({version})...")
+        index = IVFIndex.build(model.item_embeddings, n_lists=options['lists'])
+        self.stdout.write(f"   {index.n_lists} lists built in {time.time() - start:.1f}s")
+
+        # Disjoint users for fitting the query projection and for measuring recall
+        n_users = int((model.user_lookup != UNKNOWN_INDEX).sum())
+        rng = np.random.default_rng(0)
+        users = rng.permutation(n_users)
+        n_eval = min(options['sample_users'], max(1, n_users // 4))
+        eval_users, fit_users = users[:n_eval], users[n_eval:n_eval + options['fit_users']]
+
+        k = min(options['k'], len(model.movie_ids))
+        n_candidates = max(options['candidates'] or getattr(settings, 'NCF_ANN_CANDIDATES', 300), k)
+        all_movies = np.arange(len(model.movie_ids))
+
+        def exact_scores(block_users):
+            # Keep each forward pass around a million pairs
+            block = max(1, 1_000_000 // len(all_movies))
+            return np.vstack([
+                model.score_matrix(block_users[i:i + block], all_movies)
+                for i in range(0, len(block_users), block)
+            ])
+
+        self.stdout.write(f"   Fitting the query projection on {len(fit_users)} users...")
+        index.query_projection = fit_query_projection(
+            model.item_embeddings, model.user_features(fit_users), exact_scores(fit_users)
+        )
+
+        # Recall of the served pipeline: retrieve, fully score the candidates, keep the top k
+        exact = [set(top_k_indices(row, k).tolist()) for row in exact_scores(eval_users)]
+        queries = index.query_vector(model.user_features(eval_users))
+        users = eval_users
+
+        served_nprobe = getattr(settings, 'NCF_ANN_NPROBE', 16)
+        nprobes = sorted({int(value) for value in options['nprobe'].split(',')} | {served_nprobe})
+
+        self.stdout.write(f"   Recall@{k} over {len(users)} users ({n_candidates} candidates fully scored):")
+        recall_at = {}
+        for nprobe in nprobes:
+            recalls = []
+            search_time = 0.0
+            for user, query, expected in zip(users, queries, exact):
+                started = time.perf_counter()
+                candidates, _ = index.search(query, n_candidates, nprobe)
+                search_time += time.perf_counter() - started
+
+                scores = model.score_matrix([user], candidates)[0]
+                found = set(candidates[top_k_indices(scores, k)].tolist())
+                recalls.append(len(found & expected) / k)
+
+            recall_at[nprobe] = float(np.mean(recalls))
+            marker = '  (served)' if nprobe == served_nprobe else ''
+            self.stdout.write(
+                f"     nprobe={nprobe:<3} recall {recall_at[nprobe]:.3f}  "
+                f"search {search_time / len(users) * 1000:.3f} ms/query{marker}"
+            )
+
+        # Workers switch to a saved index on their own, so a poor one must never land
+        if recall_at[served_nprobe] < options['min_recall']:
+            raise CommandError(
+                f"Recall@{k} at NCF_ANN_NPROBE={served_nprobe} is {recall_at[served_nprobe]:.3f} < "
+                f"{options['min_recall']}; index not saved (raise NCF_ANN_NPROBE, NCF_ANN_CANDIDATES or --lists)"
+            )
+
+        index.save(paths['ann_index'], meta={
+            'model_version': version,
+            'serving_key': model.serving_key,
+            'built_at': timezone.now().isoformat(),
+            'recall_at_k': recall_at[served_nprobe],
+            'k': k,
+            'nprobe': served_nprobe,
+        })
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Saved index → {paths['ann_index']} - running workers swap it in "
+                f"(serving with NCF_ANN_NPROBE={getattr(settings, 'NCF_ANN_NPROBE', 16)})"
+            )
+        )
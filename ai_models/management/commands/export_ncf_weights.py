@@ -0,0 +1,187 @@
+import os
+import json
+import numpy as np
+import joblib
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ai_models.numpy_engine import NumpyNCFEngine, export_keras_model, FORMAT_VERSION, EMBEDDING_DTYPES
+from ai_models.registry import get_model_registry
+
+class Command(BaseCommand):
+    help = 'Export the Keras NCF model to the NumPy engine format and verify it reproduces the model'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model-version',
+            type=str,
+            default=None,
+            help='Registry version to export (default: the CURRENT version)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='Output .npz path (default: the version\'s max_performance_ncf.npz)'
+        )
+        parser.add_argument(
+            '--verify-samples',
+            type=int,
+            default=20000,
+            help='Random (user, movie) pairs compared against Keras (default: 20000)'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=1e-4,
+            help='Maximum allowed absolute difference from the Keras output for float32 exports (default: 1e-4)'
+        )
+        parser.add_argument(
+            '--embedding-dtype',
+            choices=EMBEDDING_DTYPES,
+            default='float32',
+            help='Storage type for the user/movie embedding tables (default: float32)'
+        )
+        parser.add_argument(
+            '--report-users',
+            type=int,
+            default=200,
+            help='Users whose full-catalog top-k is compared against Keras (default: 200)'
+        )
+        parser.add_argument(
+            '--report-k',
+            type=int,
+            default=20,
+            help='k for the top-k overlap report (default: 20)'
+        )
+        parser.add_argument(
+            '--min-topk-overlap',
+            type=float,
+            default=0.9,
+            help='Reject a reduced-precision export whose mean top-k overlap is below this (default: 0.9)'
+        )
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        registry = get_model_registry()
+        version = options['model_version'] or registry.current_version()
+        paths = registry.paths(version)
+
+        output = options['output'] or paths['numpy_weights']
+        tmp_output = output + '.tmp'
+
+        self.stdout.write(f"📦 Exporting {paths['model']} ({version})...")
+        model = tf.keras.models.load_model(paths['model'])
+        n_users = len(joblib.load(paths['user_encoder']).classes_)
+        n_movies = len(joblib.load(paths['movie_encoder']).classes_)
+
+        embedding_dtype = options['embedding_dtype']
+        try:
+            export_keras_model(model, tmp_output, metadata={
+                'source': os.path.basename(paths['model']),
+                'model_version': version,
+                'exported_at': timezone.now().isoformat(),
+                'n_users': n_users,
+                'n_movies': n_movies,
+                'embedding_dtype': embedding_dtype,
+            }, embedding_dtype=embedding_dtype)
+        except ValueError as e:
+            raise CommandError(f"Model cannot be exported: {e}")
+
+        # Verify against Keras before the export replaces the served file
+        engine = NumpyNCFEngine.load(tmp_output)
+        rng = np.random.default_rng(0)
+        samples = options['verify_samples']
+        user_array = rng.integers(0, n_users, samples).astype(np.int32)
+        movie_array = rng.integers(0, n_movies, samples).astype(np.int32)
+
+        def keras_predict(user_array, movie_array):
+            inputs = [
+                array.astype(tensor.dtype).reshape((-1,) + tuple(tensor.shape[1:]))
+                for array, tensor in zip((user_array, movie_array), model.inputs)
+            ]
+            return np.asarray(model(inputs, training=False)).reshape(-1)
+
+        expected = keras_predict(user_array, movie_array)
+        actual = engine.predict(user_array, movie_array)
+        errors = expected - actual
+        max_error = float(np.max(np.abs(errors)))
+        rmse = float(np.sqrt(np.mean(errors ** 2)))
+
+        self.stdout.write(
+            f"   Verified {samples:,} pairs: max |keras - numpy| = {max_error:.2e}, RMSE = {rmse:.2e}"
+        )
+
+        if embedding_dtype == 'float32':
+            if max_error > options['tolerance']:
+                os.remove(tmp_output)
+                raise CommandError(
+                    f"NumPy engine does not reproduce the Keras model within tolerance ({options['tolerance']:.0e})"
+                )
+        else:
+            report = self.precision_report(
+                keras_predict, engine, n_users, n_movies, rng, options['report_users'], options['report_k']
+            )
+            report.update({
+                'model_version': version,
+                'embedding_dtype': embedding_dtype,
+                'verify_samples': samples,
+                'rmse': rmse,
+                'max_abs_error': max_error,
+            })
+            report_path = os.path.splitext(output)[0] + '.report.json'
+            with open(report_path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+            self.stdout.write(
+                f"   Embedding tables: {report['embedding_mb_float32']:.2f} MB float32 → "
+                f"{report['embedding_mb']:.2f} MB {embedding_dtype}"
+            )
+            self.stdout.write(
+                f"   Top-{report['k']} overlap over {report['users']} users: mean {report['topk_overlap_mean']:.3f}, "
+                f"min {report['topk_overlap_min']:.3f} (report → {report_path})"
+            )
+            if report['topk_overlap_mean'] < options['min_topk_overlap']:
+                os.remove(tmp_output)
+                raise CommandError(
+                    f"{embedding_dtype} embeddings change the ranking too much "
+                    f"(top-{report['k']} overlap {report['topk_overlap_mean']:.3f} < {options['min_topk_overlap']})"
+                )
+
+        os.replace(tmp_output, output)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Exported format v{FORMAT_VERSION} ({engine.count_params():,} parameters) → {output}"
+            )
+        )
+
+    def precision_report(self, keras_predict, engine, n_users, n_movies, rng, n_report_users, k):
+        """Compare each sampled user's full-catalog top-k between Keras and the reduced-precision engine"""
+        users = rng.choice(n_users, size=min(n_report_users, n_users), replace=False).astype(np.int32)
+        movies = np.arange(n_movies, dtype=np.int32)
+        k = min(k, n_movies)
+
+        # Score a block of users at a time to keep the pair arrays around a million entries
+        block = max(1, 1_000_000 // max(n_movies, 1))
+        overlaps = []
+        for start in range(0, len(users), block):
+            block_users = users[start:start + block]
+            user_array = np.repeat(block_users, n_movies)
+            movie_array = np.tile(movies, len(block_users))
+
+            expected = keras_predict(user_array, movie_array).reshape(len(block_users), n_movies)
+            actual = engine.predict(user_array, movie_array).reshape(len(block_users), n_movies)
+            for expected_row, actual_row in zip(expected, actual):
+                expected_top = np.argpartition(-expected_row, k - 1)[:k]
+                actual_top = np.argpartition(-actual_row, k - 1)[:k]
+                overlaps.append(len(np.intersect1d(expected_top, actual_top)) / k)
+
+        float32_bytes = sum(table.nbytes for name, table in engine.embedding_tables())
+        return {
+            'k': k,
+            'users': len(users),
+            'topk_overlap_mean': float(np.mean(overlaps)),
+            'topk_overlap_min': float(np.min(overlaps)),
+            'embedding_mb_float32': float32_bytes / 2**20,
+            'embedding_mb': engine.embedding_nbytes() / 2**20,
+        }
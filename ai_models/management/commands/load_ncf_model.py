@@ -1,19 +1,53 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from ai_models.ncf_service import NCFModelService
+from ai_models.registry import get_model_registry
 
 class Command(BaseCommand):
     help = 'Load and verify NCF model'
     
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--activate',
+            type=str,
+            metavar='VERSION',
+            help='Point the registry CURRENT pointer at this installed version before loading'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List installed model versions'
+        )
+    
     def handle(self, *args, **options):
-        self.stdout.write("🚀 Loading Maximum Performance NCF model...")
+        registry = get_model_registry()
+        
+        if options['list']:
+            current = registry.current_version()
+            for version in registry.list_versions():
+                marker = '*' if version == current else ' '
+                self.stdout.write(f" {marker} {version}")
+            return
+        
+        if options['activate']:
+            try:
+                registry.activate(options['activate'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Activated version {options['activate']} - running workers will swap it in")
+            )
+        
+        self.stdout.write(f"🚀 Loading Maximum Performance NCF model ({registry.current_version()})...")
         
         service = NCFModelService()
+        model = service.current_model()
         
-        if service.is_model_loaded():
+        if model is not None:
             self.stdout.write(
                 self.style.SUCCESS("✅ NCF model loaded successfully!")
             )
-            self.stdout.write(f"   Model parameters: {service._model.count_params():,}")
+            self.stdout.write(f"   Version: {model.version}")
+            self.stdout.write(f"   Model parameters: {model.count_params():,}")
         else:
             self.stdout.write(
                 self.style.ERROR("❌ Failed to load NCF model")
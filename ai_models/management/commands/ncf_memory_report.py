@@ -0,0 +1,52 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from ai_models.memory import process_memory
+from ai_models.registry import get_model_registry
+
+class Command(BaseCommand):
+    help = 'Report resident (RSS) and proportional (PSS) memory of NCF serving processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'pids',
+            nargs='*',
+            type=int,
+            help='Worker PIDs to inspect (default: load the model in this process and report it)'
+        )
+
+    def handle(self, *args, **options):
+        registry = get_model_registry()
+        shared_prefix = os.path.join(registry.version_dir(registry.current_version()), 'shared')
+
+        pids = options['pids']
+        if not pids:
+            from ai_models.ncf_service import NCFModelService
+
+            if NCFModelService().current_model() is None:
+                raise CommandError("Failed to load NCF model")
+            pids = ['self']
+
+        self.stdout.write(f"📊 NCF memory by process (shared arrays under {shared_prefix})")
+        self.stdout.write(f"   {'PID':>8} {'RSS MB':>10} {'PSS MB':>10} {'mapped MB':>10} {'mapped RSS':>11} {'mapped PSS':>11}")
+
+        totals = {'rss_kb': 0, 'pss_kb': 0}
+        for pid in pids:
+            report = process_memory(pid, shared_prefix=shared_prefix)
+            if report is None:
+                self.stdout.write(self.style.WARNING(f"⚠️ No /proc/{pid}/smaps (process gone or not Linux)"))
+                continue
+
+            totals['rss_kb'] += report['rss_kb']
+            totals['pss_kb'] += report['pss_kb']
+            self.stdout.write(
+                f"   {report['pid']:>8} {report['rss_kb'] / 1024:>10.1f} {report['pss_kb'] / 1024:>10.1f} "
+                f"{report['mapped_size_kb'] / 1024:>10.1f} {report['mapped_rss_kb'] / 1024:>11.1f} "
+                f"{report['mapped_pss_kb'] / 1024:>11.1f}"
+            )
+
+        # Summed RSS double-counts shared pages; summed PSS is what the host actually pays
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Total RSS {totals['rss_kb'] / 1024:.1f} MB, total PSS {totals['pss_kb'] / 1024:.1f} MB"
+            )
+        )
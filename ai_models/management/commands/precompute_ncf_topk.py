@@ -0,0 +1,124 @@
+import time
+import numpy as np
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ai_models.ncf_service import NCFModelService, UNKNOWN_INDEX
+from ai_models.sharded_scoring import ShardedScorer, score_top_k
+from ai_models.topk_store import TopKStore, PAD_MOVIE_ID
+from movies.models import Movie
+from users.models import User, Rating
+
+class Command(BaseCommand):
+    help = 'Precompute per-user NCF top-K recommendations into the on-disk serving store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=100,
+            help='Recommendations stored per user (default: 100)'
+        )
+        parser.add_argument(
+            '--batch-users',
+            type=int,
+            default=64,
+            help='Users scored per forward pass (default: 64)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='Store directory (default: settings.NCF_TOPK_STORE_DIR)'
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Worker processes the catalog is sharded across (default: 1, score in this process)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🧮 Precomputing NCF top-K recommendations...")
+        start = time.time()
+
+        # Pin one model version for the whole run, even if a newer one is activated meanwhile
+        model = NCFModelService().current_model()
+        if model is None:
+            raise CommandError("NCF model is not loaded")
+
+        output = options['output'] or settings.NCF_TOPK_STORE_DIR
+        top_k = options['top_k']
+
+        # Catalog: every movie the model can score
+        movie_ids = np.fromiter(Movie.objects.values_list('id', flat=True), dtype=np.int64)
+        movie_encoded = model.encode_movie_ids(movie_ids)
+        encodable = movie_encoded != UNKNOWN_INDEX
+        movie_ids, movie_encoded = movie_ids[encodable], movie_encoded[encodable]
+        column_of = {movie_id: column for column, movie_id in enumerate(movie_ids.tolist())}
+
+        # Users the model knows
+        user_ids = np.fromiter(User.objects.values_list('id', flat=True), dtype=np.int64)
+        user_encoded = model.encode_user_ids(user_ids)
+        known = user_encoded != UNKNOWN_INDEX
+        user_ids, user_encoded = user_ids[known], user_encoded[known]
+
+        if not len(movie_ids) or not len(user_ids):
+            raise CommandError("No encodable users or movies to score")
+
+        # Already-rated movies are excluded, matching get_ncf_recommendations(exclude_rated=True)
+        rated_columns = defaultdict(list)
+        for user_id, movie_id in Rating.objects.values_list('user_id', 'movie_id').iterator():
+            column = column_of.get(movie_id)
+            if column is not None:
+                rated_columns[user_id].append(column)
+
+        stored_k = min(top_k, len(movie_ids))
+        all_movie_ids = np.full((len(user_ids), stored_k), PAD_MOVIE_ID, dtype=np.int64)
+        all_scores = np.zeros((len(user_ids), stored_k), dtype=np.float32)
+
+        scorer = None
+        if options['processes'] > 1:
+            try:
+                scorer = ShardedScorer(model, options['processes'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"   Sharding {len(movie_ids):,} movies across {options['processes']} processes")
+
+        batch_users = options['batch_users']
+        try:
+            for block_start in range(0, len(user_ids), batch_users):
+                block = slice(block_start, block_start + batch_users)
+                excluded = [
+                    movie_encoded[rated_columns.get(user_id, [])] for user_id in user_ids[block].tolist()
+                ]
+                if scorer is not None:
+                    top_indices, top_scores = scorer.top_k(user_encoded[block], stored_k, movie_encoded, excluded)
+                else:
+                    # Passes of at most PAIRS_PER_PASS pairs with a running top-k, so memory
+                    # doesn't grow with the catalog
+                    top_indices, top_scores = score_top_k(model, user_encoded[block], movie_encoded, stored_k, excluded)
+                valid = np.isfinite(top_scores)
+
+                all_movie_ids[block] = np.where(valid, model.movie_ids[top_indices], PAD_MOVIE_ID)
+                all_scores[block] = np.where(valid, top_scores, 0.0)
+        finally:
+            if scorer is not None:
+                scorer.close()
+
+        TopKStore.write(output, user_ids, all_movie_ids, all_scores, {
+            'model_version': model.version,
+            'serving_key': model.serving_key,
+            'top_k': stored_k,
+            'n_users': int(len(user_ids)),
+            'n_movies': int(len(movie_ids)),
+            'created_at': timezone.now().isoformat(),
+        })
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Stored top-{stored_k} ({model.version}) for {len(user_ids)} users over {len(movie_ids)} movies "
+                f"in {time.time() - start:.1f}s → {output}"
+            )
+        )
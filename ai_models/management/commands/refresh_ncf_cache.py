@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.core.cache import cache
 from users.models import User
+from users.model_service import HybridModelService
 
 class Command(BaseCommand):
     help = 'Refresh NCF recommendation caches'
@@ -8,17 +9,16 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write("♻️ Refreshing NCF recommendation caches...")
         
-        # Clear all NCF-related caches
-        cache_patterns = ['ncf_recommendations_*', 'hybrid_recommendations_*']
-        
+        # Clear all NCF-related caches for the current model version
+        # (entries from older versions are keyed differently and simply expire)
         # Note: This is simplified - in production use pattern-based deletion
         user_count = User.objects.count()
         cleared = 0
         
         for user in User.objects.all():
             for limit in [10, 20, 50]:
-                cache.delete(f"ncf_recommendations_{user.id}_{limit}")
-                cache.delete(f"hybrid_recommendations_{user.id}_{limit}")
+                cache.delete(HybridModelService.ncf_cache_key(user.id, limit))
+                cache.delete(HybridModelService.hybrid_cache_key(user.id, limit))
                 cleared += 2
         
         self.stdout.write(
@@ -0,0 +1,60 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = 'Run the NCF inference server that web workers with NCF_BACKEND=remote score against'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            type=str,
+            default=None,
+            help='Unix socket path to listen on (default: settings.NCF_SERVER_SOCKET)'
+        )
+        parser.add_argument(
+            '--backend',
+            choices=['keras', 'numpy'],
+            default=None,
+            help='Backend the server runs the model with (default: settings.NCF_BACKEND, or keras)'
+        )
+        parser.add_argument(
+            '--no-batching',
+            action='store_true',
+            help='Score each request on its own instead of micro-batching concurrent requests'
+        )
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or settings.NCF_SERVER_SOCKET
+
+        # The server process is the one place the model actually runs
+        backend = options['backend'] or getattr(settings, 'NCF_BACKEND', 'keras')
+        settings.NCF_BACKEND = 'keras' if backend == 'remote' else backend
+        settings.NCF_BATCHING_ENABLED = not options['no_batching']
+
+        from ai_models.ncf_service import NCFModelService
+        from ai_models.inference_server import NCFInferenceServer
+
+        self.stdout.write(f"🚀 Loading NCF model ({settings.NCF_BACKEND} backend)...")
+        service = NCFModelService()
+        model = service.current_model()
+        if model is None:
+            raise CommandError("Failed to load NCF model")
+
+        try:
+            server = NCFInferenceServer(socket_path, service)
+        except OSError as e:
+            raise CommandError(f"Could not listen on {socket_path}: {e}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Serving NCF model {model.version} on {socket_path} (pid {os.getpid()})")
+        )
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("🛑 Shutting down NCF inference server")
+        finally:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
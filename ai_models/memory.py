@@ -0,0 +1,54 @@
+import os
+
+def process_memory(pid='self', shared_prefix=None):
+    """
+    Resident memory of one process from /proc/<pid>/smaps (Linux only, None elsewhere)
+
+    rss_kb counts every resident page the process touches, so pages shared with other
+    workers are counted once per process. pss_kb divides each shared page by the number
+    of processes mapping it, so summing pss_kb across workers gives the real footprint.
+    The mapped_* figures cover only file mappings under shared_prefix.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    report = {
+        'pid': os.getpid() if pid == 'self' else int(pid),
+        'rss_kb': 0,
+        'pss_kb': 0,
+        'mapped_size_kb': 0,
+        'mapped_rss_kb': 0,
+        'mapped_pss_kb': 0,
+    }
+    in_shared = False
+    if shared_prefix:
+        # smaps lists resolved paths, so a symlinked model directory would never match
+        shared_prefix = os.path.realpath(shared_prefix)
+
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+
+        if not fields[0].endswith(':'):
+            # Mapping header: "start-end perms offset dev inode [path]"
+            path = fields[5] if len(fields) > 5 else ''
+            in_shared = bool(shared_prefix) and path.startswith(shared_prefix)
+            continue
+
+        key = fields[0][:-1]
+        if key == 'Rss':
+            report['rss_kb'] += int(fields[1])
+            if in_shared:
+                report['mapped_rss_kb'] += int(fields[1])
+        elif key == 'Pss':
+            report['pss_kb'] += int(fields[1])
+            if in_shared:
+                report['mapped_pss_kb'] += int(fields[1])
+        elif key == 'Size' and in_shared:
+            report['mapped_size_kb'] += int(fields[1])
+
+    return report
@@ -1,85 +1,573 @@
 import os
+import time
+import threading
 import numpy as np
-import tensorflow as tf
 import joblib
+from concurrent.futures.process import BrokenProcessPool
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from .batching import InferenceBatcher
+from .numpy_engine import NumpyNCFEngine
+from .inference_server import get_inference_client, VersionMismatchError
+from .cold_start import load_cold_start, extend_keras_model
+from .ann_index import IVFIndex
+from .sharded_scoring import get_sharded_scorer, discard_sharded_scorer, score_top_k
+from .registry import get_model_registry, LEGACY_VERSION
+from .shared_arrays import get_shared_store, prune_shared_stores
+from .memory import process_memory
 from django.core.cache import cache
 from django.apps import apps
 import logging
 
 logger = logging.getLogger(__name__)
 
+# TensorFlow is imported on first model load, see _import_tensorflow()
+tf = None
+
+# Sentinel stored in the ID lookup tables for IDs the encoders have never seen
+UNKNOWN_INDEX = -1
+
+def _import_tensorflow():
+    """Import TensorFlow on first use so processes that never recommend don't pay for it"""
+    global tf
+    if tf is None:
+        import tensorflow
+        tf = tensorflow
+    return tf
+
+_threads_configured = False
+
+def _configure_threads():
+    """Apply per-worker TensorFlow thread pool sizes once (must run before the TF runtime starts)"""
+    global _threads_configured
+    if _threads_configured:
+        return
+    _threads_configured = True
+    
+    intra_op = getattr(settings, 'NCF_INTRA_OP_THREADS', 0)
+    inter_op = getattr(settings, 'NCF_INTER_OP_THREADS', 0)
+    
+    try:
+        if intra_op:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        if inter_op:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError as e:
+        # TensorFlow was already initialised elsewhere in this process
+        logger.warning(f"Could not apply NCF thread settings: {e}")
+
+def top_k_indices(scores, k):
+    """Indices of the k largest scores along the last axis, best first (argpartition + partial sort)"""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    
+    partition = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, partition, axis=-1), axis=-1, kind='stable')
+    return np.take_along_axis(partition, order, axis=-1)
+
+def catalog_mask(model):
+    """Which of model.movie_ids are still in the movie catalog snapshot, cached on the model per snapshot
+    
+    Models loaded with filter_catalog=False (synthetic benchmark models, whose IDs aren't
+    movies) treat every encoded movie as in the catalog.
+    """
+    from movies.catalog import get_catalog
+    
+    cached = getattr(model, '_catalog_mask', None)
+    if not getattr(model, 'filter_catalog', True):
+        if cached is None:
+            cached = (None, np.ones(len(model.movie_ids), dtype=bool))
+            model._catalog_mask = cached
+        return cached[1]
+    
+    catalog = get_catalog()
+    if cached is None or cached[0] is not catalog:
+        cached = (catalog, catalog.contains(model.movie_ids))
+        model._catalog_mask = cached
+    return cached[1]
+
+class LoadedNCFModel:
+    """
+    One immutable, fully loaded NCF model version
+    Holds the backend, encoders, ID lookup tables and item embeddings together, so a
+    request that grabbed this object keeps a consistent view even if a newer version
+    is swapped in while it runs.
+    """
+    
+    def __init__(self, version, paths, shared_store=None, revision=None, index_stamp=None, backend=None):
+        self.version = version
+        self.revision = revision       # ModelRegistry.revision() this was loaded at (cold-start vectors)
+        self.index_stamp = index_stamp # ModelRegistry.index_stamp() this was loaded at (retrieval index)
+        self.serving_key = f"{version}@{revision}" if revision else version
+        self.model = None
+        self.engine = None             # NumpyNCFEngine when NCF_BACKEND = 'numpy'
+        self.client = None             # NCFInferenceClient when NCF_BACKEND = 'remote'
+        self.remote_info = None        # what the inference server reported at load time
+        self.local = None              # in-process copy scoring for `client` while the server serves another version
+        self.infer = None              # traced forward pass, bypasses Model.predict
+        self.input_specs = None        # (dtype, shape) per model input for reshaping raw index arrays
+        self.item_embeddings = None    # L2-normalised movie vectors, one row per encoded movie
+        self.movie_ids = None          # encoded movie index -> Django movie ID
+        self.n_trained_movies = None   # movie indices past this are cold-start vectors
+        self.user_lookup = None        # Django user ID -> encoded index (UNKNOWN_INDEX if absent)
+        self.movie_lookup = None       # Django movie ID -> encoded index (UNKNOWN_INDEX if absent)
+        self.user_query_layers = None  # user embedding layers that retrieval queries are projected from
+        self.ann_index = None          # IVFIndex over item_embeddings (build_ncf_ann_index)
+        self.shared_store = shared_store  # memory-mapped arrays shared by all workers on the host
+        self.filter_catalog = True     # limit candidates to the movie catalog (see catalog_mask)
+        self._paths = paths
+        self._local_lock = threading.Lock()
+        
+        # Movies added after training get synthetic vectors appended after the trained ones
+        cold_start = load_cold_start(paths.get('cold_start'))
+        self._build_lookup_tables(cold_start)
+        
+        backend = backend or getattr(settings, 'NCF_BACKEND', 'keras')
+        if backend == 'remote':
+            # The run_ncf_server process owns the model; this worker only encodes IDs and ranks
+            self.client = get_inference_client()
+            self.remote_info = self.client.info()
+        elif backend == 'numpy':
+            # Exported weights run on NumPy alone - TensorFlow is never imported
+            self.engine = NumpyNCFEngine.load(paths['numpy_weights'], shared_store)
+            if cold_start is not None:
+                self.engine.extend_embeddings(cold_start[1], self.n_trained_movies)
+            self.model = self.engine
+        else:
+            _import_tensorflow()
+            _configure_threads()
+            
+            # Load your trained Maximum Performance NCF model
+            self.model = tf.keras.models.load_model(paths['model'])
+            if cold_start is not None:
+                self.model = extend_keras_model(self.model, cold_start[1], self.n_trained_movies)
+            self._build_inference_fn()
+        
+        if cold_start is not None:
+            logger.info(f"Cold-start vectors: {len(self.movie_ids) - self.n_trained_movies} movies added after training")
+        self._build_item_embeddings()
+        self._load_ann_index(paths.get('ann_index'))
+    
+    def _encoder(self, name):
+        """Pickled LabelEncoder, only loaded when a derived array has to be (re)built (not kept afterwards)"""
+        return joblib.load(self._paths[name])
+    
+    def _shared_array(self, name, build_fn):
+        """Map `name` from the shared store (building it on first use), or build a private copy"""
+        if self.shared_store is None:
+            return build_fn()
+        return self.shared_store.get(name, build_fn)
+    
+    def count_params(self):
+        if self.client is not None:
+            return self.remote_info['params']
+        return self.model.count_params()
+    
+    def _build_inference_fn(self):
+        """Trace a fixed-signature forward pass and warm it up"""
+        model = self.model
+        self.input_specs = [
+            (inp.dtype, (-1,) + tuple(inp.shape[1:])) for inp in model.inputs
+        ]
+        signature = [
+            tf.TensorSpec(shape=(None,) + tuple(inp.shape[1:]), dtype=inp.dtype)
+            for inp in model.inputs
+        ]
+        
+        @tf.function(input_signature=signature)
+        def infer(user_input, movie_input):
+            return model([user_input, movie_input], training=False)
+        
+        self.infer = infer
+        
+        # Trigger tracing now so the first request doesn't pay for it
+        self.run_model(np.zeros(1, dtype=np.int32), np.zeros(1, dtype=np.int32))
+    
+    def run_model(self, user_array, movie_array):
+        """Score encoded (user, movie) index pairs, returning a flat float32 array"""
+        if self.engine is not None:
+            return self.engine.predict(user_array, movie_array)
+        if self.client is not None:
+            if self.local is None:
+                try:
+                    return self.client.score(self.serving_key, user_array, movie_array)
+                except VersionMismatchError as e:
+                    self._load_local(e)
+            return self.local.run_model(user_array, movie_array)
+        
+        inputs = [
+            np.asarray(array).astype(dtype, copy=False).reshape(shape)
+            for array, (dtype, shape) in zip((user_array, movie_array), self.input_specs)
+        ]
+        return self.infer(*inputs).numpy().reshape(-1)
+    
+    def _load_local(self, error):
+        """Load this version in-process, for a server that has moved on to another version mid-rollout
+        
+        The indices this model encodes are only valid for its own version, so scoring them on the
+        server's would be wrong. Used until the worker's own reload swaps in the new version.
+        """
+        with self._local_lock:
+            if self.local is not None:
+                return
+            logger.warning(f"NCF inference server can't score {self.serving_key} ({error}), scoring in-process")
+            backend = 'numpy' if os.path.exists(self._paths['numpy_weights']) else 'keras'
+            self.local = LoadedNCFModel(
+                self.version, self._paths, self.shared_store, self.revision, self.index_stamp, backend=backend
+            )
+    
+    def score_matrix(self, user_encoded, movie_encoded):
+        """Score every encoded user against every encoded movie, returning a (users, movies) array"""
+        user_encoded = np.asarray(user_encoded, dtype=np.int32)
+        movie_encoded = np.asarray(movie_encoded, dtype=np.int32)
+        
+        user_array = np.repeat(user_encoded, len(movie_encoded))
+        movie_array = np.tile(movie_encoded, len(user_encoded))
+        return self.run_model(user_array, movie_array).reshape(len(user_encoded), len(movie_encoded))
+    
+    def _embedding_tables(self):
+        """[(layer_name, weights), ...] for every embedding layer of the loaded backend"""
+        if self.engine is not None:
+            return self.engine.embedding_tables()
+        return [
+            (layer.name, layer.get_weights()[0])
+            for layer in self.model.layers if isinstance(layer, tf.keras.layers.Embedding)
+        ]
+    
+    def movie_embedding_tables(self):
+        """[(layer_name, table), ...] for the embedding layers indexed by movie"""
+        n_movies = len(self.movie_ids)
+        
+        # Movie tables are the embedding layers sized to the movie vocabulary;
+        # prefer explicitly named ones in case users and movies share a size
+        candidates = [(name, table) for name, table in self._embedding_tables() if table.shape[0] == n_movies]
+        named = [(name, table) for name, table in candidates if 'movie' in name or 'item' in name]
+        return named or candidates
+    
+    def _build_item_embeddings(self):
+        """Extract the learned movie embedding tables once and L2-normalise them for cosine lookups"""
+        if self.client is not None:
+            self.item_embeddings = self._remote_item_embeddings()
+            return
+        
+        tables = [table for name, table in self.movie_embedding_tables()]
+        
+        if not tables:
+            logger.warning("No movie embedding layer found, similar movies disabled")
+            self.item_embeddings = None
+            return
+        
+        self.item_embeddings = self._shared_array('item_embeddings', lambda: self._normalise_tables(tables))
+        logger.info(f"Item embeddings ready: {self.item_embeddings.shape[0]} movies x {self.item_embeddings.shape[1]} dims")
+    
+    def _remote_item_embeddings(self):
+        """Item embeddings from the inference server, or from the shared store if any process already has them"""
+        try:
+            return self._shared_array('item_embeddings', lambda: self.client.item_embeddings(self.serving_key))
+        except Exception as e:
+            logger.warning(f"Could not fetch item embeddings from the NCF inference server, similar movies disabled: {e}")
+            return None
+    
+    def _load_ann_index(self, directory):
+        """Map the retrieval index if one was built for exactly this catalog"""
+        if self.item_embeddings is None or self.client is not None:
+            return
+        
+        # Retrieval queries are projected from the user's rows of every user embedding layer
+        self.user_query_layers = [name for name, table in self._embedding_tables() if 'user' in name] or None
+        
+        index = IVFIndex.load(directory)
+        if index is None or self.user_query_layers is None:
+            return
+        if index.meta.get('serving_key') != self.serving_key or len(index) != len(self.movie_ids):
+            logger.warning(f"Ignoring stale NCF retrieval index in {directory} (rebuild with build_ncf_ann_index)")
+            return
+        self.ann_index = index
+        logger.info(f"NCF retrieval index ready: {len(index)} movies in {index.n_lists} lists")
+    
+    def _embedding_rows(self, name, indices):
+        """float32 rows of one embedding layer without materialising the whole table"""
+        if self.engine is not None:
+            return self.engine.gather(name, indices)
+        return tf.gather(self.model.get_layer(name).embeddings, indices).numpy()
+    
+    def user_features(self, user_encoded):
+        """Concatenated user embedding rows for encoded users, the input to retrieval query projection"""
+        indices = np.atleast_1d(np.asarray(user_encoded, dtype=np.int64))
+        return np.hstack([self._embedding_rows(name, indices) for name in self.user_query_layers]).astype(np.float32)
+    
+    def user_vector(self, user_encoded):
+        """Retrieval query for an encoded user, in the same space as item_embeddings (None without an index)"""
+        if self.ann_index is None:
+            return None
+        return self.ann_index.query_vector(self.user_features(user_encoded)[0])
+    
+    @staticmethod
+    def _normalise_tables(tables):
+        """Normalise each table (GMF/MLP towers) separately so neither dominates, then the concatenation"""
+        normalised = []
+        for table in tables:
+            norms = np.linalg.norm(table, axis=1, keepdims=True)
+            normalised.append(table / np.maximum(norms, 1e-12))
+        embeddings = np.hstack(normalised)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def _build_lookup_tables(self, cold_start=None):
+        """Compile the pickled LabelEncoders (plus any cold-start movies) into dense ID -> index arrays"""
+        cold_start_ids = cold_start[0] if cold_start is not None else np.empty(0, dtype=np.int64)
+        
+        self.user_lookup = self._shared_array(
+            'user_lookup', lambda: self._compile_lookup(self._encoder('user_encoder').classes_)
+        )
+        self.movie_ids = self._shared_array(
+            'movie_ids', lambda: np.concatenate([
+                np.asarray(self._encoder('movie_encoder').classes_).astype(np.int64), cold_start_ids
+            ])
+        )
+        self.n_trained_movies = len(self.movie_ids) - len(cold_start_ids)
+        self.movie_lookup = self._shared_array('movie_lookup', lambda: self._compile_lookup(self.movie_ids))
+    
+    @staticmethod
+    def _compile_lookup(classes):
+        """Build an int32 array where lookup[django_id] is the index of that ID in classes"""
+        classes = np.asarray(classes).astype(np.int64)
+        lookup = np.full(int(classes.max()) + 1 if len(classes) else 0, UNKNOWN_INDEX, dtype=np.int32)
+        lookup[classes] = np.arange(len(classes), dtype=np.int32)
+        return lookup
+    
+    @staticmethod
+    def _lookup_one(lookup, raw_id):
+        """Encode a single ID, returning None when it is unknown"""
+        if lookup is None:
+            return None
+        try:
+            raw_id = int(raw_id)
+        except (TypeError, ValueError):
+            return None
+        if 0 <= raw_id < len(lookup) and lookup[raw_id] != UNKNOWN_INDEX:
+            return int(lookup[raw_id])
+        return None
+    
+    @staticmethod
+    def _lookup_many(lookup, raw_ids):
+        """Encode an array of IDs with one gather; unknown IDs map to UNKNOWN_INDEX"""
+        raw_ids = np.asarray(raw_ids, dtype=np.int64)
+        encoded = np.full(raw_ids.shape, UNKNOWN_INDEX, dtype=np.int32)
+        if lookup is None:
+            return encoded
+        in_range = (raw_ids >= 0) & (raw_ids < len(lookup))
+        encoded[in_range] = lookup[raw_ids[in_range]]
+        return encoded
+    
+    def encode_user_id(self, user_id):
+        return self._lookup_one(self.user_lookup, user_id)
+    
+    def encode_movie_id(self, movie_id):
+        return self._lookup_one(self.movie_lookup, movie_id)
+    
+    def encode_user_ids(self, user_ids):
+        return self._lookup_many(self.user_lookup, user_ids)
+    
+    def encode_movie_ids(self, movie_ids):
+        return self._lookup_many(self.movie_lookup, movie_ids)
+
 class NCFModelService:
     """
     Neural Collaborative Filtering Model Service
-    Loads your trained max_performance_ncf.keras model
+    Loads your trained max_performance_ncf.keras model from the versioned model registry
+    and hot-swaps newer versions in the background (see ai_models/registry.py)
     """
     
     _instance = None
-    _model = None
-    _user_encoder = None
-    _movie_encoder = None
+    _instance_lock = threading.Lock()
+    _current = None          # LoadedNCFModel being served; replaced wholesale on reload
+    _batcher = None          # cross-request micro-batcher, when NCF_BATCHING_ENABLED
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(NCFModelService, cls).__new__(cls)
-            cls._instance._load_model()
+            with cls._instance_lock:
+                # Concurrent first requests must not load the model twice
+                if cls._instance is None:
+                    instance = super(NCFModelService, cls).__new__(cls)
+                    instance._setup(get_model_registry())
+                    cls._instance = instance
         return cls._instance
     
-    def _load_model(self):
-        """Load the trained NCF model and encoders"""
+    @classmethod
+    def for_registry(cls, registry, filter_catalog=True):
+        """A standalone service over another registry (benchmarks, offline jobs); not the process singleton
+        
+        filter_catalog=False serves models whose movie IDs aren't in the database, such as the
+        synthetic benchmark models, without limiting candidates to the catalog snapshot.
+        """
+        instance = super(NCFModelService, cls).__new__(cls)
+        instance._setup(registry, filter_catalog)
+        return instance
+    
+    def _setup(self, registry, filter_catalog=True):
+        self._registry = registry
+        self._filter_catalog = filter_catalog
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self._last_version_check = time.monotonic()
+        self._current = self._load_version(registry.current_version())
+        self._build_batcher()
+    
+    def _load_version(self, version):
+        """Load one model version from the registry (None on failure)"""
         try:
-            model_path = os.path.join(settings.BASE_DIR, 'ai_models', 'models', 'max_performance_ncf.keras')
-            user_encoder_path = os.path.join(settings.BASE_DIR, 'ai_models', 'models', 'user_encoder.pkl')
-            movie_encoder_path = os.path.join(settings.BASE_DIR, 'ai_models', 'models', 'movie_encoder.pkl')
+            paths = self._registry.paths(version)
+            revision = self._registry.revision(version)
+            index_stamp = self._registry.index_stamp(version)
+            shared_store = None
+            if getattr(settings, 'NCF_SHARED_ARRAYS', True):
+                shared_store = get_shared_store(self._registry.version_dir(version), paths.values())
             
-            # Load your trained Maximum Performance NCF model
-            self._model = tf.keras.models.load_model(model_path)
-            self._user_encoder = joblib.load(user_encoder_path)
-            self._movie_encoder = joblib.load(movie_encoder_path)
+            loaded = LoadedNCFModel(version, paths, shared_store, revision, index_stamp)
+            loaded.filter_catalog = self._filter_catalog
             
-            logger.info("Maximum Performance NCF model loaded successfully")
-            logger.info(f"Model parameters: {self._model.count_params():,}")
+            logger.info(f"Maximum Performance NCF model {version} loaded successfully")
+            logger.info(f"Model parameters: {loaded.count_params():,}")
+            if shared_store is not None:
+                memory = process_memory(shared_prefix=shared_store.directory)
+                if memory is not None:
+                    logger.info(
+                        f"NCF memory (pid {memory['pid']}): shared arrays {memory['mapped_size_kb'] / 1024:.1f} MB mapped, "
+                        f"{memory['mapped_pss_kb'] / 1024:.1f} MB proportional; process PSS {memory['pss_kb'] / 1024:.1f} MB"
+                    )
+            return loaded
             
         except Exception as e:
-            logger.error(f"Error loading NCF model: {e}")
-            self._model = None
+            logger.error(f"Error loading NCF model {version}: {e}")
+            return None
+    
+    def check_for_update(self, force=False):
+        """Start a background load if the registry's CURRENT version (or its cold-start vectors or index) changed
+        
+        Checks are throttled to NCF_RELOAD_CHECK_INTERVAL seconds. The new version is swapped in
+        only once fully loaded; requests already holding the old LoadedNCFModel finish on it.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_version_check < getattr(settings, 'NCF_RELOAD_CHECK_INTERVAL', 30):
+            return
+        self._last_version_check = now
+        
+        version = self._registry.current_version()
+        current = self._current
+        if (current is not None and current.version == version
+                and current.revision == self._registry.revision(version)
+                and current.index_stamp == self._registry.index_stamp(version)):
+            return
+        
+        with self._reload_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return
+            self._reload_thread = threading.Thread(
+                target=self._reload, args=(version,), name='ncf-model-reload', daemon=True
+            )
+            self._reload_thread.start()
+    
+    def _reload(self, version):
+        """Background reload: load fully, then swap the reference atomically"""
+        loaded = self._load_version(version)
+        if loaded is not None:
+            previous = self._current
+            self._current = loaded
+            logger.info(f"Swapped NCF model {previous.version if previous else None} -> {version}")
+            self._prune_shared_stores(loaded, previous)
+    
+    def _prune_shared_stores(self, current, previous):
+        """Drop shared array stores of every model but the served one and the one it replaced"""
+        if current.shared_store is None:
+            return
+        keep = [model.shared_store.directory for model in (current, previous)
+                if model is not None and model.shared_store is not None]
+        version_dirs = [self._registry.version_dir(version) for version in self._registry.list_versions()]
+        version_dirs.append(self._registry.version_dir(LEGACY_VERSION))
+        try:
+            prune_shared_stores(version_dirs, keep)
+        except Exception as e:
+            logger.warning(f"Could not prune shared NCF arrays: {e}")
+    
+    def current_model(self):
+        """The LoadedNCFModel to use for one whole request or job (None if nothing is loaded)"""
+        self.check_for_update()
+        return self._current
+    
+    @property
+    def model_version(self):
+        current = self._current
+        return current.version if current is not None else None
+    
+    def _build_batcher(self):
+        """Start the micro-batching scheduler if enabled for this process"""
+        if not getattr(settings, 'NCF_BATCHING_ENABLED', False):
+            return
+        
+        # Requests are grouped by model version, so a swap never mixes indices from two encoders
+        self._batcher = InferenceBatcher(
+            lambda model, user_array, movie_array: model.run_model(user_array, movie_array),
+            window_ms=getattr(settings, 'NCF_BATCH_WINDOW_MS', 3),
+            max_batch_size=getattr(settings, 'NCF_BATCH_MAX_SIZE', 16384),
+            max_queue_size=getattr(settings, 'NCF_BATCH_QUEUE_SIZE', 256),
+            timeout=getattr(settings, 'NCF_BATCH_TIMEOUT', 1.0),
+        )
+        logger.info(f"NCF micro-batching enabled ({self._batcher.window * 1000:.1f} ms window)")
+    
+    def _score_pairs(self, model, user_array, movie_array, batch=True):
+        """Score encoded pairs, sharing a forward pass with concurrent requests when batching is on
+        
+        Catalog scans pass batch=False: every chunk would otherwise wait out its own batch window.
+        Pair sets that fill a batch on their own skip the batcher too.
+        """
+        if self._batcher is not None and batch and len(movie_array) < self._batcher.max_batch_size:
+            return self._batcher.submit(user_array, movie_array, key=model)
+        return model.run_model(user_array, movie_array)
     
     def is_model_loaded(self):
         """Check if model is loaded successfully"""
-        return self._model is not None
+        return self.current_model() is not None
     
     def encode_user_id(self, user_id):
         """Encode Django user ID to model format"""
-        try:
-            return self._user_encoder.transform([user_id])[0]
-        except (ValueError, AttributeError):
-            return None
+        model = self.current_model()
+        return model.encode_user_id(user_id) if model is not None else None
     
     def encode_movie_id(self, movie_id):
         """Encode Django movie ID to model format"""
-        try:
-            return self._movie_encoder.transform([movie_id])[0]
-        except (ValueError, AttributeError):
-            return None
+        model = self.current_model()
+        return model.encode_movie_id(movie_id) if model is not None else None
+    
+    def encode_user_ids(self, user_ids):
+        """Encode many Django user IDs at once (UNKNOWN_INDEX marks unknown users)"""
+        return LoadedNCFModel._lookup_many(getattr(self.current_model(), 'user_lookup', None), user_ids)
+    
+    def encode_movie_ids(self, movie_ids):
+        """Encode many Django movie IDs at once (UNKNOWN_INDEX marks unknown movies)"""
+        return LoadedNCFModel._lookup_many(getattr(self.current_model(), 'movie_lookup', None), movie_ids)
     
     def predict_single(self, user_id, movie_id):
         """Predict rating for single user-movie pair"""
-        if not self.is_model_loaded():
+        model = self.current_model()
+        if model is None:
             return None
         
-        user_encoded = self.encode_user_id(user_id)
-        movie_encoded = self.encode_movie_id(movie_id)
+        user_encoded = model.encode_user_id(user_id)
+        movie_encoded = model.encode_movie_id(movie_id)
         
         if user_encoded is None or movie_encoded is None:
             return None
         
         try:
             # Use your trained model for prediction
-            prediction = self._model.predict([
-                np.array([user_encoded]), 
+            prediction = self._score_pairs(
+                model,
+                np.array([user_encoded]),
                 np.array([movie_encoded])
-            ], verbose=0)[0][0]
+            )[0]
             
             return float(prediction)
             
@@ -89,45 +577,277 @@ class NCFModelService:
     
     def predict_batch(self, user_id, movie_ids):
         """Predict ratings for multiple movies for one user"""
-        if not self.is_model_loaded():
+        model = self.current_model()
+        if model is None:
             return {}
         
-        user_encoded = self.encode_user_id(user_id)
+        user_encoded = model.encode_user_id(user_id)
         if user_encoded is None:
             return {}
         
-        valid_movies = []
-        valid_movie_ids = []
+        movie_ids = np.asarray(list(movie_ids), dtype=np.int64)
+        movie_encoded = model.encode_movie_ids(movie_ids)
+        valid = movie_encoded != UNKNOWN_INDEX
         
-        for movie_id in movie_ids:
-            movie_encoded = self.encode_movie_id(movie_id)
-            if movie_encoded is not None:
-                valid_movies.append(movie_encoded)
-                valid_movie_ids.append(movie_id)
-        
-        if not valid_movies:
+        if not valid.any():
             return {}
         
         try:
             # Batch prediction using your trained model
-            user_array = np.array([user_encoded] * len(valid_movies))
-            movie_array = np.array(valid_movies)
+            movie_array = movie_encoded[valid]
+            user_array = np.full(len(movie_array), user_encoded, dtype=np.int32)
             
-            predictions = self._model.predict([user_array, movie_array], verbose=0)
+            predictions = self._score_pairs(model, user_array, movie_array)
             
             # Return dictionary mapping movie_id to prediction
-            results = {}
-            for movie_id, prediction in zip(valid_movie_ids, predictions):
-                results[movie_id] = float(prediction[0])
-            
-            return results
+            return dict(zip(movie_ids[valid].tolist(), predictions.astype(float).tolist()))
             
         except Exception as e:
             logger.error(f"Batch prediction error: {e}")
             return {}
     
+    def score_candidates(self, user_id, movie_ids):
+        """NCF scores aligned with movie_ids from one vectorized pass, NaN where a movie can't be scored
+        
+        Returns None if the model isn't loaded or the user is unknown to the encoder.
+        """
+        model = self.current_model()
+        if model is None:
+            return None
+        
+        user_encoded = model.encode_user_id(user_id)
+        if user_encoded is None:
+            return None
+        
+        movie_encoded = model.encode_movie_ids(movie_ids)
+        valid = movie_encoded != UNKNOWN_INDEX
+        scores = np.full(len(movie_encoded), np.nan, dtype=np.float32)
+        if valid.any():
+            scores[valid] = self._score_pairs(
+                model, np.full(int(valid.sum()), user_encoded, dtype=np.int32), movie_encoded[valid]
+            )
+        return scores
+    
+    def recommend(self, user_id, exclude_movie_ids=(), top_k=20, chunk_size=None):
+        """Score the whole encodable catalog for a user and return [(movie_id, score), ...] best first
+        
+        Candidates come from the encoder's movie array, limited to movies in the catalog snapshot
+        (movies/catalog.py), rather than from a database query. Scoring runs in
+        fixed-size chunks while a running top-k is kept, so memory stays at O(chunk_size + top_k)
+        whatever the catalog size. With a retrieval index only its NCF_ANN_CANDIDATES are scored.
+        """
+        model = self.current_model()
+        if model is None:
+            return []
+        
+        user_encoded = model.encode_user_id(user_id)
+        if user_encoded is None:
+            return []
+        
+        # Movies removed from the catalog since training are never candidates
+        n_movies = len(model.movie_ids)
+        candidate_mask = catalog_mask(model).copy()
+        excluded = model.encode_movie_ids(list(exclude_movie_ids))
+        candidate_mask[excluded[excluded != UNKNOWN_INDEX]] = False
+        
+        chunk_size = chunk_size or getattr(settings, 'NCF_SCORING_CHUNK_SIZE', 8192)
+        best_indices = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        
+        candidates = self._retrieve(model, model.user_vector(user_encoded), top_k, len(exclude_movie_ids))
+        scorer = self._sharded_scorer(model, n_movies) if candidates is None else None
+        if scorer is not None:
+            try:
+                indices, scores = scorer.top_k([user_encoded], top_k, excluded=[np.flatnonzero(~candidate_mask)])
+            except Exception as e:
+                self._sharded_scoring_failed(scorer, e)
+            else:
+                valid = np.isfinite(scores[0])
+                return list(zip(model.movie_ids[indices[0][valid]].tolist(), scores[0][valid].astype(float).tolist()))
+        
+        if candidates is not None:
+            # Only the retrieved candidates get a full model pass
+            chunks = [candidates[candidate_mask[candidates]]]
+        else:
+            chunks = (
+                np.flatnonzero(candidate_mask[start:start + chunk_size]) + start
+                for start in range(0, n_movies, chunk_size)
+            )
+        # A scan of several chunks goes straight to the engine; only single-pass requests are batched
+        batch = candidates is not None or n_movies <= chunk_size
+        
+        try:
+            for chunk in chunks:
+                if not len(chunk):
+                    continue
+                
+                scores = self._score_pairs(model, np.full(len(chunk), user_encoded, dtype=np.int32), chunk, batch)
+                
+                # Merge this chunk into the running top-k
+                merged_indices = np.concatenate([best_indices, chunk])
+                merged_scores = np.concatenate([best_scores, scores])
+                keep = top_k_indices(merged_scores, top_k)
+                best_indices, best_scores = merged_indices[keep], merged_scores[keep]
+                
+        except Exception as e:
+            logger.error(f"Catalog scoring error: {e}")
+            return []
+        
+        return list(zip(model.movie_ids[best_indices].tolist(), best_scores.astype(float).tolist()))
+    
+    def recommend_many(self, user_ids, exclude_movie_ids=None, top_k=20, block_users=64):
+        """Yield (user_id, [(movie_id, score), ...]) for each of user_ids, scoring users a block at a time
+        
+        Each block of block_users users is ranked against the whole catalog in a few large
+        forward passes instead of one request per user. exclude_movie_ids maps a user_id to the
+        movie ids to leave out. Users unknown to the encoder yield an empty list; results are
+        produced in input order as blocks finish, so callers can stream them out.
+        """
+        model = self.current_model()
+        if model is None:
+            return
+        
+        exclude_movie_ids = exclude_movie_ids or {}
+        user_ids = np.asarray(list(user_ids), dtype=np.int64)
+        user_encoded = model.encode_user_ids(user_ids)
+        # Movies removed from the catalog since training are never candidates
+        in_catalog = catalog_mask(model)
+        candidates = np.flatnonzero(in_catalog)
+        # With the whole catalog in, shards are sent as index ranges instead of index arrays
+        shard_candidates = None if in_catalog.all() else candidates
+        scorer = self._sharded_scorer(model, len(candidates))
+        
+        for block_start in range(0, len(user_ids), block_users):
+            block_ids = user_ids[block_start:block_start + block_users]
+            block_encoded = user_encoded[block_start:block_start + block_users]
+            known = block_encoded != UNKNOWN_INDEX
+            
+            results = {}
+            if known.any():
+                excluded = []
+                for user_id in block_ids[known].tolist():
+                    encoded = model.encode_movie_ids(list(exclude_movie_ids.get(user_id, ())))
+                    excluded.append(encoded[encoded != UNKNOWN_INDEX])
+                
+                indices = scores = None
+                if scorer is not None:
+                    try:
+                        indices, scores = scorer.top_k(block_encoded[known], top_k, candidates=shard_candidates, excluded=excluded)
+                    except Exception as e:
+                        self._sharded_scoring_failed(scorer, e)
+                        scorer = None
+                if indices is None:
+                    try:
+                        indices, scores = score_top_k(model, block_encoded[known], candidates, top_k, excluded)
+                    except Exception as e:
+                        logger.error(f"Batch catalog scoring error: {e}")
+                
+                if indices is not None:
+                    for user_id, user_indices, user_scores in zip(block_ids[known].tolist(), indices, scores):
+                        valid = np.isfinite(user_scores)
+                        results[user_id] = list(zip(
+                            model.movie_ids[user_indices[valid]].tolist(), user_scores[valid].astype(float).tolist()
+                        ))
+            
+            for user_id in block_ids.tolist():
+                yield user_id, results.get(user_id, [])
+    
+    def fold_in_user(self, movie_ids, weights):
+        """Build a vector for a user the encoder has never seen from their weighted movie history
+        
+        The vector is the weighted mean of the (unit length) item embeddings of the movies the
+        user interacted with; negative weights push it away from disliked movies. Returns None
+        if no history movie is known to the model or the weights cancel out.
+        """
+        model = self.current_model()
+        if model is None or model.item_embeddings is None:
+            return None
+        
+        movie_encoded = model.encode_movie_ids(movie_ids)
+        weights = np.asarray(weights, dtype=np.float32)
+        known = movie_encoded != UNKNOWN_INDEX
+        if not known.any():
+            return None
+        
+        user_vector = weights[known] @ model.item_embeddings[movie_encoded[known]]
+        norm = np.linalg.norm(user_vector)
+        if norm < 1e-12:
+            return None
+        return user_vector / norm
+    
+    def recommend_for_vector(self, user_vector, exclude_movie_ids=(), top_k=20):
+        """Rank the catalog against a folded-in user vector, returning [(movie_id, score), ...] best first"""
+        model = self.current_model()
+        if model is None or model.item_embeddings is None or user_vector is None:
+            return []
+        if len(user_vector) != model.item_embeddings.shape[1]:
+            # Vector was built against a different model version
+            return []
+        
+        user_vector = np.asarray(user_vector, dtype=np.float32)
+        excluded = model.encode_movie_ids(list(exclude_movie_ids))
+        excluded = excluded[excluded != UNKNOWN_INDEX]
+        
+        in_catalog = catalog_mask(model)
+        
+        candidates = self._retrieve(model, user_vector, top_k, len(excluded))
+        if candidates is not None:
+            candidates = candidates[in_catalog[candidates] & ~np.isin(candidates, excluded)]
+            scores = model.item_embeddings[candidates] @ user_vector
+            keep = top_k_indices(scores, top_k)
+            return list(zip(model.movie_ids[candidates[keep]].tolist(), scores[keep].astype(float).tolist()))
+        
+        scores = model.item_embeddings @ user_vector
+        scores[excluded] = -np.inf
+        scores[~in_catalog] = -np.inf
+        
+        top_indices = top_k_indices(scores, top_k)
+        top_indices = top_indices[np.isfinite(scores[top_indices])]
+        
+        return list(zip(model.movie_ids[top_indices].tolist(), scores[top_indices].astype(float).tolist()))
+    
+    def _retrieve(self, model, query, top_k, n_excluded=0):
+        """Candidate movie indices from the retrieval index, or None to fall back to exact scoring"""
+        if model.ann_index is None or query is None or not getattr(settings, 'NCF_ANN_ENABLED', True):
+            return None
+        
+        # Over-fetch by the exclusion count so rated movies don't eat into the candidate budget
+        n_candidates = max(getattr(settings, 'NCF_ANN_CANDIDATES', 300), top_k) + n_excluded
+        return model.ann_index.search(query, n_candidates, getattr(settings, 'NCF_ANN_NPROBE', 16))[0]
+    
+    def _sharded_scorer(self, model, n_candidates):
+        """Process-pool scorer when NCF_SHARDED_PROCESSES is set and the candidate set is large enough, else None"""
+        processes = getattr(settings, 'NCF_SHARDED_PROCESSES', 0)
+        if processes < 2 or model.client is not None:
+            return None
+        if n_candidates < getattr(settings, 'NCF_SHARDED_MIN_CANDIDATES', 100000):
+            return None
+        
+        try:
+            return get_sharded_scorer(model, processes)
+        except Exception as e:
+            logger.warning(f"Sharded scoring unavailable, scoring in-process: {e}")
+            return None
+    
+    def _sharded_scoring_failed(self, scorer, error):
+        """Log a failed sharded call; the caller scores in-process instead
+        
+        A pool that lost a worker stays broken, so it is discarded and the next call starts a new one.
+        """
+        logger.error(f"Sharded scoring error, scoring in-process: {error}")
+        if isinstance(error, BrokenProcessPool):
+            discard_sharded_scorer(scorer)
+    
     def get_top_recommendations(self, user_id, candidate_movie_ids, top_k=20):
         """Get top-k movie recommendations for user"""
+        candidate_movie_ids = list(candidate_movie_ids)
+        model = self.current_model()
+        scorer = self._sharded_scorer(model, len(candidate_movie_ids)) if model is not None else None
+        if scorer is not None:
+            top = self._sharded_top_recommendations(scorer, model, user_id, candidate_movie_ids, top_k)
+            if top is not None:
+                return top
+        
         predictions = self.predict_batch(user_id, candidate_movie_ids)
         
         if not predictions:
@@ -138,11 +858,59 @@ class NCFModelService:
         
         return [movie_id for movie_id, score in sorted_predictions[:top_k]]
     
+    def _sharded_top_recommendations(self, scorer, model, user_id, candidate_movie_ids, top_k):
+        """get_top_recommendations for a large candidate list, each shard ranked by a pool worker (None if the pool failed)"""
+        user_encoded = model.encode_user_id(user_id)
+        if user_encoded is None:
+            return []
+        
+        movie_encoded = model.encode_movie_ids(candidate_movie_ids)
+        movie_encoded = np.unique(movie_encoded[movie_encoded != UNKNOWN_INDEX])
+        if not len(movie_encoded):
+            return []
+        
+        try:
+            indices, _ = scorer.top_k([user_encoded], top_k, candidates=movie_encoded)
+        except Exception as e:
+            self._sharded_scoring_failed(scorer, e)
+            return None
+        return model.movie_ids[indices[0]].tolist()
+    
     def get_similar_movies(self, movie_id, top_k=10):
-        """Get similar movies using learned embeddings (advanced feature)"""
-        # This would require extracting embeddings from your model
-        # For now, return empty list - can be implemented later
-        return []
+        """Get similar movies by cosine similarity of learned item embeddings
+        
+        Returns a list of (movie_id, similarity_score) tuples, most similar first.
+        """
+        model = self.current_model()
+        if model is None or model.item_embeddings is None:
+            return []
+        
+        movie_encoded = model.encode_movie_id(movie_id)
+        if movie_encoded is None:
+            return []
+        
+        top_k = min(top_k, len(model.item_embeddings) - 1)
+        if top_k <= 0:
+            return []
+        
+        # Rows are unit length, so a single mat-vec gives every cosine similarity
+        scores = model.item_embeddings @ model.item_embeddings[movie_encoded]
+        scores[movie_encoded] = -np.inf
+        
+        # Movies removed from the catalog since training are never similar movies
+        scores[~catalog_mask(model)] = -np.inf
+        
+        top_indices = top_k_indices(scores, top_k)
+        
+        return [(int(model.movie_ids[i]), float(scores[i])) for i in top_indices if np.isfinite(scores[i])]
+
+def get_ncf_service():
+    """Return the process-wide NCF service, loading TensorFlow and the model on first call"""
+    return NCFModelService()
+
+def preload_ncf_model():
+    """Opt-in hook for serving processes: load the model at boot instead of on the first request"""
+    return get_ncf_service().is_model_loaded()
 
-# Global instance
-ncf_service = NCFModelService()
+# Global instance - resolved lazily, so importing this module stays cheap
+ncf_service = SimpleLazyObject(get_ncf_service)
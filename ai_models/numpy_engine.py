@@ -0,0 +1,318 @@
+import json
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when the exported topology/weights layout changes (2: reduced-precision embedding tables)
+FORMAT_VERSION = 2
+READABLE_FORMATS = (1, 2)
+
+# Storage types for embedding tables; everything else is always exported as float32
+EMBEDDING_DTYPES = ('float32', 'float16', 'int8')
+
+TOPOLOGY_KEY = '__topology__'
+
+def _sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+def _softmax(x):
+    shifted = np.exp(x - x.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+    'softmax': _softmax,
+    'softplus': lambda x: np.logaddexp(0, x),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    'swish': lambda x: x * _sigmoid(x),
+    'silu': lambda x: x * _sigmoid(x),
+}
+
+# Layers that only matter during training
+IDENTITY_LAYERS = {'Dropout', 'GaussianNoise', 'GaussianDropout', 'SpatialDropout1D', 'ActivityRegularization'}
+
+MERGE_LAYERS = {
+    'Add': lambda xs: np.sum(xs, axis=0),
+    'Subtract': lambda xs: xs[0] - xs[1],
+    'Multiply': lambda xs: np.prod(xs, axis=0),
+    'Average': lambda xs: np.mean(xs, axis=0),
+    'Maximum': lambda xs: np.max(xs, axis=0),
+    'Minimum': lambda xs: np.min(xs, axis=0),
+}
+
+SUPPORTED_LAYERS = (
+    {'InputLayer', 'Embedding', 'Flatten', 'Reshape', 'Concatenate', 'Dot',
+     'Dense', 'Activation', 'ReLU', 'LeakyReLU', 'BatchNormalization'}
+    | IDENTITY_LAYERS | set(MERGE_LAYERS)
+)
+
+def _activation_name(activation):
+    """Normalise a serialised Keras activation to one of ACTIVATIONS"""
+    if isinstance(activation, dict):
+        activation = activation.get('config', {}).get('name') or activation.get('class_name')
+    activation = activation or 'linear'
+    if activation not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {activation}")
+    return activation
+
+def _weight_name(variable):
+    """'dense/kernel:0' (Keras 2) and 'kernel' (Keras 3) both become 'kernel'"""
+    return variable.name.split('/')[-1].split(':')[0]
+
+def quantize_embeddings(table, dtype):
+    """
+    Store one embedding table at `dtype`, returning {weight name: array}
+    int8 uses a symmetric per-row scale (embeddings_scale), so a single large row
+    doesn't cost the others their resolution.
+    """
+    table = np.asarray(table, dtype=np.float32)
+    if dtype == 'float32':
+        return {'embeddings': table}
+    if dtype == 'float16':
+        return {'embeddings': table.astype(np.float16)}
+    if dtype == 'int8':
+        scale = np.abs(table).max(axis=1) / 127.0
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        quantized = np.clip(np.rint(table / scale[:, None]), -127, 127).astype(np.int8)
+        return {'embeddings': quantized, 'embeddings_scale': scale}
+    raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+def export_keras_model(model, path, metadata=None, embedding_dtype='float32'):
+    """
+    Export a functional Keras NCF model to the NumPy engine's .npz format
+    Stores the layer graph as JSON plus every weight as a named array, with embedding
+    tables stored as embedding_dtype (see EMBEDDING_DTYPES).
+    Raises ValueError for layers the engine cannot reproduce.
+    """
+    if embedding_dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype: {embedding_dtype}")
+
+    layers = []
+    weights = {}
+
+    for layer in model.layers:
+        class_name = type(layer).__name__
+        if class_name not in SUPPORTED_LAYERS:
+            raise ValueError(f"Layer {layer.name} ({class_name}) is not supported by the NumPy engine")
+        if len(layer._inbound_nodes) > 1:
+            raise ValueError(f"Layer {layer.name} is called more than once; shared layers are not supported")
+
+        config = layer.get_config()
+        spec = {
+            'name': layer.name,
+            'class': class_name,
+            'inbound': [
+                tensor._keras_history[0].name
+                for tensor in layer._inbound_nodes[0].input_tensors
+            ] if layer._inbound_nodes else [],
+        }
+
+        if class_name == 'Dense':
+            spec['activation'] = _activation_name(config.get('activation'))
+            spec['use_bias'] = config.get('use_bias', True)
+        elif class_name == 'Activation':
+            spec['activation'] = _activation_name(config.get('activation'))
+        elif class_name == 'ReLU':
+            if config.get('max_value') is not None or config.get('threshold'):
+                raise ValueError(f"Layer {layer.name}: only plain ReLU is supported")
+            spec['negative_slope'] = float(config.get('negative_slope') or 0.0)
+        elif class_name == 'LeakyReLU':
+            spec['negative_slope'] = float(config.get('negative_slope', config.get('alpha', 0.3)))
+        elif class_name == 'Reshape':
+            spec['target_shape'] = list(config['target_shape'])
+        elif class_name == 'Concatenate':
+            spec['axis'] = config.get('axis', -1)
+        elif class_name == 'Dot':
+            spec['axes'] = config.get('axes')
+            spec['normalize'] = config.get('normalize', False)
+        elif class_name == 'BatchNormalization':
+            spec['epsilon'] = config.get('epsilon', 1e-3)
+            spec['axis'] = config.get('axis', -1)
+
+        if class_name == 'Embedding':
+            spec['dtype'] = embedding_dtype
+            for name, array in quantize_embeddings(layer.get_weights()[0], embedding_dtype).items():
+                weights[f"{layer.name}/{name}"] = array
+        else:
+            for variable in layer.weights:
+                weights[f"{layer.name}/{_weight_name(variable)}"] = np.asarray(variable.numpy(), dtype=np.float32)
+
+        layers.append(spec)
+
+    topology = {
+        'format_version': FORMAT_VERSION,
+        'inputs': [tensor._keras_history[0].name for tensor in model.inputs],
+        'outputs': [tensor._keras_history[0].name for tensor in model.outputs],
+        'layers': layers,
+        'metadata': metadata or {},
+    }
+
+    with open(path, 'wb') as f:
+        np.savez(f, **{TOPOLOGY_KEY: np.array(json.dumps(topology))}, **weights)
+
+class NumpyNCFEngine:
+    """
+    Pure-NumPy forward pass for an exported NCF model
+    Reproduces Model(inputs, training=False) so serving processes never import TensorFlow.
+    """
+
+    def __init__(self, topology, weights):
+        if topology.get('format_version') not in READABLE_FORMATS:
+            raise ValueError(
+                f"Unsupported NCF export format {topology.get('format_version')} (expected one of {READABLE_FORMATS})"
+            )
+        self.topology = topology
+        self.weights = weights
+        self.extra_rows = {}       # embedding layer -> float32 rows appended after the trained table
+        self.inputs = topology['inputs']
+        self.outputs = topology['outputs']
+        self.layers = topology['layers']
+
+    @classmethod
+    def load(cls, path, shared_store=None):
+        """
+        Load an engine from an export_keras_model .npz file
+        With a SharedArrayStore the weights are extracted once to .npy files and
+        memory-mapped, so all workers on the host share one copy of the tables.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            topology = json.loads(str(data[TOPOLOGY_KEY]))
+            keys = [key for key in data.files if key != TOPOLOGY_KEY]
+            if shared_store is None:
+                weights = {key: data[key] for key in keys}
+            else:
+                weights = {
+                    key: shared_store.get('weights/' + key.replace('/', '__'), lambda key=key: data[key])
+                    for key in keys
+                }
+        return cls(topology, weights)
+
+    def count_params(self):
+        return int(sum(array.size for key, array in self.weights.items() if not key.endswith('/embeddings_scale')))
+
+    def embedding_nbytes(self):
+        """Bytes held by embedding tables (and their int8 scales) as stored"""
+        return int(sum(
+            array.nbytes for key, array in self.weights.items()
+            if key.endswith('/embeddings') or key.endswith('/embeddings_scale')
+        ))
+
+    def embedding_tables(self):
+        """[(layer_name, float32 table), ...] for every Embedding layer"""
+        return [
+            (spec['name'], self.gather(spec['name'], np.s_[:]))
+            for spec in self.layers if spec['class'] == 'Embedding'
+        ]
+
+    def extend_embeddings(self, rows, n_trained):
+        """Append extra float32 rows (e.g. cold-start movies) to embedding tables without copying them"""
+        for name, extra in rows.items():
+            table = self.weights[f"{name}/embeddings"]
+            if len(table) != n_trained:
+                raise ValueError(f"Cold-start vectors were built for {n_trained} movies, {name} has {len(table)}")
+            self.extra_rows[name] = np.asarray(extra, dtype=np.float32)
+
+    def gather(self, name, indices):
+        """Rows of an embedding table as float32, reading appended rows from extra_rows"""
+        extra = self.extra_rows.get(name)
+        if extra is None:
+            return self._gather_trained(name, indices)
+
+        n_trained = len(self.weights[f"{name}/embeddings"])
+        if isinstance(indices, slice):
+            return np.vstack([self._gather_trained(name, indices), extra])
+
+        appended = indices >= n_trained
+        if not appended.any():
+            return self._gather_trained(name, indices)
+        rows = np.empty(indices.shape + (extra.shape[1],), dtype=np.float32)
+        rows[~appended] = self._gather_trained(name, indices[~appended])
+        rows[appended] = extra[indices[appended] - n_trained]
+        return rows
+
+    def _gather_trained(self, name, indices):
+        """Rows of a trained embedding table as float32, dequantizing only the rows gathered"""
+        rows = self.weights[f"{name}/embeddings"][indices]
+        if rows.dtype == np.int8:
+            return rows.astype(np.float32) * self.weights[f"{name}/embeddings_scale"][indices][..., None]
+        return rows.astype(np.float32, copy=False)
+
+    def predict(self, *input_arrays):
+        """Run the forward pass on encoded index arrays, returning a flat float32 array"""
+        outputs = {}
+        for name, array in zip(self.inputs, input_arrays):
+            outputs[name] = np.asarray(array).reshape(-1)
+
+        for spec in self.layers:
+            if spec['class'] == 'InputLayer':
+                continue
+            inbound = [outputs[name] for name in spec['inbound']]
+            outputs[spec['name']] = self._apply(spec, inbound)
+
+        return np.asarray(outputs[self.outputs[0]], dtype=np.float32).reshape(-1)
+
+    def _apply(self, spec, inbound):
+        """Evaluate one layer"""
+        class_name = spec['class']
+        name = spec['name']
+        x = inbound[0]
+
+        if class_name == 'Embedding':
+            return self.gather(name, x.astype(np.int64))
+        if class_name == 'Flatten':
+            return x.reshape(len(x), -1)
+        if class_name == 'Reshape':
+            return x.reshape((len(x),) + tuple(spec['target_shape']))
+        if class_name in IDENTITY_LAYERS:
+            return x
+        if class_name == 'Concatenate':
+            return np.concatenate(inbound, axis=spec['axis'])
+        if class_name in MERGE_LAYERS:
+            return MERGE_LAYERS[class_name](np.stack(inbound))
+        if class_name == 'Dense':
+            x = x @ self.weights[f"{name}/kernel"]
+            if spec['use_bias']:
+                x = x + self.weights[f"{name}/bias"]
+            return ACTIVATIONS[spec['activation']](x)
+        if class_name == 'Activation':
+            return ACTIVATIONS[spec['activation']](x)
+        if class_name in ('ReLU', 'LeakyReLU'):
+            return np.where(x > 0, x, x * spec['negative_slope'])
+        if class_name == 'BatchNormalization':
+            return self._batch_norm(spec, x)
+        if class_name == 'Dot':
+            return self._dot(spec, inbound)
+
+        raise ValueError(f"Unsupported layer {name} ({class_name})")
+
+    def _batch_norm(self, spec, x):
+        """Inference-mode batch normalisation using the moving statistics"""
+        name = spec['name']
+        mean = self.weights[f"{name}/moving_mean"]
+        variance = self.weights[f"{name}/moving_variance"]
+        gamma = self.weights.get(f"{name}/gamma", 1.0)
+        beta = self.weights.get(f"{name}/beta", 0.0)
+
+        axis = spec['axis'][0] if isinstance(spec['axis'], list) else spec['axis']
+        if axis not in (-1, x.ndim - 1):
+            shape = [1] * x.ndim
+            shape[axis] = -1
+            mean, variance = mean.reshape(shape), variance.reshape(shape)
+            gamma = np.reshape(gamma, shape) if np.ndim(gamma) else gamma
+            beta = np.reshape(beta, shape) if np.ndim(beta) else beta
+
+        return (x - mean) / np.sqrt(variance + spec['epsilon']) * gamma + beta
+
+    def _dot(self, spec, inbound):
+        """Keras Dot layer for 2-D inputs (the per-pair inner product used by GMF-style towers)"""
+        a, b = inbound
+        if a.ndim != 2 or b.ndim != 2:
+            raise ValueError(f"Layer {spec['name']}: Dot is only supported on 2-D inputs")
+        if spec['normalize']:
+            a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+            b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+        return np.sum(a * b, axis=1, keepdims=True)
@@ -0,0 +1,124 @@
+import os
+from django.conf import settings
+from .ann_index import IVFIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Version name used for the old flat layout (model files directly in NCF_MODEL_ROOT)
+LEGACY_VERSION = 'legacy'
+
+class ModelRegistry:
+    """
+    Versioned NCF model directory with a CURRENT pointer
+
+        <root>/versions/<version>/max_performance_ncf.keras
+                                 /user_encoder.pkl
+                                 /movie_encoder.pkl
+                                 /max_performance_ncf.npz   (optional, export_ncf_weights)
+                                 /cold_start_vectors.npz    (optional, build_cold_start_vectors)
+                                 /ann/                      (optional, build_ncf_ann_index)
+        <root>/CURRENT                                      (name of the active version)
+
+    Without a CURRENT file the flat legacy layout from settings is served as version 'legacy'.
+    """
+
+    MODEL_FILE = 'max_performance_ncf.keras'
+    USER_ENCODER_FILE = 'user_encoder.pkl'
+    MOVIE_ENCODER_FILE = 'movie_encoder.pkl'
+    NUMPY_WEIGHTS_FILE = 'max_performance_ncf.npz'
+    COLD_START_FILE = 'cold_start_vectors.npz'
+    ANN_INDEX_DIR = 'ann'
+    POINTER_FILE = 'CURRENT'
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.versions_dir = os.path.join(self.root, 'versions')
+
+    def current_version(self):
+        """Name of the active version (LEGACY_VERSION when no pointer has been written)"""
+        try:
+            with open(os.path.join(self.root, self.POINTER_FILE)) as f:
+                return f.read().strip() or LEGACY_VERSION
+        except OSError:
+            return LEGACY_VERSION
+
+    def list_versions(self):
+        """Installed version names, oldest name first"""
+        try:
+            return sorted(
+                name for name in os.listdir(self.versions_dir)
+                if os.path.isdir(os.path.join(self.versions_dir, name))
+            )
+        except OSError:
+            return []
+
+    @staticmethod
+    def validate_version(version):
+        """Raise ValueError unless version is a plain directory name inside versions/"""
+        separators = {os.sep, os.altsep, '/'} - {None}
+        if not version or version == '.' or '..' in version or any(separator in version for separator in separators):
+            raise ValueError(f"Invalid model version name: {version!r}")
+
+    def version_dir(self, version):
+        if version == LEGACY_VERSION:
+            return self.root
+        self.validate_version(version)
+        return os.path.join(self.versions_dir, version)
+
+    def paths(self, version):
+        """File paths for one version"""
+        if version == LEGACY_VERSION:
+            return {
+                'model': settings.NCF_MODEL_PATH,
+                'user_encoder': settings.NCF_USER_ENCODER_PATH,
+                'movie_encoder': settings.NCF_MOVIE_ENCODER_PATH,
+                'numpy_weights': settings.NCF_NUMPY_WEIGHTS_PATH,
+                'cold_start': settings.NCF_COLD_START_PATH,
+                'ann_index': settings.NCF_ANN_INDEX_DIR,
+            }
+
+        directory = self.version_dir(version)
+        return {
+            'model': os.path.join(directory, self.MODEL_FILE),
+            'user_encoder': os.path.join(directory, self.USER_ENCODER_FILE),
+            'movie_encoder': os.path.join(directory, self.MOVIE_ENCODER_FILE),
+            'numpy_weights': os.path.join(directory, self.NUMPY_WEIGHTS_FILE),
+            'cold_start': os.path.join(directory, self.COLD_START_FILE),
+            'ann_index': os.path.join(directory, self.ANN_INDEX_DIR),
+        }
+
+    def index_stamp(self, version):
+        """Changes whenever the retrieval index of a version is rebuilt (None if there is none)"""
+        try:
+            return os.stat(os.path.join(self.paths(version)['ann_index'], IVFIndex.META_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def revision(self, version):
+        """Changes whenever the cold-start vectors served with a version are rebuilt (None if there are none)"""
+        try:
+            return os.stat(self.paths(version)['cold_start']).st_mtime_ns
+        except OSError:
+            return None
+
+    def activate(self, version):
+        """Point CURRENT at an installed version; running services pick it up on their next check"""
+        if version != LEGACY_VERSION:
+            paths = self.paths(version)
+            missing = [
+                os.path.basename(path) for key, path in paths.items()
+                if key in ('user_encoder', 'movie_encoder') and not os.path.exists(path)
+            ]
+            if not os.path.isdir(self.version_dir(version)) or missing:
+                raise ValueError(f"Version {version} is not installed or incomplete (missing: {', '.join(missing) or 'directory'})")
+
+        tmp_path = os.path.join(self.root, self.POINTER_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp_path, os.path.join(self.root, self.POINTER_FILE))
+        logger.info(f"Activated NCF model version {version}")
+
+def get_model_registry():
+    """Registry rooted at settings.NCF_MODEL_ROOT"""
+    return ModelRegistry(settings.NCF_MODEL_ROOT)
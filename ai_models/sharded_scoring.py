@@ -0,0 +1,170 @@
+import atexit
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (user, movie) pairs per forward pass inside a worker, bounding activation memory
+PAIRS_PER_PASS = 65536
+
+# LoadedNCFModel attached by each worker process in _init_worker
+_worker_model = None
+
+def _init_worker(spec):
+    """Worker initializer: set up Django and attach to the parent's model version"""
+    global _worker_model
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from .ncf_service import LoadedNCFModel
+    from .shared_arrays import SharedArrayStore
+
+    # One thread per process; the pool itself provides the parallelism
+    settings.NCF_BACKEND = spec['backend']
+    settings.NCF_INTRA_OP_THREADS = 1
+    settings.NCF_INTER_OP_THREADS = 1
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+    shared_store = SharedArrayStore(spec['shared_dir']) if spec['shared_dir'] else None
+    _worker_model = LoadedNCFModel(spec['version'], spec['paths'], shared_store, spec['revision'])
+
+def score_top_k(model, user_encoded, candidates, top_k, excluded=None):
+    """
+    Best top_k of `candidates` (encoded movie indices) for each encoded user
+    Scores in passes of at most PAIRS_PER_PASS pairs with a running top-k. excluded holds one
+    array of encoded movie indices per user that must not be returned.
+    Returns (indices, scores) of shape (n_users, <= top_k); scores of -inf mark padding.
+    """
+    from .ncf_service import top_k_indices
+
+    user_encoded = np.asarray(user_encoded, dtype=np.int32)
+    candidates = np.asarray(candidates, dtype=np.int64)
+    columns = max(1, PAIRS_PER_PASS // max(len(user_encoded), 1))
+
+    best_indices = np.empty((len(user_encoded), 0), dtype=np.int64)
+    best_scores = np.empty((len(user_encoded), 0), dtype=np.float32)
+
+    for start in range(0, len(candidates), columns):
+        chunk = candidates[start:start + columns]
+        scores = model.score_matrix(user_encoded, chunk)
+        if excluded is not None:
+            for row, movies in enumerate(excluded):
+                if len(movies):
+                    scores[row, np.isin(chunk, movies)] = -np.inf
+
+        merged_indices = np.hstack([best_indices, np.broadcast_to(chunk, scores.shape)])
+        merged_scores = np.hstack([best_scores, scores])
+        keep = top_k_indices(merged_scores, top_k)
+        best_indices = np.take_along_axis(merged_indices, keep, axis=1)
+        best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+
+    return best_indices, best_scores
+
+def _score_shard(user_encoded, candidates, top_k, excluded):
+    """Task run in a worker: local top-k of one slice of the catalog"""
+    if isinstance(candidates, tuple):
+        candidates = np.arange(*candidates)
+    return score_top_k(_worker_model, user_encoded, candidates, top_k, excluded)
+
+class ShardedScorer:
+    """
+    Catalog scoring split across a process pool
+    Every worker loads the same model version once; with NCF_SHARED_ARRAYS the embedding
+    tables and lookups are memory-mapped from the shared store, so workers hold no private
+    copy and tasks only carry index ranges. Each task returns a local top-k for its shard
+    and the parent merges them.
+    """
+
+    def __init__(self, model, processes, shards_per_process=2):
+        from django.conf import settings
+
+        backend = getattr(settings, 'NCF_BACKEND', 'keras')
+        if backend == 'remote':
+            raise ValueError("Sharded scoring needs the model in-process (NCF_BACKEND keras or numpy)")
+
+        self.serving_key = model.serving_key
+        self.processes = processes
+        self.n_shards = processes * shards_per_process
+        self.n_movies = len(model.movie_ids)
+
+        spec = {
+            'version': model.version,
+            'paths': model._paths,
+            'shared_dir': model.shared_store.directory if model.shared_store is not None else None,
+            'revision': model.revision,
+            'backend': backend,
+        }
+        # spawn, not fork: the parent may already be running TensorFlow and batcher threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(spec,),
+        )
+        logger.info(f"Sharded NCF scorer: {processes} processes, {self.n_shards} shards ({model.serving_key})")
+
+    def top_k(self, user_encoded, top_k, candidates=None, excluded=None):
+        """
+        Best top_k encoded movies per user over candidates (default: the whole catalog)
+        Same contract as score_top_k; padding rows have -inf scores.
+        """
+        from .ncf_service import top_k_indices
+
+        user_encoded = np.asarray(user_encoded, dtype=np.int32)
+        if candidates is None:
+            bounds = np.linspace(0, self.n_movies, self.n_shards + 1).astype(int)
+            shards = [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        else:
+            shards = [shard for shard in np.array_split(np.asarray(candidates, dtype=np.int64), self.n_shards) if len(shard)]
+
+        futures = [
+            self._executor.submit(_score_shard, user_encoded, shard, top_k, excluded)
+            for shard in shards
+        ]
+        results = [future.result() for future in futures]
+        if not results:
+            return (np.empty((len(user_encoded), 0), dtype=np.int64),
+                    np.empty((len(user_encoded), 0), dtype=np.float32))
+
+        # Merge the per-shard top-k lists
+        indices = np.hstack([shard_indices for shard_indices, _ in results])
+        scores = np.hstack([shard_scores for _, shard_scores in results])
+        keep = top_k_indices(scores, top_k)
+        return np.take_along_axis(indices, keep, axis=1), np.take_along_axis(scores, keep, axis=1)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+def get_sharded_scorer(model, processes):
+    """Process-wide ShardedScorer for `model`, replacing the pool when a new version is served"""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None or _scorer.serving_key != model.serving_key or _scorer.processes != processes:
+            if _scorer is not None:
+                _scorer.close()
+            _scorer = ShardedScorer(model, processes)
+        return _scorer
+
+def discard_sharded_scorer(scorer):
+    """Close `scorer` and forget it if it is the cached one, so the next call starts a fresh pool"""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is scorer:
+            _scorer = None
+    scorer.close()
+
+@atexit.register
+def _close_scorer():
+    if _scorer is not None:
+        _scorer.close()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import hashlib
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+def source_fingerprint(paths):
+    """Short hash of the (path, size, mtime) of the files shared arrays are derived from"""
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:12]
+
+class SharedArrayStore:
+    """
+    Read-only .npy arrays memory-mapped from one directory
+    Every worker on the host maps the same files, so the page cache holds a single
+    physical copy however many processes serve the model. The first process to need
+    an array builds and writes it; the others just map it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.npy')
+
+    def get(self, name, build_fn):
+        """Map array `name`, calling build_fn() and persisting the result if it doesn't exist yet"""
+        path = self.path(name)
+        if not os.path.exists(path):
+            array = np.ascontiguousarray(build_fn())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Unique temp name so concurrent workers never write the same file; last rename wins
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+        return np.load(path, mmap_mode='r')
+
+def shared_store_dir(directory, source_paths):
+    """directory/shared/<fingerprint of source_paths>, where the arrays derived from them live"""
+    return os.path.join(directory, 'shared', source_fingerprint(source_paths))
+
+def get_shared_store(directory, source_paths):
+    """SharedArrayStore under directory/shared/<fingerprint>, or None if it can't be created"""
+    store_dir = shared_store_dir(directory, source_paths)
+    try:
+        os.makedirs(store_dir, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Shared NCF arrays disabled ({store_dir} not writable): {e}")
+        return None
+    return SharedArrayStore(store_dir)
+
+def prune_shared_stores(version_dirs, keep):
+    """
+    Delete shared/<fingerprint> stores under version_dirs other than the directories in keep
+    Processes still mapping a deleted array keep their mapping; a process that needs an
+    array from a deleted store rebuilds it.
+    """
+    keep = {os.path.abspath(directory) for directory in keep if directory}
+    for version_dir in version_dirs:
+        shared_root = os.path.join(version_dir, 'shared')
+        try:
+            entries = [entry.path for entry in os.scandir(shared_root) if entry.is_dir()]
+        except OSError:
+            continue
+        for store_dir in entries:
+            if os.path.abspath(store_dir) not in keep:
+                shutil.rmtree(store_dir, ignore_errors=True)
+                logger.info(f"Removed stale shared NCF arrays {store_dir}")
@@ -0,0 +1,836 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import threading
+import importlib.util
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+import joblib
+import numpy as np
+from scipy import sparse
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from .batching import InferenceBatcher
+from .ann_index import IVFIndex
+from .als_service import ALSModelService, LoadedALSModel, _least_squares_cg, build_confidence_matrix, save_als_model, train_als
+from .benchmark import default_keras_model
+from .cold_start import content_features, synthetic_rows, write_cold_start
+from . import inference_server
+from .inference_server import MAX_PAIRS, OP_SCORE, InferenceServerError, NCFInferenceClient, NCFInferenceServer
+from .ncf_service import LoadedNCFModel, NCFModelService, UNKNOWN_INDEX, catalog_mask
+from . import numpy_engine
+from .numpy_engine import FORMAT_VERSION, TOPOLOGY_KEY, NumpyNCFEngine, export_keras_model, quantize_embeddings
+from .registry import LEGACY_VERSION, ModelRegistry
+from movies.models import Genre, Movie, MovieTag
+from .shared_arrays import prune_shared_stores, shared_store_dir
+from . import sharded_scoring
+from . import topk_store
+from .topk_store import PAD_MOVIE_ID, TopKStore, get_topk_store
+
+# Default --tolerance of export_ncf_weights for float32 exports
+PARITY_ATOL = 1e-4
+
+def write_dot_export(path, user_vectors, movie_vectors):
+    """NumPy engine export of sigmoid(user . movie), so service tests don't need TensorFlow"""
+    topology = {
+        'format_version': FORMAT_VERSION,
+        'inputs': ['user_input', 'movie_input'],
+        'outputs': ['score'],
+        'layers': [
+            {'name': 'user_input', 'class': 'InputLayer', 'inbound': []},
+            {'name': 'movie_input', 'class': 'InputLayer', 'inbound': []},
+            {'name': 'user_embedding', 'class': 'Embedding', 'inbound': ['user_input'], 'dtype': 'float32'},
+            {'name': 'movie_embedding', 'class': 'Embedding', 'inbound': ['movie_input'], 'dtype': 'float32'},
+            {'name': 'dot', 'class': 'Dot', 'inbound': ['user_embedding', 'movie_embedding'], 'axes': 1, 'normalize': False},
+            {'name': 'score', 'class': 'Activation', 'inbound': ['dot'], 'activation': 'sigmoid'},
+        ],
+        'metadata': {},
+    }
+    with open(path, 'wb') as f:
+        np.savez(f, **{
+            TOPOLOGY_KEY: np.array(json.dumps(topology)),
+            'user_embedding/embeddings': np.asarray(user_vectors, dtype=np.float32),
+            'movie_embedding/embeddings': np.asarray(movie_vectors, dtype=np.float32),
+        })
+
+def install_test_model(registry, version, user_ids, movie_ids, user_vectors, movie_vectors, activate=True):
+    """Install a write_dot_export model with encoders for user_ids/movie_ids under registry"""
+    from sklearn.preprocessing import LabelEncoder
+
+    paths = registry.paths(version)
+    os.makedirs(registry.version_dir(version), exist_ok=True)
+    joblib.dump(LabelEncoder().fit(user_ids), paths['user_encoder'])
+    joblib.dump(LabelEncoder().fit(movie_ids), paths['movie_encoder'])
+    write_dot_export(paths['numpy_weights'], user_vectors, movie_vectors)
+    if activate:
+        registry.activate(version)
+
+@override_settings(NCF_BACKEND='numpy', NCF_SHARED_ARRAYS=False, NCF_ANN_ENABLED=False,
+                   NCF_BATCHING_ENABLED=False, NCF_SHARDED_PROCESSES=0)
+class TestModelCase(SimpleTestCase):
+    """
+    A NumPy-engine NCF model over random vectors, served from a temporary registry
+    Users are 1..n_users, movies are 10, 20, ... so unused IDs sit between known ones.
+    """
+    n_users = 20
+    n_movies = 300
+    dims = 8
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.rng = np.random.default_rng(0)
+        self.user_ids = np.arange(1, self.n_users + 1)
+        self.movie_ids = np.arange(1, self.n_movies + 1) * 10
+        self.user_vectors = self.rng.normal(size=(self.n_users, self.dims)).astype(np.float32)
+        self.movie_vectors = self.rng.normal(size=(self.n_movies, self.dims)).astype(np.float32)
+
+        self.registry = ModelRegistry(self.directory.name)
+        install_test_model(self.registry, 'v1', self.user_ids, self.movie_ids, self.user_vectors, self.movie_vectors)
+        self.service = NCFModelService.for_registry(self.registry, filter_catalog=False)
+
+    def exact_scores(self, user_id):
+        """Scores of every movie for user_id straight from the planted vectors"""
+        logits = self.movie_vectors @ self.user_vectors[user_id - 1]
+        return 0.5 * (np.tanh(0.5 * logits) + 1.0)
+
+class LookupTableTests(TestModelCase):
+    def test_unknown_ids_map_to_unknown_index(self):
+        encoded = self.service.encode_movie_ids([10, 15, 3000, 3010, -1, 0])
+        np.testing.assert_array_equal(encoded, [0, UNKNOWN_INDEX, 299, UNKNOWN_INDEX, UNKNOWN_INDEX, UNKNOWN_INDEX])
+
+        self.assertEqual(self.service.encode_user_id(20), 19)
+        for user_id in (0, 21, -5, 'abc', None):
+            self.assertIsNone(self.service.encode_user_id(user_id))
+
+    def test_compiled_lookup_matches_the_encoder(self):
+        lookup = LoadedNCFModel._compile_lookup([4, 2, 9])
+        np.testing.assert_array_equal(lookup, [-1, -1, 1, -1, 0, -1, -1, -1, -1, 2])
+
+class InferenceBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+
+        def score(key, user_array, movie_array):
+            self.calls.append((key, len(movie_array)))
+            return (user_array * 1000 + movie_array).astype(np.float32)
+
+        self.batcher = InferenceBatcher(score, window_ms=50)
+
+    def submit_concurrently(self, requests):
+        results = [None] * len(requests)
+        barrier = threading.Barrier(len(requests))
+
+        def worker(i, key, users, movies):
+            barrier.wait()
+            results[i] = self.batcher.submit(users, movies, key=key)
+
+        threads = [threading.Thread(target=worker, args=(i, *request)) for i, request in enumerate(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_one_forward_pass(self):
+        requests = [('v1', np.full(3, user), np.arange(3)) for user in range(4)]
+        results = self.submit_concurrently(requests)
+
+        self.assertEqual(self.calls, [('v1', 12)])
+        for (_, users, movies), result in zip(requests, results):
+            np.testing.assert_array_equal(result, users * 1000 + movies)
+
+    def test_model_versions_are_never_mixed(self):
+        results = self.submit_concurrently([
+            ('v1', np.full(2, 1), np.arange(2)),
+            ('v2', np.full(2, 2), np.arange(2)),
+        ])
+
+        self.assertEqual(sorted(self.calls), [('v1', 2), ('v2', 2)])
+        np.testing.assert_array_equal(results[1], [2000, 2001])
+
+    def test_scoring_errors_reach_the_caller(self):
+        batcher = InferenceBatcher(lambda key, users, movies: 1 / 0, window_ms=1)
+        with self.assertRaises(ZeroDivisionError):
+            batcher.submit(np.zeros(1), np.zeros(1))
+
+class ScorePairsRoutingTests(SimpleTestCase):
+    class Model:
+        def run_model(self, user_array, movie_array):
+            return np.zeros(len(movie_array), dtype=np.float32)
+
+    class Batcher:
+        max_batch_size = 100
+
+        def __init__(self):
+            self.submitted = []
+
+        def submit(self, user_array, movie_array, key=None):
+            self.submitted.append(len(movie_array))
+            return np.zeros(len(movie_array), dtype=np.float32)
+
+    def setUp(self):
+        self.service = object.__new__(NCFModelService)
+        self.service._batcher = self.Batcher()
+
+    def test_small_requests_are_batched(self):
+        self.service._score_pairs(self.Model(), np.zeros(10), np.zeros(10))
+        self.assertEqual(self.service._batcher.submitted, [10])
+
+    def test_catalog_scans_and_full_batches_bypass_the_batcher(self):
+        self.service._score_pairs(self.Model(), np.zeros(10), np.zeros(10), batch=False)
+        self.service._score_pairs(self.Model(), np.zeros(100), np.zeros(100))
+        self.assertEqual(self.service._batcher.submitted, [])
+
+@unittest.skipUnless(importlib.util.find_spec('tensorflow'), "TensorFlow is not installed")
+class NumpyEngineParityTests(SimpleTestCase):
+    def test_numpy_engine_matches_keras(self):
+        n_users, n_movies = 50, 80
+        model = default_keras_model(n_users, n_movies)
+
+        # Non-trivial batch norm statistics, so the test covers more than the identity transform
+        rng = np.random.default_rng(0)
+        for layer in model.layers:
+            if type(layer).__name__ == 'BatchNormalization':
+                gamma, beta, mean, variance = layer.get_weights()
+                layer.set_weights([
+                    rng.uniform(0.5, 1.5, gamma.shape), rng.normal(0, 0.1, beta.shape),
+                    rng.normal(0, 0.1, mean.shape), rng.uniform(0.5, 1.5, variance.shape),
+                ])
+
+        user_array = rng.integers(0, n_users, 2000).astype(np.int32)
+        movie_array = rng.integers(0, n_movies, 2000).astype(np.int32)
+        expected = np.asarray(model([user_array.reshape(-1, 1), movie_array.reshape(-1, 1)], training=False)).reshape(-1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ncf.npz')
+            export_keras_model(model, path)
+            actual = NumpyNCFEngine.load(path).predict(user_array, movie_array)
+
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=PARITY_ATOL)
+
+class QuantizeEmbeddingsTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Rows on very different scales, so a shared int8 scale would lose the small ones
+        self.table = (rng.normal(size=(200, 16)) * rng.uniform(0.01, 10, (200, 1))).astype(np.float32)
+        self.table[3] = 0.0
+
+    def dequantized(self, dtype):
+        weights = quantize_embeddings(self.table, dtype)
+        engine = NumpyNCFEngine({'format_version': FORMAT_VERSION, 'inputs': [], 'outputs': [], 'layers': []},
+                                {f"movie/{name}": array for name, array in weights.items()})
+        return weights, engine.gather('movie', np.arange(len(self.table)))
+
+    def test_float16_error_is_within_half_precision(self):
+        weights, restored = self.dequantized('float16')
+        self.assertEqual(weights['embeddings'].dtype, np.float16)
+        np.testing.assert_allclose(restored, self.table, rtol=2 ** -11, atol=0)
+
+    def test_int8_error_is_within_half_a_step_per_row(self):
+        weights, restored = self.dequantized('int8')
+        self.assertEqual(weights['embeddings'].dtype, np.int8)
+
+        step = np.abs(self.table).max(axis=1, keepdims=True) / 127
+        self.assertTrue(np.all(np.abs(restored - self.table) <= step / 2 + 1e-7))
+        np.testing.assert_array_equal(restored[3], 0.0)
+
+    def test_unknown_dtype_is_rejected(self):
+        with self.assertRaises(ValueError):
+            quantize_embeddings(self.table, 'int4')
+
+@unittest.skipUnless(importlib.util.find_spec('tensorflow'), "TensorFlow is not installed")
+class ExportNCFWeightsTests(SimpleTestCase):
+    def setUp(self):
+        from sklearn.preprocessing import LabelEncoder
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.registry = ModelRegistry(directory.name)
+        paths = self.registry.paths('v1')
+        os.makedirs(self.registry.version_dir('v1'))
+        joblib.dump(LabelEncoder().fit(np.arange(1, 41)), paths['user_encoder'])
+        joblib.dump(LabelEncoder().fit(np.arange(1, 201)), paths['movie_encoder'])
+
+        # Trained-looking embeddings: random initialisation leaves every score near 0.5
+        model = default_keras_model(40, 200)
+        rng = np.random.default_rng(0)
+        for layer in model.layers:
+            if type(layer).__name__ == 'Embedding':
+                layer.set_weights([rng.normal(0, 1, layer.get_weights()[0].shape)])
+        model.save(paths['model'])
+        self.registry.activate('v1')
+        self.output = paths['numpy_weights']
+
+    def export(self, *args):
+        with override_settings(NCF_MODEL_ROOT=self.registry.root):
+            call_command('export_ncf_weights', '--verify-samples', '2000', '--report-users', '20', *args,
+                         stdout=io.StringIO())
+
+    def test_int8_export_passes_the_overlap_gate(self):
+        self.export('--embedding-dtype', 'int8')
+
+        with open(os.path.splitext(self.output)[0] + '.report.json') as f:
+            report = json.load(f)
+        self.assertGreaterEqual(report['topk_overlap_mean'], 0.9)
+        self.assertLess(report['embedding_mb'], report['embedding_mb_float32'] / 3)
+        self.assertTrue(os.path.exists(self.output))
+
+    def test_export_that_changes_the_ranking_is_rejected(self):
+        quantize = numpy_engine.quantize_embeddings
+
+        def shuffled(table, dtype):
+            return quantize(np.random.default_rng(1).permutation(np.asarray(table)), dtype)
+
+        with mock.patch.object(numpy_engine, 'quantize_embeddings', shuffled):
+            with self.assertRaisesRegex(CommandError, 'change the ranking too much'):
+                self.export('--embedding-dtype', 'int8')
+        self.assertFalse(os.path.exists(self.output))
+        self.assertFalse(os.path.exists(self.output + '.tmp'))
+
+class PruneSharedStoresTests(SimpleTestCase):
+    def test_only_kept_stores_survive(self):
+        with tempfile.TemporaryDirectory() as root:
+            stores = {
+                name: os.path.join(root, version, 'shared', name)
+                for version, name in (('v1', 'old'), ('v2', 'previous'), ('v2', 'stale'), ('v3', 'current'))
+            }
+            for directory in stores.values():
+                os.makedirs(directory)
+
+            prune_shared_stores(
+                [os.path.join(root, version) for version in ('v1', 'v2', 'v3', 'missing')],
+                [stores['current'], stores['previous']],
+            )
+
+            remaining = {name for name, directory in stores.items() if os.path.isdir(directory)}
+            self.assertEqual(remaining, {'current', 'previous'})
+
+class CatalogMaskTests(SimpleTestCase):
+    class Model:
+        def __init__(self, movie_ids, filter_catalog=True):
+            self.movie_ids = np.asarray(movie_ids)
+            self.filter_catalog = filter_catalog
+
+    def test_movies_outside_the_catalog_are_masked(self):
+        snapshot = mock.Mock(contains=lambda movie_ids: np.isin(movie_ids, [1, 3]))
+        with mock.patch('movies.catalog.get_catalog', return_value=snapshot):
+            mask = catalog_mask(self.Model([1, 2, 3]))
+        np.testing.assert_array_equal(mask, [True, False, True])
+
+    def test_unfiltered_models_keep_every_movie(self):
+        with mock.patch('movies.catalog.get_catalog') as get_catalog:
+            mask = catalog_mask(self.Model([1, 2, 3], filter_catalog=False))
+        np.testing.assert_array_equal(mask, [True, True, True])
+        get_catalog.assert_not_called()
+
+class ChunkedRecommendTests(TestModelCase):
+    def brute_force(self, user_id, top_k, exclude=()):
+        scores = self.exact_scores(user_id)
+        scores[np.isin(self.movie_ids, exclude)] = -np.inf
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        return self.movie_ids[order].tolist(), scores[order]
+
+    def test_matches_brute_force_argsort(self):
+        for user_id in (1, 7, 20):
+            for chunk_size in (1, 7, 64, 10000):
+                results = self.service.recommend(user_id, top_k=25, chunk_size=chunk_size)
+                expected_ids, expected_scores = self.brute_force(user_id, 25)
+
+                self.assertEqual([movie_id for movie_id, _ in results], expected_ids)
+                np.testing.assert_allclose([score for _, score in results], expected_scores, rtol=1e-5)
+
+    def test_excluded_movies_are_skipped(self):
+        exclude = self.brute_force(3, 5)[0]
+        results = self.service.recommend(3, exclude_movie_ids=exclude, top_k=10, chunk_size=16)
+        self.assertEqual([movie_id for movie_id, _ in results], self.brute_force(3, 10, exclude)[0])
+
+    def test_unknown_user_gets_nothing(self):
+        self.assertEqual(self.service.recommend(999, top_k=10), [])
+
+    def test_recommend_many_matches_recommend(self):
+        user_ids = [3, 999, 1, 20, 7, 3]
+        exclude = {1: self.brute_force(1, 5)[0], 7: [10, 20, 30]}
+        results = list(self.service.recommend_many(user_ids, exclude_movie_ids=exclude, top_k=15, block_users=4))
+
+        self.assertEqual([user_id for user_id, _ in results], user_ids)
+        for user_id, recommendations in results:
+            expected = self.service.recommend(user_id, exclude_movie_ids=exclude.get(user_id, ()), top_k=15)
+            self.assertEqual([movie_id for movie_id, _ in recommendations], [movie_id for movie_id, _ in expected])
+            np.testing.assert_allclose([score for _, score in recommendations], [score for _, score in expected], rtol=1e-5)
+
+class BrokenScorer:
+    """Stands in for a ShardedScorer whose pool lost a worker"""
+    serving_key = None
+    processes = 2
+    closed = False
+
+    def top_k(self, *args, **kwargs):
+        raise BrokenProcessPool('a worker died')
+
+    def close(self):
+        self.closed = True
+
+@override_settings(NCF_SHARDED_PROCESSES=2, NCF_SHARDED_MIN_CANDIDATES=1)
+class ShardedScoringFallbackTests(TestModelCase):
+    def setUp(self):
+        super().setUp()
+        self.scorer = BrokenScorer()
+        patcher = mock.patch.object(sharded_scoring, '_scorer', self.scorer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('ai_models.ncf_service.get_sharded_scorer', return_value=self.scorer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expected(self, user_id, top_k):
+        scores = self.exact_scores(user_id)
+        return self.movie_ids[np.argsort(-scores, kind='stable')[:top_k]].tolist()
+
+    def assertDiscarded(self):
+        self.assertTrue(self.scorer.closed)
+        self.assertIsNone(sharded_scoring._scorer)
+
+    def test_recommend_scores_in_process(self):
+        results = self.service.recommend(4, top_k=10)
+        self.assertEqual([movie_id for movie_id, _ in results], self.expected(4, 10))
+        self.assertDiscarded()
+
+    def test_recommend_many_scores_in_process(self):
+        results = dict(self.service.recommend_many([2, 999, 5], top_k=10))
+        self.assertEqual([movie_id for movie_id, _ in results[2]], self.expected(2, 10))
+        self.assertEqual([movie_id for movie_id, _ in results[5]], self.expected(5, 10))
+        self.assertEqual(results[999], [])
+        self.assertDiscarded()
+
+    def test_top_recommendations_score_in_process(self):
+        results = self.service.get_top_recommendations(6, self.movie_ids.tolist(), top_k=10)
+        self.assertEqual(results, self.expected(6, 10))
+        self.assertDiscarded()
+
+class ModelRegistryTests(TestModelCase):
+    def test_activate_rejects_missing_and_incomplete_versions(self):
+        with self.assertRaises(ValueError):
+            self.registry.activate('v9')
+
+        os.makedirs(self.registry.version_dir('v2'))
+        with self.assertRaises(ValueError):
+            self.registry.activate('v2')
+        self.assertEqual(self.registry.current_version(), 'v1')
+
+    def test_version_names_must_stay_inside_versions(self):
+        for name in ('../x', '..', 'a/b', 'a/../../b', '', '.'):
+            with self.assertRaises(ValueError):
+                self.registry.activate(name)
+        self.assertEqual(self.registry.current_version(), 'v1')
+
+    def test_legacy_layout_without_pointer(self):
+        root = os.path.join(self.directory.name, 'flat')
+        os.makedirs(root)
+        legacy = {
+            'NCF_USER_ENCODER_PATH': os.path.join(root, 'user_encoder.pkl'),
+            'NCF_MOVIE_ENCODER_PATH': os.path.join(root, 'movie_encoder.pkl'),
+            'NCF_NUMPY_WEIGHTS_PATH': os.path.join(root, 'max_performance_ncf.npz'),
+            'NCF_COLD_START_PATH': os.path.join(root, 'cold_start_vectors.npz'),
+            'NCF_ANN_INDEX_DIR': os.path.join(root, 'ann'),
+        }
+        for name in ('user_encoder', 'movie_encoder', 'numpy_weights'):
+            shutil.copy(self.registry.paths('v1')[name], legacy[f'NCF_{name.upper()}_PATH'])
+
+        registry = ModelRegistry(root)
+        self.assertEqual(registry.current_version(), LEGACY_VERSION)
+        self.assertEqual(registry.version_dir(LEGACY_VERSION), root)
+        with override_settings(**legacy):
+            model = NCFModelService.for_registry(registry, filter_catalog=False).current_model()
+        self.assertEqual(model.version, LEGACY_VERSION)
+        self.assertEqual(len(model.movie_ids), self.n_movies)
+
+    def test_activated_version_is_swapped_in_the_background(self):
+        old = self.service.current_model()
+        install_test_model(self.registry, 'v2', self.user_ids, self.movie_ids, -self.user_vectors, self.movie_vectors)
+
+        self.service.check_for_update(force=True)
+        self.service._reload_thread.join(10)
+
+        new = self.service.current_model()
+        self.assertEqual(new.version, 'v2')
+        self.assertEqual(new.serving_key, 'v2')
+        # Requests that grabbed the old model keep scoring with it
+        self.assertEqual(old.version, 'v1')
+        score = float(old.run_model(np.array([0]), np.array([0]))[0])
+        self.assertAlmostEqual(score, self.exact_scores(1)[0], places=5)
+        self.assertAlmostEqual(float(new.run_model(np.array([0]), np.array([0]))[0]), 1 - score, places=5)
+
+    def test_unchanged_registry_starts_no_reload(self):
+        self.service.check_for_update(force=True)
+        self.assertIsNone(self.service._reload_thread)
+
+class InferenceServerTests(TestModelCase):
+    def setUp(self):
+        super().setUp()
+        self.socket_path = os.path.join(self.directory.name, 'ncf.sock')
+        self.start_server()
+        self.client = NCFInferenceClient(self.socket_path, pool_size=2, timeout=5)
+        self.addCleanup(self.client.close)
+
+    def start_server(self):
+        server = NCFInferenceServer(self.socket_path, self.service)
+        thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        thread.start()
+        self.server = server
+        self.addCleanup(self.stop_server, server)
+
+    def stop_server(self, server):
+        server.shutdown()
+        server.server_close()
+
+    def test_round_trip(self):
+        users, movies = np.array([0, 4, 19]), np.array([0, 100, 299])
+        np.testing.assert_allclose(
+            self.client.score('v1', users, movies),
+            [self.exact_scores(user + 1)[movie] for user, movie in zip(users, movies)], rtol=1e-5,
+        )
+
+        info = self.client.info()
+        self.assertEqual((info['serving_key'], info['n_movies']), ('v1', self.n_movies))
+        np.testing.assert_array_equal(self.client.item_embeddings('v1'), self.service.current_model().item_embeddings)
+
+    def test_oversized_requests_are_refused(self):
+        with self.assertRaisesRegex(InferenceServerError, 'Too many pairs'):
+            self.client._request(OP_SCORE, 'v1', MAX_PAIRS + 1)
+        # The server dropped that connection; the next request retries on a fresh one
+        self.assertEqual(len(self.client.score('v1', [0], [0])), 1)
+
+    def test_pooled_connection_to_a_restarted_server_is_retried(self):
+        self.client.score('v1', [0], [0])
+        self.stop_server(self.server)
+        self.start_server()
+
+        np.testing.assert_allclose(self.client.score('v1', [0], [0]), self.exact_scores(1)[:1], rtol=1e-5)
+
+    def test_version_mismatch_falls_back_to_local_scoring(self):
+        inference_server._client = None
+        self.addCleanup(setattr, inference_server, '_client', None)
+        with override_settings(NCF_BACKEND='remote', NCF_SERVER_SOCKET=self.socket_path):
+            remote = NCFModelService.for_registry(self.registry, filter_catalog=False)
+
+        # The server moves on to v2 while this worker still serves v1
+        install_test_model(self.registry, 'v2', self.user_ids, self.movie_ids, -self.user_vectors, self.movie_vectors)
+        self.service.check_for_update(force=True)
+        self.service._reload_thread.join(10)
+        self.assertEqual(self.client.info()['serving_key'], 'v2')
+
+        results = remote.recommend(1, top_k=5)
+        expected = np.argsort(-self.exact_scores(1))[:5]
+        self.assertEqual([movie_id for movie_id, _ in results], self.movie_ids[expected].tolist())
+        self.assertIsNotNone(remote.current_model().local)
+
+class ContentFeatureTests(TestCase):
+    def movie(self, title, year, genres=(), tags=()):
+        movie = Movie.objects.create(title=title, plot='', release_year=year, duration_minutes=100)
+        movie.genres.add(*genres)
+        for tag in tags:
+            MovieTag.objects.create(movie=movie, tag=tag)
+        return movie.id
+
+    def test_similar_content_scores_higher(self):
+        drama, comedy = Genre.objects.create(name='Drama'), Genre.objects.create(name='Comedy')
+        ids = [
+            self.movie('A', 1994, [drama], ['dark']),
+            self.movie('B', 1996, [drama], ['dark']),
+            self.movie('C', 2015, [comedy], ['only-once']),
+            self.movie('D', 2019, [comedy]),
+            self.movie('E', 0),
+        ]
+
+        features = content_features(ids)
+        self.assertTrue(sparse.issparse(features))
+        # 2 genres, 1 tag shared by two movies ('only-once' is dropped), 2 decades
+        self.assertEqual(features.shape, (5, 5))
+
+        similarity = (features @ features.T).toarray()
+        np.testing.assert_allclose(np.diag(similarity)[:4], 1.0, rtol=1e-6)
+        self.assertAlmostEqual(similarity[0, 1], 1.0, places=6)
+        self.assertGreater(similarity[2, 3], 0.5)
+        self.assertEqual(similarity[0, 2], 0.0)
+        self.assertEqual(features[4].nnz, 0)
+
+class ColdStartVectorTests(TestModelCase):
+    def test_new_movie_copies_its_nearest_trained_rows(self):
+        trained = np.eye(3, dtype=np.float32)
+        new = np.array([[0, 1, 0], [0, 0, 0]], dtype=np.float32)
+        tables = {'movie_embedding': np.arange(6, dtype=np.float32).reshape(3, 2)}
+
+        kept, rows = synthetic_rows(tables, sparse.csr_matrix(trained), sparse.csr_matrix(new), neighbors=2)
+        np.testing.assert_array_equal(kept, [True, False])
+        np.testing.assert_array_equal(rows['movie_embedding'], [[2, 3]])
+
+    def test_extended_engine_serves_appended_rows(self):
+        engine = self.service.current_model().engine
+        extra = self.rng.normal(size=(2, self.dims)).astype(np.float32)
+        engine.extend_embeddings({'movie_embedding': extra}, self.n_movies)
+
+        np.testing.assert_array_equal(engine.gather('movie_embedding', np.array([self.n_movies + 1, 0])),
+                                      [extra[1], self.movie_vectors[0]])
+        self.assertEqual(len(engine.gather('movie_embedding', np.s_[:])), self.n_movies + 2)
+        with self.assertRaises(ValueError):
+            engine.extend_embeddings({'movie_embedding': extra}, self.n_movies + 1)
+
+    def test_cold_start_movies_are_scored_and_reloaded(self):
+        extra = np.tile(self.user_vectors[0], (1, 1)) * 10
+        write_cold_start(self.registry.paths('v1')['cold_start'], [5], {'movie_embedding': extra}, meta={})
+
+        self.service.check_for_update(force=True)
+        self.service._reload_thread.join(10)
+        model = self.service.current_model()
+
+        self.assertIsNotNone(model.revision)
+        self.assertEqual(model.encode_movie_id(5), self.n_movies)
+        self.assertEqual(model.n_trained_movies, self.n_movies)
+        self.assertEqual(self.service.recommend(1, top_k=1)[0][0], 5)
+
+class BuildColdStartVectorsTests(TestCase):
+    def test_only_stale_shared_stores_are_removed(self):
+        genre = Genre.objects.create(name='Drama')
+        movie_ids = []
+        for i in range(6):
+            movie = Movie.objects.create(title=f'Movie {i}', plot='', release_year=2000, duration_minutes=100)
+            movie.genres.add(genre)
+            movie_ids.append(movie.id)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        registry = ModelRegistry(directory.name)
+        rng = np.random.default_rng(0)
+        install_test_model(registry, 'v1', np.arange(1, 4), movie_ids[:4], rng.normal(size=(3, 4)), rng.normal(size=(4, 4)))
+
+        version_dir = registry.version_dir('v1')
+        served = shared_store_dir(version_dir, registry.paths('v1').values())
+        stale = os.path.join(version_dir, 'shared', 'stale')
+        for store in (served, stale):
+            os.makedirs(store)
+
+        with override_settings(NCF_MODEL_ROOT=directory.name, NCF_BACKEND='numpy', NCF_SHARED_ARRAYS=False):
+            call_command('build_cold_start_vectors', stdout=io.StringIO())
+
+        self.assertTrue(os.path.isdir(served))
+        self.assertFalse(os.path.exists(stale))
+        with np.load(registry.paths('v1')['cold_start']) as data:
+            self.assertEqual(sorted(data['movie_ids'].tolist()), movie_ids[4:])
+
+class BuildANNIndexTests(TestModelCase):
+    n_users = 200
+    n_movies = 400
+
+    def build(self, nprobe, *args):
+        with override_settings(NCF_MODEL_ROOT=self.registry.root, NCF_ANN_NPROBE=nprobe, NCF_ANN_CANDIDATES=100):
+            call_command('build_ncf_ann_index', '--lists', '20', '--nprobe', '1', '--sample-users', '40', *args,
+                         stdout=io.StringIO())
+
+    def test_index_within_recall_is_saved_and_served(self):
+        # Probing every list with 100 candidates finds the exact top 20
+        self.build(20)
+        index = IVFIndex.load(self.registry.paths('v1')['ann_index'])
+        self.assertEqual(index.meta['recall_at_k'], 1.0)
+
+        with override_settings(NCF_ANN_ENABLED=True, NCF_ANN_NPROBE=20, NCF_ANN_CANDIDATES=100):
+            self.service.check_for_update(force=True)
+            self.service._reload_thread.join(10)
+            self.assertIsNotNone(self.service.current_model().ann_index)
+
+            for user_id in (1, 50, 200):
+                expected = self.movie_ids[np.argsort(-self.exact_scores(user_id))[:20]]
+                results = self.service.recommend(user_id, top_k=20)
+                self.assertEqual([movie_id for movie_id, _ in results], expected.tolist())
+
+    def test_index_below_min_recall_is_not_saved(self):
+        with self.assertRaisesRegex(CommandError, 'index not saved'):
+            self.build(1)
+        self.assertIsNone(IVFIndex.load(self.registry.paths('v1')['ann_index']))
+
+        self.build(1, '--min-recall', '0')
+        self.assertLess(IVFIndex.load(self.registry.paths('v1')['ann_index']).meta['recall_at_k'], 0.9)
+
+class ALSTests(SimpleTestCase):
+    n_users, n_movies, alpha, regularization = 40, 30, 10.0, 0.05
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = os.path.join(self.directory, 'als.npz')
+
+        # Two tastes: the first half of the users watch the first half of the movies, and vice versa
+        rng = np.random.default_rng(0)
+        self.group = np.arange(self.n_users) >= self.n_users // 2
+        self.movie_group = np.arange(self.n_movies) >= self.n_movies // 2
+        watched = (self.group[:, None] == self.movie_group[None, :]) & (rng.random((self.n_users, self.n_movies)) < 0.6)
+        rows, cols = np.nonzero(watched)
+        self.user_ids = np.arange(1, self.n_users + 1) * 3
+        self.movie_ids = np.arange(1, self.n_movies + 1) * 10
+        self.users, self.movies, self.confidence = build_confidence_matrix(
+            self.user_ids[rows], self.movie_ids[cols], np.ones(len(rows), dtype=np.float32), self.alpha
+        )
+
+    def loss(self, user_factors, item_factors):
+        """The implicit ALS objective: confidence-weighted squared error plus L2"""
+        confidence = self.confidence.toarray()
+        errors = (confidence > 0) - user_factors @ item_factors.T
+        return float(
+            ((1 + confidence) * errors ** 2).sum()
+            + self.regularization * ((user_factors ** 2).sum() + (item_factors ** 2).sum())
+        )
+
+    def train(self, iterations, factors=4):
+        return train_als(self.confidence, factors=factors, regularization=self.regularization, iterations=iterations)
+
+    def save(self, user_factors, item_factors):
+        return save_als_model(self.path, self.users, self.movies, user_factors, item_factors,
+                              {'alpha': self.alpha, 'regularization': self.regularization})
+
+    def service(self):
+        service = object.__new__(ALSModelService)
+        service._setup(self.path)
+        return service
+
+    def test_confidence_matrix(self):
+        users, movies, confidence = build_confidence_matrix(
+            np.array([5, 5, 7, 9, 9, 5]), np.array([100, 100, 200, 100, 300, 300]),
+            np.array([1, 0.5, -1, 2, -0.5, 1], dtype=np.float32), alpha=10.0,
+        )
+
+        # Repeats add up; negative totals are dropped, with the user and movie left without pairs
+        self.assertEqual(users.tolist(), [5, 9])
+        self.assertEqual(movies.tolist(), [100, 300])
+        np.testing.assert_allclose(confidence.toarray(), [[15, 10], [20, 0]])
+        self.assertEqual(confidence.nnz, 3)
+        self.assertEqual(confidence.dtype, np.float32)
+
+    def test_cg_half_step_matches_exact_solve(self):
+        rng = np.random.default_rng(1)
+        X = rng.normal(0, 0.1, (len(self.users), 4)).astype(np.float32)
+        Y = rng.normal(0, 0.1, (len(self.movies), 4)).astype(np.float32)
+        _least_squares_cg(self.confidence, X, Y, self.regularization, cg_steps=8)
+
+        confidence = self.confidence.toarray()
+        for u in range(len(self.users)):
+            c = confidence[u]
+            A = Y.T @ Y + (Y.T * c) @ Y + self.regularization * np.eye(4)
+            expected = np.linalg.solve(A, ((c + 1) * (c > 0)) @ Y)
+            np.testing.assert_allclose(X[u], expected, rtol=1e-3, atol=1e-4)
+
+    def test_loss_decreases_and_structure_is_recovered(self):
+        losses = [self.loss(*self.train(iterations)) for iterations in (1, 2, 5, 10)]
+        self.assertEqual(losses, sorted(losses, reverse=True))
+        self.assertLess(losses[-1], losses[0] * 0.8)
+
+        user_factors, item_factors = self.train(10)
+        scores = user_factors @ item_factors.T
+        same_taste = self.group[np.searchsorted(self.user_ids, self.users)][:, None] == \
+            self.movie_group[np.searchsorted(self.movie_ids, self.movies)][None, :]
+        self.assertGreater(scores[same_taste].mean(), scores[~same_taste].mean() + 0.5)
+
+    def test_save_and_load(self):
+        user_factors, item_factors = self.train(2)
+        meta = self.save(user_factors, item_factors)
+        model = LoadedALSModel(self.path)
+
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+        self.assertTrue(meta['version'].startswith('als-'))
+        self.assertEqual(model.meta, meta)
+        self.assertEqual(model.version, meta['version'])
+        np.testing.assert_array_equal(model.user_ids, self.users)
+        np.testing.assert_array_equal(model.movie_ids, self.movies)
+        np.testing.assert_array_equal(model.user_factors, user_factors)
+        np.testing.assert_array_equal(model.item_factors, item_factors)
+        self.assertEqual(model.encode_user_id(int(self.users[3])), 3)
+        self.assertIsNone(model.encode_user_id(-1))
+
+    def test_fold_in(self):
+        self.save(*self.train(10))
+        service = self.service()
+        model = service.current_model()
+        model.filter_catalog = False
+
+        # Fold-in is the exact user solve against the fixed movie factors
+        weights = self.confidence.toarray()[0] / self.alpha
+        vector = service.fold_in_user(self.movies.tolist(), weights)
+        Y, c = model.item_factors, self.confidence.toarray()[0]
+        expected = np.linalg.solve(Y.T @ Y + (Y.T * c) @ Y + self.regularization * np.eye(4), ((c + 1) * (c > 0)) @ Y)
+        np.testing.assert_allclose(vector, expected, rtol=1e-3, atol=1e-4)
+
+        # A new user who watched a few movies of one taste gets the rest of that taste first
+        liked = self.movies[self.movie_group[np.searchsorted(self.movie_ids, self.movies)]][:3]
+        recommendations = service.recommend_for_vector(service.fold_in_user(liked.tolist(), [1.0] * 3), exclude_movie_ids=liked, top_k=5)
+        recommended = np.array([movie_id for movie_id, _ in recommendations])
+        self.assertTrue(self.movie_group[np.searchsorted(self.movie_ids, recommended)].all())
+        self.assertFalse(np.isin(recommended, liked).any())
+
+        self.assertIsNone(service.fold_in_user([999999], [1.0]))
+        self.assertIsNone(service.fold_in_user(self.movies[:2].tolist(), [0.0, -1.0]))
+
+    def test_background_reload(self):
+        self.save(*self.train(1))
+        service = self.service()
+        first = service.current_model()
+
+        # An unchanged file is not reloaded
+        service.check_for_update(force=True)
+        self.assertIsNone(service._reload_thread)
+
+        user_factors, item_factors = self.train(3)
+        self.save(user_factors, item_factors)
+        stamp = os.stat(self.path).st_mtime_ns + 10 ** 9
+        os.utime(self.path, ns=(stamp, stamp))
+
+        service.check_for_update(force=True)
+        service._reload_thread.join(10)
+        self.assertIsNot(service.current_model(), first)
+        self.assertEqual(service.current_model().stamp, f"als-{stamp}")
+        np.testing.assert_array_equal(service.current_model().item_factors, item_factors)
+
+class TopKStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        topk_store._store = topk_store._store_stamp = None
+        self.addCleanup(setattr, topk_store, '_store_stamp', None)
+
+    def write(self, offset, meta=None):
+        return TopKStore.write(
+            self.root, [7, 3],
+            [[70 + offset, 71 + offset], [30 + offset, PAD_MOVIE_ID]],
+            [[0.9, 0.8], [0.5, 0.0]],
+            meta or {'serving_key': f'v{offset}'},
+        )
+
+    def test_round_trip(self):
+        store = TopKStore(self.write(0))
+
+        self.assertEqual(store.user_ids.tolist(), [3, 7])
+        self.assertEqual(store.get(7), [(70, np.float32(0.9)), (71, np.float32(0.8))])
+        self.assertEqual(store.get(3), [(30, np.float32(0.5))])
+        self.assertIsNone(store.get(5))
+        self.assertEqual(store.meta, {'serving_key': 'v0'})
+
+    def test_new_run_is_picked_up_and_old_runs_pruned(self):
+        with override_settings(NCF_TOPK_STORE_DIR=self.root):
+            self.assertIsNone(get_topk_store())
+
+            self.write(0)
+            first = get_topk_store()
+            self.assertIs(get_topk_store(), first)
+
+            self.write(100)
+            second = get_topk_store()
+            self.write(200)
+
+        self.assertEqual(second.meta['serving_key'], 'v100')
+        self.assertEqual([movie_id for movie_id, _ in second.get(7)], [170, 171])
+        # A store opened before a later run keeps reading its own run, never a mix
+        self.assertEqual([movie_id for movie_id, _ in first.get(7)], [70, 71])
+        self.assertEqual(len(os.listdir(os.path.join(self.root, TopKStore.RUNS_DIR))), 2)
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import shutil
+import threading
+import numpy as np
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Padding value in movie_ids rows for users with fewer than top_k candidates
+PAD_MOVIE_ID = -1
+
+class TopKStore:
+    """
+    Read-only per-user top-K NCF recommendations written by precompute_ncf_topk
+    Arrays are memory-mapped, so lookups cost a binary search and one row read.
+
+        <root>/runs/<run>/user_ids.npy, movie_ids.npy, scores.npy, meta.json
+        <root>/CURRENT                  (name of the run being served)
+
+    Every run is written to a fresh directory and published by replacing CURRENT, so a
+    reader never pairs the arrays of one run with those of another.
+    """
+
+    USER_IDS_FILE = 'user_ids.npy'    # sorted Django user IDs, shape (n_users,)
+    MOVIE_IDS_FILE = 'movie_ids.npy'  # Django movie IDs, shape (n_users, top_k)
+    SCORES_FILE = 'scores.npy'        # float32 predictions, shape (n_users, top_k)
+    META_FILE = 'meta.json'
+    RUNS_DIR = 'runs'
+    POINTER_FILE = 'CURRENT'
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, self.META_FILE)) as f:
+            self.meta = json.load(f)
+        self.user_ids = np.load(os.path.join(directory, self.USER_IDS_FILE), mmap_mode='r')
+        self.movie_ids = np.load(os.path.join(directory, self.MOVIE_IDS_FILE), mmap_mode='r')
+        self.scores = np.load(os.path.join(directory, self.SCORES_FILE), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def get(self, user_id):
+        """Return [(movie_id, score), ...] best first, or None if the user wasn't precomputed"""
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row >= len(self.user_ids) or self.user_ids[row] != user_id:
+            return None
+
+        movie_ids = self.movie_ids[row]
+        scores = self.scores[row]
+        keep = movie_ids != PAD_MOVIE_ID
+        return list(zip(movie_ids[keep].tolist(), scores[keep].tolist()))
+
+    @classmethod
+    def current_run(cls, root):
+        """Directory of the run CURRENT points at (None if nothing was published)"""
+        try:
+            with open(os.path.join(root, cls.POINTER_FILE)) as f:
+                run = f.read().strip()
+        except OSError:
+            return None
+        return os.path.join(root, cls.RUNS_DIR, run) if run else None
+
+    @classmethod
+    def write(cls, root, user_ids, movie_ids, scores, meta):
+        """
+        Persist a store as a new run and point CURRENT at it; returns the run directory
+        Runs other than the new one and the one it replaced are deleted.
+        """
+        previous = cls.current_run(root)
+        run = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10 ** 9:09d}"
+        directory = os.path.join(root, cls.RUNS_DIR, run)
+        os.makedirs(directory)
+        order = np.argsort(user_ids)
+
+        arrays = {
+            cls.USER_IDS_FILE: np.asarray(user_ids, dtype=np.int64)[order],
+            cls.MOVIE_IDS_FILE: np.asarray(movie_ids, dtype=np.int64)[order],
+            cls.SCORES_FILE: np.asarray(scores, dtype=np.float32)[order],
+        }
+        for filename, array in arrays.items():
+            with open(os.path.join(directory, filename), 'wb') as f:
+                np.save(f, array)
+        with open(os.path.join(directory, cls.META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        tmp_path = os.path.join(root, cls.POINTER_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(run + '\n')
+        os.replace(tmp_path, os.path.join(root, cls.POINTER_FILE))
+
+        # Readers still mapping a deleted run keep their mapping until they reopen
+        keep = {os.path.abspath(path) for path in (directory, previous) if path}
+        for entry in os.scandir(os.path.join(root, cls.RUNS_DIR)):
+            if entry.is_dir() and os.path.abspath(entry.path) not in keep:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        return directory
+
+_store = None
+_store_stamp = None
+_store_lock = threading.Lock()
+
+def get_topk_store():
+    """Return the current TopKStore, reopening it when a new precompute run lands (None if absent)"""
+    global _store, _store_stamp
+    root = getattr(settings, 'NCF_TOPK_STORE_DIR', None)
+    if not root:
+        return None
+
+    # Replacing CURRENT gives it a new inode, so this changes with every published run
+    try:
+        stat = os.stat(os.path.join(root, TopKStore.POINTER_FILE))
+    except OSError:
+        return None
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+
+    if stamp != _store_stamp:
+        with _store_lock:
+            if stamp != _store_stamp:
+                try:
+                    _store = TopKStore(TopKStore.current_run(root))
+                    logger.info(f"Loaded NCF top-K store for {len(_store)} users")
+                except Exception as e:
+                    logger.error(f"Error loading NCF top-K store: {e}")
+                    _store = None
+                _store_stamp = stamp
+    return _store
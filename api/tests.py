@@ -1,3 +1,107 @@
-from django.test import TestCase
+import json
+import numpy as np
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from movies.models import Movie, Genre
+from users.models import UserPreference
 
-# Create your tests here.
+class ScoreCandidatesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('viewer', password='secret')
+        self.other = User.objects.create_user('other', password='secret')
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        drama = Genre.objects.create(name='Drama')
+        comedy = Genre.objects.create(name='Comedy')
+        self.drama_movie, self.comedy_movie, self.plain_movie = [
+            Movie.objects.create(title=f'Movie {i}', plot='', release_year=2000, duration_minutes=90)
+            for i in range(3)
+        ]
+        self.drama_movie.genres.add(drama)
+        self.comedy_movie.genres.add(comedy)
+        UserPreference.objects.create(user=self.user, genre_preferences={'Drama': 0.9})
+
+        self.ncf_scores = {self.drama_movie.id: 0.6, self.comedy_movie.id: 0.8, self.plain_movie.id: 0.7}
+        engine = mock.Mock()
+        engine.score_candidates.side_effect = lambda user_id, movie_ids: np.array(
+            [self.ncf_scores.get(movie_id, np.nan) for movie_id in movie_ids], dtype=np.float32
+        )
+        for patcher in (mock.patch('users.model_service.recommendation_engine', engine),
+                        mock.patch('api.views.served_model_key', return_value='v1')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, body, user=None):
+        self.client.force_login(user or self.user)
+        return self.client.post('/api/score/', body if isinstance(body, str) else json.dumps(body),
+                                content_type='application/json')
+
+    def assertError(self, response, status):
+        self.assertEqual(response.status_code, status)
+        self.assertIn('error', response.json())
+
+    def test_response_shape_and_blend(self):
+        movie_ids = [self.drama_movie.id, self.comedy_movie.id, self.plain_movie.id, 999999]
+        response = self.post({'movie_ids': movie_ids})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['user_id'], self.user.id)
+        self.assertEqual(data['model_version'], 'v1')
+        self.assertEqual(data['unscored'], [999999])
+
+        # 0.8 * ncf + 0.2 * genre on the raw 0-1 scales; a movie without genres takes the mean genre score
+        expected = [
+            (self.comedy_movie.id, 0.8 * 0.8 + 0.2 * 0.5, 0.8, 0.5),
+            (self.plain_movie.id, 0.8 * 0.7 + 0.2 * 0.7, 0.7, None),
+            (self.drama_movie.id, 0.8 * 0.6 + 0.2 * 0.9, 0.6, 0.9),
+        ]
+        self.assertEqual([row['id'] for row in data['scores']], [row[0] for row in expected])
+        for row, (_, score, ncf_score, genre_score) in zip(data['scores'], expected):
+            self.assertEqual(set(row), {'id', 'score', 'ncf_score', 'genre_score'})
+            self.assertAlmostEqual(row['score'], score, places=5)
+            for value, expected_value in ((row['ncf_score'], ncf_score), (row['genre_score'], genre_score)):
+                if expected_value is None:
+                    self.assertIsNone(value)
+                else:
+                    self.assertAlmostEqual(value, expected_value, places=5)
+
+    def test_close_scores_are_not_stretched(self):
+        self.ncf_scores = {self.drama_movie.id: 0.50, self.comedy_movie.id: 0.51}
+        UserPreference.objects.filter(user=self.user).update(genre_preferences={})
+
+        scores = [row['score'] for row in self.post({'movie_ids': [self.drama_movie.id, self.comedy_movie.id]}).json()['scores']]
+        self.assertAlmostEqual(scores[0] - scores[1], 0.8 * 0.01, places=5)
+
+    def test_body_validation(self):
+        self.assertError(self.post('not json'), 400)
+        self.assertError(self.post([1, 2]), 400)
+        self.assertError(self.post({}), 400)
+        self.assertError(self.post({'movie_ids': []}), 400)
+        self.assertError(self.post({'movie_ids': 'abc'}), 400)
+        self.assertError(self.post({'movie_ids': [1, 'x']}), 400)
+        with override_settings(NCF_SCORE_MAX_CANDIDATES=2):
+            self.assertError(self.post({'movie_ids': [1, 2, 3]}), 400)
+
+    def test_user_id_must_be_an_integer(self):
+        self.assertError(self.post({'movie_ids': [1], 'user_id': 'abc'}, user=self.staff), 400)
+        self.assertError(self.post({'movie_ids': [1], 'user_id': [1]}, user=self.staff), 400)
+
+    def test_scoring_for_another_user_is_staff_only(self):
+        self.assertError(self.post({'movie_ids': [1], 'user_id': self.other.id}), 403)
+
+        response = self.post({'movie_ids': [1], 'user_id': str(self.user.id)})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.post({'movie_ids': [1], 'user_id': self.other.id}, user=self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user_id'], self.other.id)
+
+        self.assertEqual(self.post({'movie_ids': [1], 'user_id': 999999}, user=self.staff).status_code, 404)
+
+    def test_login_required(self):
+        response = self.client.post('/api/score/', json.dumps({'movie_ids': [1]}), content_type='application/json')
+        self.assertEqual(response.status_code, 302)
@@ -17,4 +17,5 @@ urlpatterns = [
     path('refresh/', views.refresh_recommendations, name='refresh_recommendations'),
     path('hybrid-recommendations/', views.get_hybrid_recommendations, name='hybrid_recommendations'),
     path('ncf-similar/<int:movie_id>/', views.get_ncf_similar_movies, name='ncf_similar_movies'),
+    path('score/', views.score_candidates, name='score_candidates'),
 ]
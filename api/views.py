@@ -1,5 +1,6 @@
 import logging
 logger = logging.getLogger(__name__)
+from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
@@ -7,6 +8,9 @@ from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import ensure_csrf_cookie
 from users.preference_service import RealTimePreferenceService
 from users.model_service import HybridModelService
+from users.interaction_buffer import get_interaction_buffer
+from ai_models.ncf_service import ncf_service
+from ai_models.engines import served_model_key
 import json
 from django.db import transaction, DatabaseError
 import sqlite3
@@ -14,7 +18,7 @@ from django.core.cache import cache
 import time
 
 from movies.models import Movie
-from users.models import Rating, Watchlist
+from users.models import User, Rating, Watchlist
 from users.preference_service import RealTimePreferenceService
 
 # Set up logger
@@ -65,23 +69,37 @@ def get_ncf_similar_movies(request, movie_id):
     NEW: Get similar movies using NCF model embeddings
     """
     try:
-        # This would use your NCF model's learned embeddings
-        # For now, fall back to your existing similarity
-        movie = Movie.objects.get(id=movie_id)
-        similar_movies = Movie.objects.filter(
-            genres__in=movie.genres.all()
-        ).exclude(id=movie_id).distinct()[:10]
-        
-        movies_data = [{
-            'id': m.id,
-            'title': m.title,
-            'poster_url': m.get_poster_url(),
-            'similarity_score': 0.85  # Placeholder - would come from NCF embeddings
-        } for m in similar_movies]
+        similar = ncf_service.get_similar_movies(movie_id, top_k=10)
+        
+        if similar:
+            # Similarity comes straight from the embedding matrix; only hydrate the results
+            movies_by_id = Movie.objects.in_bulk([similar_id for similar_id, score in similar])
+            movies_data = [{
+                'id': similar_id,
+                'title': movies_by_id[similar_id].title,
+                'poster_url': movies_by_id[similar_id].get_poster_url(),
+                'similarity_score': round(score, 4)
+            } for similar_id, score in similar if similar_id in movies_by_id]
+            method = 'ncf_embeddings'
+        else:
+            # Movie unknown to the NCF model - fall back to genre overlap
+            movie = Movie.objects.get(id=movie_id)
+            similar_movies = Movie.objects.filter(
+                genres__in=movie.genres.all()
+            ).exclude(id=movie_id).distinct()[:10]
+            
+            movies_data = [{
+                'id': m.id,
+                'title': m.title,
+                'poster_url': m.get_poster_url(),
+                'similarity_score': None
+            } for m in similar_movies]
+            method = 'genre_fallback'
         
         return JsonResponse({
             'status': 'success',
-            'similar_movies': movies_data
+            'similar_movies': movies_data,
+            'method': method
         })
         
     except Movie.DoesNotExist:
@@ -89,6 +107,69 @@ def get_ncf_similar_movies(request, movie_id):
     except Exception as e:
         return JsonResponse({'status': 'error', 'error': str(e)}, status=500)
 
+@login_required
+@require_POST
+def score_candidates(request):
+    """
+    Personalized ordering of a caller-supplied candidate list (search, editorial rows, email)
+    Body: {"movie_ids": [...], "user_id": optional, staff only}. Scores come from one NCF pass
+    blended with genre preferences; Movie objects are never loaded.
+    """
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Body must be a JSON object'}, status=400)
+        movie_ids = data.get('movie_ids')
+        
+        if not isinstance(movie_ids, list) or not movie_ids:
+            return JsonResponse({'error': 'movie_ids must be a non-empty list'}, status=400)
+        
+        max_candidates = getattr(settings, 'NCF_SCORE_MAX_CANDIDATES', 5000)
+        if len(movie_ids) > max_candidates:
+            return JsonResponse({'error': f'At most {max_candidates} movie_ids per request'}, status=400)
+        
+        try:
+            movie_ids = [int(movie_id) for movie_id in movie_ids]
+        except (ValueError, TypeError):
+            return JsonResponse({'error': 'movie_ids must be integers'}, status=400)
+        
+        # Services scoring on behalf of another user must be staff
+        user = request.user
+        user_id = data.get('user_id')
+        if user_id is not None:
+            try:
+                user_id = int(user_id)
+            except (ValueError, TypeError):
+                return JsonResponse({'error': 'user_id must be an integer'}, status=400)
+        if user_id is not None and user_id != request.user.id:
+            if not request.user.is_staff:
+                return JsonResponse({'error': 'Only staff may score for another user'}, status=403)
+            try:
+                user = User.objects.get(id=user_id)
+            except User.DoesNotExist:
+                return JsonResponse({'error': 'User not found'}, status=404)
+        
+        ranked, unscored = HybridModelService.score_candidates(user, movie_ids)
+        
+        return JsonResponse({
+            'status': 'success',
+            'user_id': user.id,
+            'scores': [{
+                'id': movie_id,
+                'score': round(score, 6),
+                'ncf_score': None if ncf_score is None else round(ncf_score, 6),
+                'genre_score': None if genre_score is None else round(genre_score, 6)
+            } for movie_id, score, ncf_score, genre_score in ranked],
+            'unscored': unscored,
+            'model_version': served_model_key()
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        logger.error(f"Candidate scoring error: {e}")
+        return JsonResponse({'status': 'error', 'error': str(e)}, status=500)
+
 @login_required
 def get_recommendations(request):
     """Get movie recommendations for the logged-in user"""
@@ -221,7 +302,7 @@ def update_movie_average_rating(movie):
         from django.db.models import Avg
         avg_rating = Rating.objects.filter(movie=movie).aggregate(Avg('rating'))['rating__avg']
         movie.average_rating = round(avg_rating, 1) if avg_rating else 0.0
-        movie.save(update_fields=['average_rating'])
+        movie.save(update_fields=['average_rating', 'updated_at'])
     except Exception as e:
         logger.error(f"Error updating movie average rating: {e}")
 
@@ -320,7 +401,11 @@ def remove_from_watchlist(request):
 @login_required
 @require_POST
 def track_interaction(request):
-    """Track user interaction and update preferences in real-time"""
+    """Track user interaction and update preferences in real-time
+    
+    With the interaction buffer on (INTERACTION_BUFFER_MODE 'async') the event is only queued:
+    the response says queued: true and carries no interaction_id.
+    """
     try:
         data = json.loads(request.body)
         movie_id = data.get('movie_id')
@@ -343,11 +428,16 @@ def track_interaction(request):
         )
         
         if interaction:
-            return JsonResponse({
+            # Buffered events are written after the response, so they have no id yet;
+            # events folded into an existing row never get one of their own
+            response = {
                 'success': True,
                 'message': 'Interaction tracked successfully',
-                'interaction_id': interaction.id
-            })
+                'queued': get_interaction_buffer() is not None
+            }
+            if interaction.pk is not None:
+                response['interaction_id'] = interaction.pk
+            return JsonResponse(response)
         else:
             return JsonResponse({'error': 'Failed to track interaction'}, status=500)
             
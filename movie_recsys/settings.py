@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'movies',
     # 'recommendations',  # Remove this line
     'api',
+    'ai_models',
 ]
 
 
@@ -169,9 +170,80 @@ TMDB_API_KEY = os.environ.get('TMDB_API_KEY', '8265bd1679663a7ea12ac168da84d2e8'
 
 # NCF Model Configuration
 NCF_MODEL_ENABLED = True
+# Versioned model registry: <root>/versions/<version>/ plus a CURRENT pointer (see ai_models/registry.py)
+NCF_MODEL_ROOT = os.path.join(BASE_DIR, 'ai_models', 'models')
+# Seconds between checks for a newly activated model version
+NCF_RELOAD_CHECK_INTERVAL = int(os.environ.get('NCF_RELOAD_CHECK_INTERVAL', '30'))
+# Load TensorFlow and the NCF model when a WSGI/ASGI worker boots rather than on its first request
+NCF_PRELOAD = os.environ.get('NCF_PRELOAD', 'False').lower() == 'true'
 NCF_MODEL_PATH = os.path.join(BASE_DIR, 'ai_models', 'models', 'max_performance_ncf.keras')
 NCF_USER_ENCODER_PATH = os.path.join(BASE_DIR, 'ai_models', 'models', 'user_encoder.pkl')
 NCF_MOVIE_ENCODER_PATH = os.path.join(BASE_DIR, 'ai_models', 'models', 'movie_encoder.pkl')
+# Inference backend: 'keras' (TensorFlow), 'numpy' (weights exported by `manage.py export_ncf_weights`)
+# or 'remote' (scoring delegated to a `manage.py run_ncf_server` process over NCF_SERVER_SOCKET)
+NCF_BACKEND = os.environ.get('NCF_BACKEND', 'keras')
+NCF_NUMPY_WEIGHTS_PATH = os.path.join(BASE_DIR, 'ai_models', 'models', 'max_performance_ncf.npz')
+NCF_SERVER_SOCKET = os.environ.get('NCF_SERVER_SOCKET', os.path.join(BASE_DIR, 'ncf_inference.sock'))
+NCF_SERVER_POOL_SIZE = 8        # idle connections kept per web worker
+NCF_SERVER_TIMEOUT = float(os.environ.get('NCF_SERVER_TIMEOUT', '1.0'))  # seconds per socket operation
+# Synthetic item vectors for movies added after training (`manage.py build_cold_start_vectors`)
+NCF_COLD_START_PATH = os.path.join(BASE_DIR, 'ai_models', 'models', 'cold_start_vectors.npz')
+NCF_COLD_START_NEIGHBORS = 50   # trained movies averaged into each synthetic vector
+# Approximate retrieval index over item embeddings (`manage.py build_ncf_ann_index`): only the
+# NCF_ANN_CANDIDATES best movies from the NCF_ANN_NPROBE closest inverted lists are fully scored
+NCF_ANN_ENABLED = os.environ.get('NCF_ANN_ENABLED', 'True').lower() == 'true'
+NCF_ANN_INDEX_DIR = os.path.join(BASE_DIR, 'ai_models', 'models', 'ann')
+NCF_ANN_NPROBE = int(os.environ.get('NCF_ANN_NPROBE', '16'))
+NCF_ANN_CANDIDATES = 300
+# Offline per-user top-K written by `manage.py precompute_ncf_topk`
+NCF_TOPK_STORE_DIR = os.path.join(BASE_DIR, 'ai_models', 'models', 'topk')
+# Movies scored per forward pass when ranking the whole catalog for one user
+NCF_SCORING_CHUNK_SIZE = 8192
+# Memory-map embedding matrices and ID lookup tables from <version>/shared/ so all workers share one copy
+NCF_SHARED_ARRAYS = os.environ.get('NCF_SHARED_ARRAYS', 'True').lower() == 'true'
+# Exact whole-catalog scoring split across a process pool (0 = off); used once a ranking covers
+# at least NCF_SHARDED_MIN_CANDIDATES movies. Workers map the shared arrays instead of copying them.
+NCF_SHARDED_PROCESSES = int(os.environ.get('NCF_SHARDED_PROCESSES', '0'))
+NCF_SHARDED_MIN_CANDIDATES = 100000
+# POST /api/score/: candidates re-ranked per request, and the share of genre preference in the blend
+NCF_SCORE_MAX_CANDIDATES = 5000
+NCF_SCORE_GENRE_WEIGHT = 0.2
+# Collaborative engine behind the hybrid: 'ncf' (pretrained Keras model) or 'als' (implicit ALS from `manage.py train_als`)
+RECOMMENDATION_ENGINE = os.environ.get('RECOMMENDATION_ENGINE', 'ncf')
+ALS_MODEL_PATH = os.path.join(BASE_DIR, 'ai_models', 'models', 'als_factors.npz')
+ALS_FACTORS = 64
+ALS_REGULARIZATION = 0.05
+ALS_ALPHA = 40.0              # confidence = 1 + ALS_ALPHA * summed interaction weight
+ALS_ITERATIONS = 15
+
+# Fold-in vectors for users who signed up after the NCF model was trained
+NCF_FOLD_IN_MAX_HISTORY = 200       # most recent ratings/interactions used
+NCF_FOLD_IN_CACHE_TIMEOUT = 600     # seconds a folded-in vector is reused
+# TensorFlow thread pools per worker process (0 lets TensorFlow decide)
+NCF_INTRA_OP_THREADS = int(os.environ.get('NCF_INTRA_OP_THREADS', '0'))
+NCF_INTER_OP_THREADS = int(os.environ.get('NCF_INTER_OP_THREADS', '0'))
+# Cross-request micro-batching of NCF scoring (see ai_models/batching.py)
+NCF_BATCHING_ENABLED = os.environ.get('NCF_BATCHING_ENABLED', 'False').lower() == 'true'
+NCF_BATCH_WINDOW_MS = float(os.environ.get('NCF_BATCH_WINDOW_MS', '3'))
+NCF_BATCH_MAX_SIZE = 16384      # max (user, movie) pairs per forward pass
+NCF_BATCH_QUEUE_SIZE = 256      # max pending requests before callers are rejected
+NCF_BATCH_TIMEOUT = 1.0         # seconds a caller waits before giving up
+
+# Interaction events are queued and written in batches by a background thread (users/interaction_buffer.py).
+# 'sync' writes them inside the request instead - use it for tests and one-off scripts.
+INTERACTION_BUFFER_MODE = os.environ.get('INTERACTION_BUFFER_MODE', 'async')
+INTERACTION_BUFFER_FLUSH_MS = 250        # max time an event waits before being written
+INTERACTION_BUFFER_BATCH_SIZE = 500      # events per bulk write
+INTERACTION_BUFFER_MAX_QUEUE = 10000     # queued events before producers write their own
+INTERACTION_BUFFER_PUT_TIMEOUT = 0.05    # seconds a request waits for queue space
+INTERACTION_BUFFER_WRITE_RETRIES = 3     # retries of a failed batch before writing it event by event
+INTERACTION_BUFFER_RETRY_BACKOFF = 0.1   # seconds before the first retry, doubled each time
+# Identical (user, movie, type) events of these types within the window become one row with a count (0 = off)
+INTERACTION_COALESCE_WINDOW = int(os.environ.get('INTERACTION_COALESCE_WINDOW', '60'))
+INTERACTION_COALESCE_TYPES = ('click', 'view_detail', 'search', 'recommendation_click')
+
+# Seconds between checks whether the in-process catalog snapshot must be refreshed (movies/catalog.py)
+CATALOG_CHECK_INTERVAL = 30
 
 # Enhanced Caching Configuration
 # REPLACE your current CACHES configuration with this:
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movie_recsys.settings')
 
 application = get_wsgi_application()
+
+# Serving processes can opt in to loading the NCF model at boot (NCF_PRELOAD=true)
+from django.conf import settings  # noqa: E402
+
+if settings.NCF_PRELOAD:
+    from ai_models.ncf_service import preload_ncf_model
+    preload_ncf_model()
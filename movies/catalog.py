@@ -0,0 +1,222 @@
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from .models import Movie, Genre
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Genres per word of the genre bitmask column
+BITS_PER_WORD = 64
+
+# Movie columns held by the snapshot, in values_list order
+COLUMNS = ('id', 'average_rating', 'release_year', 'created_at', 'updated_at')
+
+def _timestamps(values):
+    """POSIX seconds of datetimes, NaN for missing ones"""
+    return np.array([value.timestamp() if value is not None else np.nan for value in values], dtype=np.float64)
+
+class CatalogSnapshot:
+    """
+    Read-only columnar copy of the movie attributes recommendation paths filter and sort on
+    Row i describes movie ids[i] (sorted). Scalars are NumPy columns, datetimes are POSIX
+    seconds, and genres are a bitmask over genre_names (BITS_PER_WORD genres per uint64 word).
+    A changed catalog produces a new snapshot, so a caller can keep one for a whole request.
+    """
+
+    def __init__(self, ids, average_rating, release_year, created_at, updated_at, genre_bits, genres, version):
+        self.ids = ids
+        self.average_rating = average_rating
+        self.release_year = release_year
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.genre_bits = genre_bits
+        self.genre_ids = {name: genre_id for genre_id, name in genres}
+        self.genre_names = [name for _, name in genres]
+        self.genre_bit = {name: bit for bit, name in enumerate(self.genre_names)}
+        self.version = version
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, version):
+        """Whole catalog: one query each for movies, genres and movie/genre links"""
+        rows = list(Movie.objects.order_by('id').values_list(*COLUMNS))
+        ids, average_rating, release_year, created_at, updated_at = zip(*rows) if rows else ((),) * len(COLUMNS)
+        genres = list(Genre.objects.order_by('id').values_list('id', 'name'))
+
+        snapshot = cls(
+            np.array(ids, dtype=np.int64),
+            np.array(average_rating, dtype=np.float32),
+            np.array(release_year, dtype=np.int32),
+            _timestamps(created_at),
+            _timestamps(updated_at),
+            None, genres, version,
+        )
+        snapshot.genre_bits = snapshot._bits_from_links(Movie.genres.through.objects.values_list('movie_id', 'genre_id'))
+        logger.info(f"Catalog snapshot loaded: {len(snapshot):,} movies, {len(genres)} genres")
+        return snapshot
+
+    def refreshed(self, version):
+        """
+        Snapshot for `version`, reading only the movies added or saved since this one
+        Falls back to load() when genres were added or removed, movies were deleted, or too
+        much changed for a partial read to pay off. Genre links are re-read for the changed
+        movies only, or in full (links only) when links changed outside of them.
+        """
+        if version == self.version:
+            return self
+        count, last_id, updated_through, link_count, link_last_id, genre_count, genre_last_id = self.version
+        if version[5:] != (genre_count, genre_last_id) or version[0] < count:
+            return CatalogSnapshot.load(version)
+
+        changed = Q(id__gt=last_id or 0)
+        if updated_through is not None:
+            changed |= Q(updated_at__gte=updated_through)
+        rows = list(Movie.objects.filter(changed).order_by('id').values_list(*COLUMNS))
+        if len(rows) > max(len(self) // 4, 1000):
+            return CatalogSnapshot.load(version)
+
+        ids, average_rating, release_year, created_at, updated_at = zip(*rows) if rows else ((),) * len(COLUMNS)
+        ids = np.array(ids, dtype=np.int64)
+        keep = ~np.isin(self.ids, ids)
+        merged_ids = np.concatenate([self.ids[keep], ids])
+        order = np.argsort(merged_ids, kind='stable')
+
+        def merge(column, values, dtype):
+            return np.concatenate([column[keep], np.asarray(values, dtype=dtype)])[order]
+
+        snapshot = CatalogSnapshot(
+            merged_ids[order],
+            merge(self.average_rating, average_rating, np.float32),
+            merge(self.release_year, release_year, np.int32),
+            merge(self.created_at, _timestamps(created_at), np.float64),
+            merge(self.updated_at, _timestamps(updated_at), np.float64),
+            None, list(zip(self.genre_ids.values(), self.genre_names)), version,
+        )
+        # Deleted movies can't be seen by the changed-rows read
+        if len(snapshot) != version[0]:
+            return CatalogSnapshot.load(version)
+
+        links = Movie.genres.through.objects.values_list('movie_id', 'genre_id')
+        if version[3:5] != (link_count, link_last_id):
+            snapshot.genre_bits = snapshot._bits_from_links(links)
+        else:
+            bits = np.concatenate([self.genre_bits[keep], np.zeros((len(ids), self.genre_bits.shape[1]), dtype=np.uint64)])[order]
+            snapshot.genre_bits = snapshot._bits_from_links(links.filter(movie_id__in=ids.tolist()), bits)
+
+        logger.debug(f"Catalog snapshot refreshed: {len(ids)} changed movies")
+        return snapshot
+
+    def _bits_from_links(self, links, bits=None):
+        """Genre bitmask column from (movie_id, genre_id) pairs, OR-ed into `bits` if given"""
+        words = max(1, -(-len(self.genre_names) // BITS_PER_WORD))
+        if bits is None:
+            bits = np.zeros((len(self), words), dtype=np.uint64)
+        links = np.array(list(links), dtype=np.int64).reshape(-1, 2)
+
+        bit_of_genre = {self.genre_ids[name]: bit for name, bit in self.genre_bit.items()}
+        genre_bits = np.array([bit_of_genre.get(genre_id, -1) for genre_id in links[:, 1].tolist()], dtype=np.int64)
+        rows = self.rows_of(links[:, 0], keep_missing=True)
+        valid = (rows >= 0) & (genre_bits >= 0)
+
+        rows, genre_bits = rows[valid], genre_bits[valid]
+        np.bitwise_or.at(
+            bits, (rows, genre_bits // BITS_PER_WORD),
+            np.left_shift(np.uint64(1), (genre_bits % BITS_PER_WORD).astype(np.uint64)),
+        )
+        return bits
+
+    def rows_of(self, movie_ids, keep_missing=False):
+        """Row indices of movie_ids; ids not in the catalog are dropped (or -1 with keep_missing)"""
+        movie_ids = np.asarray(movie_ids if isinstance(movie_ids, np.ndarray) else list(movie_ids), dtype=np.int64)
+        if not len(self):
+            return np.full(len(movie_ids), -1, dtype=np.int64) if keep_missing else np.empty(0, dtype=np.int64)
+        rows = np.searchsorted(self.ids, movie_ids).clip(max=len(self) - 1)
+        found = self.ids[rows] == movie_ids
+        return np.where(found, rows, -1) if keep_missing else rows[found]
+
+    def contains(self, movie_ids):
+        """Boolean array: which of movie_ids are in the catalog"""
+        return self.rows_of(movie_ids, keep_missing=True) >= 0
+
+    def genre_mask(self, genre_names):
+        """Movies with any of genre_names; unknown names match nothing"""
+        mask = np.zeros(len(self), dtype=bool)
+        for name in genre_names:
+            bit = self.genre_bit.get(name)
+            if bit is not None:
+                word = self.genre_bits[:, bit // BITS_PER_WORD]
+                mask |= ((word >> np.uint64(bit % BITS_PER_WORD)) & np.uint64(1)) == 1
+        return mask
+
+    def genre_links(self):
+        """(rows, genre columns) of every movie/genre link, genre columns indexing genre_names"""
+        flags = np.unpackbits(self.genre_bits.view(np.uint8), axis=1, bitorder='little')[:, :len(self.genre_names)]
+        return np.nonzero(flags)
+
+    def exclude(self, movie_ids, mask=None):
+        """`mask` (default: every movie) with movie_ids switched off"""
+        mask = np.ones(len(self), dtype=bool) if mask is None else mask.copy()
+        mask[self.rows_of(movie_ids)] = False
+        return mask
+
+    def column(self, pairs, dtype=np.float64):
+        """Catalog-aligned column from (movie_id, value) pairs, 0 for movies without one"""
+        pairs = np.array(list(pairs), dtype=np.float64).reshape(-1, 2)
+        values = np.zeros(len(self), dtype=dtype)
+        rows = self.rows_of(pairs[:, 0].astype(np.int64), keep_missing=True)
+        values[rows[rows >= 0]] = pairs[rows >= 0, 1]
+        return values
+
+    def top(self, keys, limit, mask=None):
+        """
+        Ids of the first `limit` movies in `mask` ordered by keys, descending
+        keys are catalog-aligned columns, most significant first; ties keep id order.
+        """
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        if not len(rows) or limit <= 0:
+            return []
+        if keys:
+            order = np.lexsort([-np.asarray(key)[rows] for key in reversed(keys)])
+        else:
+            order = np.arange(len(rows))
+        return self.ids[rows[order[:limit]]].tolist()
+
+def catalog_version():
+    """Cheap fingerprint of movies, genres and their links; any save of a movie changes it"""
+    movies = Movie.objects.aggregate(count=Count('id'), last=Max('id'), updated=Max('updated_at'))
+    links = Movie.genres.through.objects.aggregate(count=Count('id'), last=Max('id'))
+    genres = Genre.objects.aggregate(count=Count('id'), last=Max('id'))
+    return (movies['count'], movies['last'], movies['updated'], links['count'], links['last'], genres['count'], genres['last'])
+
+_catalog = None
+_catalog_lock = threading.Lock()
+_last_check = 0.0
+
+def get_catalog():
+    """Process-wide CatalogSnapshot, refreshed when catalog_version() changes (checked every CATALOG_CHECK_INTERVAL s)"""
+    global _catalog, _last_check
+    now = time.monotonic()
+    if _catalog is not None and now - _last_check < getattr(settings, 'CATALOG_CHECK_INTERVAL', 30):
+        return _catalog
+
+    with _catalog_lock:
+        if _catalog is not None and now - _last_check < getattr(settings, 'CATALOG_CHECK_INTERVAL', 30):
+            return _catalog
+        _last_check = now
+        version = catalog_version()
+        if _catalog is None:
+            _catalog = CatalogSnapshot.load(version)
+        else:
+            _catalog = _catalog.refreshed(version)
+    return _catalog
+
+def hydrate(movie_ids, prefetch_genres=True):
+    """Movie objects for movie_ids in the same order, from one query (plus one for genres)"""
+    movies = Movie.objects.prefetch_related('genres') if prefetch_genres else Movie.objects
+    movies_by_id = movies.in_bulk(list(movie_ids))
+    return [movies_by_id[movie_id] for movie_id in movie_ids if movie_id in movies_by_id]
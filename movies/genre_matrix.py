@@ -0,0 +1,80 @@
+import threading
+import numpy as np
+from scipy import sparse
+from .catalog import get_catalog
+import logging
+
+logger = logging.getLogger(__name__)
+
+class GenreMatrix:
+    """
+    Sparse movie x genre incidence matrix of the whole catalog
+    Row i is movie_ids[i] (sorted), column j is genre_names[j]; entries are 1.0. Built from
+    the catalog snapshot's genre column, so no queries are needed.
+    """
+
+    def __init__(self, movie_ids, genre_names, matrix, stamp=None):
+        self.movie_ids = movie_ids
+        self.genre_names = genre_names
+        self.genre_index = {name: column for column, name in enumerate(genre_names)}
+        self.matrix = matrix
+        self.stamp = stamp
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """Matrix over the rows and genres of a CatalogSnapshot, from its genre bitmask column"""
+        rows, columns = catalog.genre_links()
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=(len(catalog), len(catalog.genre_names))
+        )
+        logger.info(f"Genre matrix built: {len(catalog):,} movies x {len(catalog.genre_names)} genres, {matrix.nnz:,} links")
+        return cls(catalog.ids, catalog.genre_names, matrix, catalog.version)
+
+    def rows_of(self, movie_ids):
+        """Row indices of the given movie ids; ids not in the matrix are dropped"""
+        movie_ids = np.asarray(list(movie_ids), dtype=np.int64)
+        if not len(self.movie_ids):
+            return np.empty(0, dtype=np.int64)
+        rows = np.searchsorted(self.movie_ids, movie_ids).clip(max=len(self.movie_ids) - 1)
+        return rows[self.movie_ids[rows] == movie_ids]
+
+    def weight_vector(self, genre_weights):
+        """Dense per-column vector from {genre_name: weight}; unknown genres are ignored"""
+        vector = np.zeros(len(self.genre_names), dtype=np.float32)
+        for name, weight in genre_weights.items():
+            column = self.genre_index.get(name)
+            if column is not None:
+                vector[column] = weight
+        return vector
+
+    def top_movies(self, genre_weights, limit, exclude_movie_ids=()):
+        """
+        [(movie_id, score), ...] of the best `limit` movies for {genre_name: weight}, best first
+        One sparse mat-vec scores the catalog; movies scoring 0 (none of the weighted genres)
+        and excluded movies are never returned.
+        """
+        if limit <= 0:
+            return []
+        scores = self.matrix @ self.weight_vector(genre_weights)
+        scores[self.rows_of(exclude_movie_ids)] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return list(zip(self.movie_ids[candidates].tolist(), scores[candidates].astype(float).tolist()))
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+def get_genre_matrix():
+    """Process-wide GenreMatrix of the current catalog snapshot, rebuilt when the snapshot changes"""
+    global _matrix
+    catalog = get_catalog()
+    if _matrix is not None and _matrix.stamp == catalog.version:
+        return _matrix
+
+    with _matrix_lock:
+        if _matrix is None or _matrix.stamp != catalog.version:
+            _matrix = GenreMatrix.from_catalog(catalog)
+    return _matrix
@@ -2,7 +2,8 @@ from django.core.management.base import BaseCommand
 from movies.models import Movie, Genre
 from users.models import UserInteraction, UserPreference
 from django.contrib.auth.models import User
-from django.db.models import Count, Q
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
 import random
 
 class Command(BaseCommand):
@@ -61,7 +62,7 @@ class Command(BaseCommand):
         
         # Analyze genre preferences
         genre_interactions = interactions.values('movie__genres__name').annotate(
-            count=Count('id')
+            count=Sum('count')
         ).order_by('-count')
         
         preferred_genres = []
@@ -120,7 +121,7 @@ class Command(BaseCommand):
                 trending = Movie.objects.filter(
                     genres=genre
                 ).annotate(
-                    interaction_count=Count('userinteraction')
+                    interaction_count=Coalesce(Sum('userinteraction__count'), 0)
                 ).exclude(
                     userinteraction__user=user
                 ).order_by('-interaction_count', '-average_rating')[:2]
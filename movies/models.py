@@ -32,6 +32,7 @@ class Movie(models.Model):
     directors = models.ManyToManyField(Person, related_name='directed_movies', blank=True)
     average_rating = models.FloatField(default=0.0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def get_poster_url(self):
         """Get poster URL, fetching from TMDb if needed"""
@@ -1,3 +1,147 @@
-from django.test import TestCase
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from users.models import UserInteraction
+from users.preference_service import RealTimePreferenceService
+from . import catalog, genre_matrix
+from .catalog import CatalogSnapshot, catalog_version, get_catalog
+from .genre_matrix import get_genre_matrix
+from .models import Movie, Genre
 
-# Create your tests here.
+@override_settings(CATALOG_CHECK_INTERVAL=0)
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        catalog._catalog = None
+        self.drama = Genre.objects.create(name='Drama')
+        self.comedy = Genre.objects.create(name='Comedy')
+        self.movies = [
+            Movie.objects.create(title=f'Movie {i}', plot='', release_year=2000 + i, duration_minutes=90, average_rating=i)
+            for i in range(4)
+        ]
+        self.movies[0].genres.add(self.drama)
+        self.movies[1].genres.add(self.drama, self.comedy)
+        self.movies[2].genres.add(self.comedy)
+
+    def tearDown(self):
+        catalog._catalog = None
+
+    def assertMatchesLoad(self, snapshot):
+        """A refreshed snapshot must equal a full load of the same catalog"""
+        loaded = CatalogSnapshot.load(catalog_version())
+        np.testing.assert_array_equal(snapshot.ids, loaded.ids)
+        np.testing.assert_array_equal(snapshot.average_rating, loaded.average_rating)
+        np.testing.assert_array_equal(snapshot.release_year, loaded.release_year)
+        np.testing.assert_array_equal(snapshot.genre_bits, loaded.genre_bits)
+        self.assertEqual(snapshot.genre_names, loaded.genre_names)
+
+    def ids(self, *indices):
+        return [self.movies[i].id for i in indices]
+
+    def test_load(self):
+        snapshot = get_catalog()
+
+        self.assertEqual(snapshot.ids.tolist(), self.ids(0, 1, 2, 3))
+        self.assertEqual(snapshot.release_year.tolist(), [2000, 2001, 2002, 2003])
+        self.assertEqual(snapshot.ids[snapshot.genre_mask(['Drama'])].tolist(), self.ids(0, 1))
+        self.assertEqual(snapshot.ids[snapshot.genre_mask(['Comedy', 'Unknown'])].tolist(), self.ids(1, 2))
+
+    def test_unchanged_catalog_keeps_the_snapshot(self):
+        self.assertIs(get_catalog(), get_catalog())
+
+    def test_saved_movie_is_refreshed(self):
+        get_catalog()
+        self.movies[0].average_rating = 9.5
+        self.movies[0].save()
+
+        snapshot = get_catalog()
+        self.assertEqual(float(snapshot.average_rating[0]), 9.5)
+        self.assertMatchesLoad(snapshot)
+
+    def test_new_movie_and_genre(self):
+        get_catalog()
+        horror = Genre.objects.create(name='Horror')
+        movie = Movie.objects.create(title='New', plot='', release_year=2020, duration_minutes=90)
+        movie.genres.add(horror)
+
+        snapshot = get_catalog()
+        self.assertEqual(snapshot.ids[snapshot.genre_mask(['Horror'])].tolist(), [movie.id])
+        self.assertMatchesLoad(snapshot)
+
+    def test_removed_genre_link(self):
+        get_catalog()
+        self.movies[1].genres.remove(self.drama)
+
+        snapshot = get_catalog()
+        self.assertEqual(snapshot.ids[snapshot.genre_mask(['Drama'])].tolist(), self.ids(0))
+        self.assertMatchesLoad(snapshot)
+
+    def test_deleted_movie(self):
+        get_catalog()
+        deleted = self.movies[2].id
+        self.movies[2].delete()
+
+        snapshot = get_catalog()
+        self.assertFalse(snapshot.contains([deleted])[0])
+        self.assertMatchesLoad(snapshot)
+
+    def test_top(self):
+        snapshot = get_catalog()
+
+        self.assertEqual(snapshot.top([snapshot.average_rating], 2), self.ids(3, 2))
+        self.assertEqual(snapshot.top([snapshot.average_rating], 5, snapshot.genre_mask(['Drama'])), self.ids(1, 0))
+        self.assertEqual(snapshot.top([], 2, snapshot.exclude(self.ids(0))), self.ids(1, 2))
+
+@override_settings(CATALOG_CHECK_INTERVAL=0)
+class GenreMatrixTests(TestCase):
+    preferences = {'Drama': 0.9, 'Comedy': 0.35, 'Horror': 0.62, 'Action': 0.2, 'Unknown': 0.8}
+
+    def setUp(self):
+        catalog._catalog = None
+        genre_matrix._matrix = None
+        self.addCleanup(setattr, catalog, '_catalog', None)
+        self.addCleanup(setattr, genre_matrix, '_matrix', None)
+
+        rng = np.random.default_rng(0)
+        genres = [Genre.objects.create(name=name) for name in ('Drama', 'Comedy', 'Horror', 'Action', 'Romance')]
+        for i in range(60):
+            movie = Movie.objects.create(title=f'Movie {i}', plot='', release_year=2000, duration_minutes=90)
+            movie.genres.add(*[genre for genre in genres if rng.random() < 0.4])
+
+        self.user = User.objects.create_user('viewer', password='secret')
+        for movie in Movie.objects.order_by('id')[:5]:
+            UserInteraction.objects.create(user=self.user, movie=movie, interaction_type='rate')
+
+    def orm_scores(self):
+        """The per-genre ORM loop top_movies replaced: each strong preference adds its weight to its genre's movies"""
+        movie_scores = {}
+        excluded_ids = set(UserInteraction.objects.filter(
+            user=self.user, interaction_type__in=['rate', 'watchlist_add']
+        ).values_list('movie_id', flat=True))
+        for genre_name, preference_weight in self.preferences.items():
+            if preference_weight > 0.3:
+                try:
+                    genre = Genre.objects.get(name=genre_name)
+                except Genre.DoesNotExist:
+                    continue
+                for movie in Movie.objects.filter(genres=genre).exclude(id__in=excluded_ids):
+                    movie_scores[movie.id] = movie_scores.get(movie.id, 0) + preference_weight
+        return movie_scores
+
+    def test_top_movies_match_the_orm_ranking(self):
+        expected = self.orm_scores()
+        strong = {name: weight for name, weight in self.preferences.items() if weight > 0.3}
+        excluded = UserInteraction.objects.filter(user=self.user).values_list('movie_id', flat=True)
+
+        ranked = get_genre_matrix().top_movies(strong, 1000, exclude_movie_ids=excluded)
+        self.assertEqual(sorted(movie_id for movie_id, _ in ranked), sorted(expected))
+        for movie_id, score in ranked:
+            self.assertAlmostEqual(score, expected[movie_id], places=5)
+        scores = [score for _, score in ranked]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_weighted_recommendations_match_the_orm_ranking(self):
+        expected = sorted(self.orm_scores().values(), reverse=True)[:10]
+
+        movies = RealTimePreferenceService._get_weighted_recommendations(self.user, self.preferences, 10)
+        scores = self.orm_scores()
+        np.testing.assert_allclose([scores[movie.id] for movie in movies], expected, rtol=1e-6)
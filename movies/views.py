@@ -1,6 +1,7 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Q, Count
+from django.db.models import Q, Sum
 from .models import Movie, Genre
+from .catalog import get_catalog, hydrate
 from users.models import Rating, Watchlist, UserPreference, UserInteraction
 from users.preference_service import RealTimePreferenceService
 from django.contrib.auth.decorators import login_required
@@ -50,41 +51,38 @@ def home(request):
     
     # **Multiple Movie Sections like Netflix/Amazon**
     
+    # Sections are ranked on the in-process catalog snapshot; only the movies shown are loaded
+    catalog = get_catalog()
+    
     # 1. Trending Movies (based on interactions and ratings)
-    trending_movies = Movie.objects.annotate(
-        interaction_count=Count('userinteraction')
-    ).order_by('-interaction_count', '-average_rating')[:12]
+    interaction_counts = UserInteraction.objects.values('movie_id').annotate(
+        total=Sum('count')
+    ).values_list('movie_id', 'total')
+    trending_ids = catalog.top([catalog.column(interaction_counts), catalog.average_rating], 12)
     
     # 2. Top Rated Movies (highest average rating) - Ensure all have ratings
-    top_rated_movies = Movie.objects.exclude(
-        average_rating=0.0
-    ).order_by('-average_rating', '-release_year')[:12]
+    top_rated_ids = catalog.top(
+        [catalog.average_rating, catalog.release_year], 12, mask=catalog.average_rating != 0.0
+    )
     
     # 3. Recently Added Movies
-    recent_movies = Movie.objects.order_by('-created_at')[:12]
+    recent_ids = catalog.top([catalog.created_at], 12)
     
     # 4. Popular by Genre sections
     popular_genres = ['Action', 'Comedy', 'Drama', 'Sci-Fi', 'Horror', 'Romance']
-    genre_sections = []
+    genre_ids = []
     
     for genre_name in popular_genres:
-        try:
-            genre = Genre.objects.get(name=genre_name)
-            genre_movies = Movie.objects.filter(
-                genres=genre
-            ).order_by('-average_rating', '-release_year')[:8]
-            
-            if genre_movies.exists():
-                genre_sections.append({
-                    'title': f'Popular {genre_name} Movies',
-                    'movies': list(genre_movies),
-                    'genre': genre_name.lower()
-                })
-        except Genre.DoesNotExist:
+        if genre_name not in catalog.genre_ids:
             continue
+        movie_ids = catalog.top(
+            [catalog.average_rating, catalog.release_year], 8, mask=catalog.genre_mask([genre_name])
+        )
+        if movie_ids:
+            genre_ids.append((genre_name, movie_ids))
     
     # 5. Decade-based sections
-    decade_sections = []
+    decade_ids = []
     decades = [
         (2020, 2024, '2020s'),
         (2010, 2019, '2010s'), 
@@ -93,17 +91,36 @@ def home(request):
     ]
     
     for start_year, end_year, decade_name in decades:
-        decade_movies = Movie.objects.filter(
-            release_year__gte=start_year,
-            release_year__lte=end_year
-        ).order_by('-average_rating')[:8]
-        
-        if decade_movies.exists():
-            decade_sections.append({
-                'title': f'Best of {decade_name}',
-                'movies': list(decade_movies),
-                'decade': decade_name.lower()
-            })
+        movie_ids = catalog.top(
+            [catalog.average_rating], 8,
+            mask=(catalog.release_year >= start_year) & (catalog.release_year <= end_year)
+        )
+        if movie_ids:
+            decade_ids.append((decade_name, movie_ids))
+    
+    # One query (plus genres) for every movie on the page
+    section_ids = [trending_ids, top_rated_ids, recent_ids]
+    section_ids += [movie_ids for _, movie_ids in genre_ids + decade_ids]
+    movies_by_id = {movie.id: movie for movie in hydrate({movie_id for ids in section_ids for movie_id in ids})}
+    
+    def movies_of(movie_ids):
+        return [movies_by_id[movie_id] for movie_id in movie_ids if movie_id in movies_by_id]
+    
+    trending_movies = movies_of(trending_ids)
+    top_rated_movies = movies_of(top_rated_ids)
+    recent_movies = movies_of(recent_ids)
+    
+    genre_sections = [{
+        'title': f'Popular {genre_name} Movies',
+        'movies': movies_of(movie_ids),
+        'genre': genre_name.lower()
+    } for genre_name, movie_ids in genre_ids]
+    
+    decade_sections = [{
+        'title': f'Best of {decade_name}',
+        'movies': movies_of(movie_ids),
+        'decade': decade_name.lower()
+    } for decade_name, movie_ids in decade_ids]
     
     # **All Genres** for browse
     genres = Genre.objects.all()
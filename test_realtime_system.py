@@ -10,6 +10,8 @@ import sys
 
 # Setup Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movie_recsys.settings')
+# Preferences are read back right after tracking, so write interactions immediately
+os.environ.setdefault('INTERACTION_BUFFER_MODE', 'sync')
 django.setup()
 
 from django.contrib.auth.models import User
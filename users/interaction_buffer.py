@@ -0,0 +1,274 @@
+import atexit
+import queue
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from movies.models import Movie
+from .models import UserPreference, UserInteraction
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Queued by close() to stop the writer thread
+_STOP = object()
+
+def recommendation_cache_keys(user_id):
+    """Per-user caches that depend on genre preferences"""
+    return [
+        f"recommendations_{user_id}",
+        f"personalized_movies_{user_id}",
+        f"genre_carousels_{user_id}",
+    ]
+
+def coalesce_cache_key(interaction):
+    return f"interaction_coalesce_{interaction.user_id}_{interaction.movie_id}_{interaction.interaction_type}"
+
+def coalesce_interactions(interactions):
+    """
+    Fold identical (user, movie, type) events of the coalescible types into one row with a count
+    Returns (new rows to insert, {existing row id: extra count}, new rows that open a window).
+    An event joins the row still cached under its key from the last INTERACTION_COALESCE_WINDOW
+    seconds, otherwise the first event of its key in this batch becomes a new row.
+    """
+    window = getattr(settings, 'INTERACTION_COALESCE_WINDOW', 60)
+    types = getattr(settings, 'INTERACTION_COALESCE_TYPES', ('click', 'view_detail', 'search', 'recommendation_click'))
+    if not window:
+        return list(interactions), {}, []
+
+    rows = []
+    grouped = {}
+    for interaction in interactions:
+        if interaction.interaction_type not in types:
+            rows.append(interaction)
+            continue
+        key = coalesce_cache_key(interaction)
+        if key in grouped:
+            grouped[key].count += 1
+        else:
+            grouped[key] = interaction
+            interaction.count = 1
+
+    existing = cache.get_many(list(grouped))
+    increments = {}
+    opened = []
+    for key, interaction in grouped.items():
+        if key in existing:
+            increments[existing[key]] = increments.get(existing[key], 0) + interaction.count
+        else:
+            opened.append(interaction)
+    return rows + opened, increments, opened
+
+def write_interactions(events):
+    """
+    Persist [(UserInteraction, boost_factor), ...] in one transaction
+    Repeated events are coalesced (coalesce_interactions) and the remaining rows go in with
+    one bulk INSERT. Preference changes are still replayed once per event, in order, in
+    memory, and each touched UserPreference is written once.
+    """
+    if not events:
+        return
+
+    interactions = [interaction for interaction, _ in events]
+    user_ids = {interaction.user_id for interaction in interactions}
+    movie_ids = {interaction.movie_id for interaction in interactions}
+
+    genre_names = {}
+    for movie_id, genre_name in Movie.genres.through.objects.filter(
+        movie_id__in=movie_ids
+    ).values_list('movie_id', 'genre__name'):
+        genre_names.setdefault(movie_id, []).append(genre_name)
+
+    rows, increments, opened = coalesce_interactions(interactions)
+
+    with transaction.atomic():
+        UserInteraction.objects.bulk_create(rows)
+
+        # Rows folded into the same number of events share one UPDATE
+        by_increment = {}
+        for row_id, extra in increments.items():
+            by_increment.setdefault(extra, []).append(row_id)
+        for extra, row_ids in by_increment.items():
+            UserInteraction.objects.filter(id__in=row_ids).update(count=F('count') + extra)
+
+        preferences = {pref.user_id: pref for pref in UserPreference.objects.filter(user_id__in=user_ids)}
+        for user_id in user_ids - preferences.keys():
+            preferences[user_id] = UserPreference.objects.get_or_create(user_id=user_id)[0]
+
+        changed = {}
+        for interaction, boost_factor in events:
+            pref = preferences[interaction.user_id]
+            if pref.update_genre_preferences(
+                genre_names.get(interaction.movie_id, []), interaction.interaction_type, boost_factor, save=False
+            ):
+                changed[pref.user_id] = pref
+
+        now = timezone.now()
+        for pref in changed.values():
+            pref.last_updated = now
+        UserPreference.objects.bulk_update(
+            list(changed.values()), ['genre_preferences', 'recent_genre_interactions', 'last_updated']
+        )
+
+    # Only after the commit, so a concurrent request can't re-cache the old preferences
+    cache.delete_many([key for user_id in user_ids for key in recommendation_cache_keys(user_id)])
+
+    # New rows open a coalescing window; the window is not extended by later events
+    if opened:
+        cache.set_many({
+            coalesce_cache_key(row): row.pk for row in opened if row.pk is not None
+        }, getattr(settings, 'INTERACTION_COALESCE_WINDOW', 60))
+
+class InteractionBuffer:
+    """
+    In-process buffer for interaction events, written by a background thread
+    Requests only enqueue; the writer drains up to batch_size events, or whatever arrived
+    within flush_interval_ms, and hands them to write_interactions. The queue is bounded:
+    when it stays full for put_timeout seconds the caller writes its own event synchronously,
+    which slows producers down instead of dropping events. A failed batch is retried
+    write_retries times with exponential backoff from retry_backoff seconds, then written one
+    event at a time; events that still fail are logged and counted in `dropped`. Remaining
+    events are flushed at interpreter exit.
+    """
+
+    def __init__(self, flush_interval_ms=250, batch_size=500, max_queue_size=10000, put_timeout=0.05,
+                 write_retries=3, retry_backoff=0.1):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name='interaction-buffer-writer', daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, interaction, boost_factor):
+        """Queue one unsaved UserInteraction with the boost its genres should receive"""
+        if not self._closed:
+            try:
+                self._queue.put((interaction, boost_factor), timeout=self.put_timeout)
+                return
+            except queue.Full:
+                logger.warning("Interaction buffer full, writing in the request")
+        write_interactions([(interaction, boost_factor)])
+
+    def flush(self):
+        """Block until every event queued so far is written"""
+        self._queue.join()
+
+    def close(self, timeout=5.0):
+        """Stop the writer after it has written everything already queued"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    def _run(self):
+        """Writer loop: collect one batch per flush interval and write it"""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+
+        # Drain anything queued behind the stop marker
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._write([item for item in remaining if item is not _STOP], done=len(remaining))
+
+    def _write(self, batch, done=None):
+        try:
+            if not batch:
+                pass
+            elif self._write_with_retries(batch):
+                logger.debug(f"Wrote {len(batch)} buffered interactions")
+            elif len(batch) > 1:
+                # Write what can be written, so one bad event doesn't lose the whole batch
+                for event in batch:
+                    if not self._write_with_retries([event], retries=0):
+                        self.dropped += 1
+                        logger.error(f"Dropped buffered interaction for user {event[0].user_id}, movie {event[0].movie_id}")
+            else:
+                self.dropped += len(batch)
+                logger.error(f"Dropped {len(batch)} buffered interactions")
+        finally:
+            close_old_connections()
+            for _ in range(len(batch) if done is None else done):
+                self._queue.task_done()
+
+    def _write_with_retries(self, batch, retries=None):
+        """write_interactions(batch), retried with exponential backoff; False if every attempt failed"""
+        retries = self.write_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                write_interactions(batch)
+                return True
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} buffered interactions (attempt {attempt + 1}): {e}")
+                # The transaction rolled back, so rows must be inserted again on the next attempt
+                for interaction, _ in batch:
+                    interaction.pk = None
+                close_old_connections()
+                if attempt < retries:
+                    time.sleep(self.retry_backoff * 2 ** attempt)
+        return False
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_interaction_buffer():
+    """Process-wide InteractionBuffer, started on first use (None in 'sync' mode)"""
+    global _buffer
+    if getattr(settings, 'INTERACTION_BUFFER_MODE', 'async') == 'sync':
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = InteractionBuffer(
+                    flush_interval_ms=getattr(settings, 'INTERACTION_BUFFER_FLUSH_MS', 250),
+                    batch_size=getattr(settings, 'INTERACTION_BUFFER_BATCH_SIZE', 500),
+                    max_queue_size=getattr(settings, 'INTERACTION_BUFFER_MAX_QUEUE', 10000),
+                    put_timeout=getattr(settings, 'INTERACTION_BUFFER_PUT_TIMEOUT', 0.05),
+                    write_retries=getattr(settings, 'INTERACTION_BUFFER_WRITE_RETRIES', 3),
+                    retry_backoff=getattr(settings, 'INTERACTION_BUFFER_RETRY_BACKOFF', 0.1),
+                )
+    return _buffer
+
+def record_interaction(interaction, boost_factor):
+    """Write now in 'sync' mode, otherwise hand the event to the background writer"""
+    buffer = get_interaction_buffer()
+    if buffer is None:
+        write_interactions([(interaction, boost_factor)])
+    else:
+        buffer.submit(interaction, boost_factor)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_userpreference_remove_userprofile_favorite_genres_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userinteraction',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.core.cache import cache
 from django.db.models import Q, Avg
-from .models import User, Rating, UserInteraction
+from .models import User, Rating, UserInteraction, UserPreference
 from movies.models import Movie
-from ai_models.ncf_service import ncf_service
+import numpy as np
+from ai_models.engines import recommendation_engine, served_model_key
+from ai_models.topk_store import get_topk_store
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,31 +15,54 @@ class HybridModelService:
     Service to combine your existing recommendations with NCF predictions
     """
     
+    @staticmethod
+    def ncf_cache_key(user_id, limit, serving_key=None):
+        """Cache keys carry the served model's key, so results from a replaced model age out on their own"""
+        return f"ncf_recommendations_{serving_key or served_model_key()}_{user_id}_{limit}"
+    
+    @staticmethod
+    def hybrid_cache_key(user_id, limit, serving_key=None):
+        return f"hybrid_recommendations_{serving_key or served_model_key()}_{user_id}_{limit}"
+    
+    @staticmethod
+    def cache_if_still_served(cache_key, serving_key, value, timeout):
+        """Cache a result only if the model that computed it (serving_key) is still being served
+        
+        A background swap during the computation would otherwise store the old model's
+        results under a key the new model reads.
+        """
+        if served_model_key() == serving_key:
+            cache.set(cache_key, value, timeout)
+    
     @staticmethod
     def get_ncf_recommendations(user, limit=20, exclude_rated=True):
         """Get recommendations from your Maximum Performance NCF model"""
-        if not ncf_service.is_model_loaded():
+        # Precomputed users are served from the offline store without touching the model
+        if exclude_rated:
+            precomputed = HybridModelService.get_precomputed_ncf_recommendations(user, limit)
+            if precomputed is not None:
+                return precomputed
+        
+        if not recommendation_engine.is_model_loaded():
             logger.warning("NCF model not loaded, falling back to existing recommendations")
             return []
         
-        # Get candidate movies (exclude already rated if specified)
+        # Score the full catalog from the model's in-memory movie array, minus already rated movies
         if exclude_rated:
-            rated_movie_ids = Rating.objects.filter(user=user).values_list('movie_id', flat=True)
-            candidate_movies = Movie.objects.exclude(id__in=rated_movie_ids)
+            excluded_movie_ids = list(Rating.objects.filter(user=user).values_list('movie_id', flat=True))
         else:
-            candidate_movies = Movie.objects.all()
+            excluded_movie_ids = []
         
-        candidate_movie_ids = list(candidate_movies.values_list('id', flat=True)[:1000])  # Limit for performance
+        if recommendation_engine.encode_user_id(user.id) is not None:
+            recommendations = recommendation_engine.recommend(user.id, exclude_movie_ids=excluded_movie_ids, top_k=limit)
+        else:
+            # User joined after training - fold them in from their history instead
+            recommendations = HybridModelService.get_fold_in_recommendations(user, limit, exclude_rated)
         
-        if not candidate_movie_ids:
-            return []
+        recommended_movie_ids = [movie_id for movie_id, score in recommendations]
         
-        # Get top recommendations from your NCF model
-        recommended_movie_ids = ncf_service.get_top_recommendations(
-            user.id, 
-            candidate_movie_ids, 
-            top_k=limit
-        )
+        if not recommended_movie_ids:
+            return []
         
         # Return Movie objects
         movies = Movie.objects.filter(id__in=recommended_movie_ids)
@@ -47,10 +73,109 @@ class HybridModelService:
         
         return ordered_movies
     
+    @staticmethod
+    def get_ncf_recommendations_batch(user_ids, limit=20, exclude_rated=True, block_users=64):
+        """Yield (user_id, [(movie_id, score), ...]) for many users, for campaign and digest jobs
+        
+        Rated movies for every user come from one bulk query, and users are scored in blocks
+        by NCFModelService.recommend_many. Movie objects are not loaded. Users the NCF model
+        doesn't know (no fold-in here) yield an empty list.
+        """
+        if not recommendation_engine.is_model_loaded():
+            logger.warning("NCF model not loaded, no batch recommendations")
+            return
+        
+        user_ids = list(user_ids)
+        excluded_movie_ids = {}
+        if exclude_rated:
+            ratings = Rating.objects.filter(user_id__in=user_ids).values_list('user_id', 'movie_id')
+            for user_id, movie_id in ratings.iterator():
+                excluded_movie_ids.setdefault(user_id, []).append(movie_id)
+        
+        yield from recommendation_engine.recommend_many(
+            user_ids, exclude_movie_ids=excluded_movie_ids, top_k=limit, block_users=block_users
+        )
+    
+    @staticmethod
+    def get_fold_in_history(user):
+        """(movie_ids, weights) from the user's ratings and recent interactions, for NCF fold-in"""
+        from .preference_service import RealTimePreferenceService
+        
+        max_history = getattr(settings, 'NCF_FOLD_IN_MAX_HISTORY', 200)
+        history = {}
+        
+        # Ratings use the same boost as preference learning: negative for 1-2 stars
+        for movie_id, rating in Rating.objects.filter(user=user).order_by('-created_at').values_list('movie_id', 'rating')[:max_history]:
+            history[movie_id] = history.get(movie_id, 0.0) + RealTimePreferenceService._calculate_boost_factor('rate', rating)
+        
+        # Ratings are already counted above
+        interactions = UserInteraction.objects.filter(user=user).exclude(
+            interaction_type='rate'
+        ).values_list('movie_id', 'interaction_type', 'count')[:max_history]
+        for movie_id, interaction_type, count in interactions:
+            history[movie_id] = history.get(movie_id, 0.0) + count * RealTimePreferenceService._calculate_boost_factor(interaction_type)
+        
+        return list(history.keys()), list(history.values())
+    
+    @staticmethod
+    def get_fold_in_vector(user):
+        """Folded-in NCF user vector, cached per user and model version (None without usable history)"""
+        serving_key = served_model_key()
+        cache_key = f"ncf_fold_in_{serving_key}_{user.id}"
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        movie_ids, weights = HybridModelService.get_fold_in_history(user)
+        user_vector = recommendation_engine.fold_in_user(movie_ids, weights) if movie_ids else None
+        
+        if user_vector is not None:
+            HybridModelService.cache_if_still_served(
+                cache_key, serving_key, user_vector, getattr(settings, 'NCF_FOLD_IN_CACHE_TIMEOUT', 600)
+            )
+        return user_vector
+    
+    @staticmethod
+    def get_fold_in_recommendations(user, limit=20, exclude_rated=True):
+        """[(movie_id, score), ...] for a user unknown to the NCF encoder, via a folded-in vector"""
+        user_vector = HybridModelService.get_fold_in_vector(user)
+        if user_vector is None:
+            return []
+        
+        # The history movies define the vector, so they would otherwise top the list
+        excluded_movie_ids = HybridModelService.get_fold_in_history(user)[0] if exclude_rated else []
+        return recommendation_engine.recommend_for_vector(user_vector, exclude_movie_ids=excluded_movie_ids, top_k=limit)
+    
+    @staticmethod
+    def get_precomputed_ncf_recommendations(user, limit=20):
+        """Read NCF top-K from the precompute_ncf_topk store (None if the user isn't covered)"""
+        store = get_topk_store()
+        if store is None:
+            return None
+        
+        # A store built by any other model (or cold-start revision) than the served one is ignored
+        serving_key = served_model_key()
+        if serving_key is None or store.meta.get('serving_key') != serving_key:
+            return None
+        
+        precomputed = store.get(user.id)
+        if precomputed is None:
+            return None
+        
+        # Drop movies rated since the store was built; fall back to live scoring if too few remain
+        rated_movie_ids = set(Rating.objects.filter(user=user).values_list('movie_id', flat=True))
+        recommended_movie_ids = [movie_id for movie_id, score in precomputed if movie_id not in rated_movie_ids][:limit]
+        if len(recommended_movie_ids) < limit and len(precomputed) >= limit:
+            return None
+        
+        movie_dict = Movie.objects.in_bulk(recommended_movie_ids)
+        return [movie_dict[movie_id] for movie_id in recommended_movie_ids if movie_id in movie_dict]
+    
     @staticmethod
     def get_cached_ncf_recommendations(user, limit=20):
         """Get NCF recommendations with caching"""
-        cache_key = f"ncf_recommendations_{user.id}_{limit}"
+        serving_key = served_model_key()
+        cache_key = HybridModelService.ncf_cache_key(user.id, limit, serving_key)
         cached_results = cache.get(cache_key)
         
         if cached_results is not None:
@@ -60,19 +185,101 @@ class HybridModelService:
         recommendations = HybridModelService.get_ncf_recommendations(user, limit)
         
         # Cache for 30 minutes
-        cache.set(cache_key, recommendations, 1800)
+        HybridModelService.cache_if_still_served(cache_key, serving_key, recommendations, 1800)
         
         return recommendations
     
+    @staticmethod
+    def get_genre_preference_scores(user, movie_ids):
+        """Mean genre preference weight of each movie, NaN if the user has no preferences or the movie no genres
+        
+        Genres come straight from the movie/genre join table, so no Movie objects are built.
+        Genres the user has no weight for count at their base_preference_weight.
+        """
+        scores = np.full(len(movie_ids), np.nan, dtype=np.float32)
+        try:
+            user_pref = UserPreference.objects.get(user=user)
+        except UserPreference.DoesNotExist:
+            return scores
+        
+        genre_preferences = user_pref.genre_preferences or {}
+        if not genre_preferences:
+            return scores
+        
+        position = {movie_id: i for i, movie_id in enumerate(movie_ids)}
+        totals = np.zeros(len(movie_ids), dtype=np.float32)
+        counts = np.zeros(len(movie_ids), dtype=np.int32)
+        
+        movie_genres = Movie.genres.through.objects.filter(
+            movie_id__in=list(position)
+        ).values_list('movie_id', 'genre__name')
+        for movie_id, genre_name in movie_genres:
+            i = position[movie_id]
+            totals[i] += genre_preferences.get(genre_name, user_pref.base_preference_weight)
+            counts[i] += 1
+        
+        has_genres = counts > 0
+        scores[has_genres] = totals[has_genres] / counts[has_genres]
+        return scores
+    
+    @staticmethod
+    def calibrate_scores(scores):
+        """Clip scores onto the fixed 0-1 scale both signals are defined on; NaN stays NaN
+        
+        NCF outputs a sigmoid probability and implicit ALS predicts a 0/1 preference, while genre
+        weights are kept in 0-1 by UserPreference. The scale is the same for every request, so
+        near-equal scores stay near-equal instead of being stretched apart by the candidate set.
+        """
+        return np.clip(np.asarray(scores, dtype=np.float32), 0.0, 1.0)
+    
+    @staticmethod
+    def score_candidates(user, movie_ids):
+        """Re-rank externally supplied candidates for a user without hydrating Movie objects
+        
+        NCF scores for all candidates come from one vectorized pass. They are blended with the
+        user's genre preference weights on their shared 0-1 scale (calibrate_scores), weighted by
+        NCF_SCORE_GENRE_WEIGHT. A candidate missing one signal gets that signal's mean over the
+        candidates that have it, or 0.5 if none do. Returns [(movie_id,
+        score, ncf_score, genre_score), ...] best first, with the raw signals, plus the ids
+        that could not be scored at all.
+        """
+        movie_ids = list(dict.fromkeys(movie_ids))
+        
+        ncf_scores = recommendation_engine.score_candidates(user.id, movie_ids)
+        if ncf_scores is None:
+            ncf_scores = np.full(len(movie_ids), np.nan, dtype=np.float32)
+        genre_scores = HybridModelService.get_genre_preference_scores(user, movie_ids)
+        
+        signals = []
+        for scores in (ncf_scores, genre_scores):
+            calibrated = HybridModelService.calibrate_scores(scores)
+            known = ~np.isnan(calibrated)
+            calibrated[~known] = calibrated[known].mean() if known.any() else 0.5
+            signals.append(calibrated)
+        
+        genre_weight = getattr(settings, 'NCF_SCORE_GENRE_WEIGHT', 0.2)
+        blended = (1.0 - genre_weight) * signals[0] + genre_weight * signals[1]
+        blended[np.isnan(ncf_scores) & np.isnan(genre_scores)] = np.nan
+        
+        scored = np.flatnonzero(~np.isnan(blended))
+        scored = scored[np.argsort(-blended[scored], kind='stable')]
+        unscored = np.flatnonzero(np.isnan(blended))
+        
+        def value(score):
+            return None if np.isnan(score) else float(score)
+        
+        ranked = [
+            (movie_ids[i], float(blended[i]), value(ncf_scores[i]), value(genre_scores[i]))
+            for i in scored.tolist()
+        ]
+        return ranked, [movie_ids[i] for i in unscored.tolist()]
+    
     @staticmethod
     def invalidate_user_cache(user):
         """Invalidate NCF cache for user after interactions"""
-        cache_patterns = [
-            f"ncf_recommendations_{user.id}_*",
-            f"hybrid_recommendations_{user.id}_*"
-        ]
-        
         # Note: This is a simplified version. In production, use pattern-based cache invalidation
+        serving_key = served_model_key()
         for limit in [10, 20, 50]:  # Common limits
-            cache.delete(f"ncf_recommendations_{user.id}_{limit}")
-            cache.delete(f"hybrid_recommendations_{user.id}_{limit}")
+            cache.delete(HybridModelService.ncf_cache_key(user.id, limit, serving_key))
+            cache.delete(HybridModelService.hybrid_cache_key(user.id, limit, serving_key))
+        cache.delete(f"ncf_fold_in_{serving_key}_{user.id}")
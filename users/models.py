@@ -20,46 +20,58 @@ class UserPreference(models.Model):
     interaction_boost = models.FloatField(default=0.1)  # How much each interaction boosts preference
     decay_rate = models.FloatField(default=0.95)  # Daily decay multiplier
     
+    # Preference change per interaction type, scaled by the caller's boost factor
+    INTERACTION_BOOSTS = {
+        'view': 0.05,
+        'rate_high': 0.15,  # 4-5 star rating
+        'rate_low': -0.1,   # 1-2 star rating
+        'watchlist_add': 0.1,
+        'watchlist_remove': -0.05,
+        'click': 0.03
+    }
+    
     def update_genre_preference(self, genre_name, interaction_type='view', boost_factor=1.0):
         """Update genre preference based on user interaction"""
+        return self.update_genre_preferences([genre_name], interaction_type, boost_factor)[genre_name]
+    
+    def update_genre_preferences(self, genre_names, interaction_type='view', boost_factor=1.0, save=True):
+        """Apply one interaction to several genres at once and persist them with a single UPDATE
+        
+        Every genre gets the same boost and history entry update_genre_preference would give it,
+        but the two JSON columns are written once instead of once per genre. Returns
+        {genre_name: new_preference}.
+        """
         if not self.genre_preferences:
             self.genre_preferences = {}
-        
-        # Get current preference or start with base weight
-        current_pref = self.genre_preferences.get(genre_name, self.base_preference_weight)
-        
-        # Calculate boost based on interaction type
-        interaction_boosts = {
-            'view': 0.05,
-            'rate_high': 0.15,  # 4-5 star rating
-            'rate_low': -0.1,   # 1-2 star rating
-            'watchlist_add': 0.1,
-            'watchlist_remove': -0.05,
-            'click': 0.03
-        }
-        
-        boost = interaction_boosts.get(interaction_type, 0.05) * boost_factor
-        new_preference = min(1.0, max(0.0, current_pref + boost))
-        
-        self.genre_preferences[genre_name] = new_preference
-        
-        # Track recent interactions (keep last 50)
         if not self.recent_genre_interactions:
             self.recent_genre_interactions = []
         
-        self.recent_genre_interactions.append({
-            'genre': genre_name,
-            'interaction': interaction_type,
-            'timestamp': timezone.now().isoformat(),
-            'boost': boost
-        })
+        boost = self.INTERACTION_BOOSTS.get(interaction_type, 0.05) * boost_factor
+        timestamp = timezone.now().isoformat()
+        updated = {}
+        
+        for genre_name in genre_names:
+            # Get current preference or start with base weight
+            current_pref = self.genre_preferences.get(genre_name, self.base_preference_weight)
+            updated[genre_name] = self.genre_preferences[genre_name] = min(1.0, max(0.0, current_pref + boost))
+            
+            self.recent_genre_interactions.append({
+                'genre': genre_name,
+                'interaction': interaction_type,
+                'timestamp': timestamp,
+                'boost': boost
+            })
         
         # Keep only last 50 interactions
         if len(self.recent_genre_interactions) > 50:
             self.recent_genre_interactions = self.recent_genre_interactions[-50:]
         
-        self.save()
-        return new_preference
+        if save and updated:
+            if self.pk is None:
+                self.save()
+            else:
+                self.save(update_fields=['genre_preferences', 'recent_genre_interactions', 'last_updated'])
+        return updated
     
     def get_preferred_genres(self, top_n=5):
         """Get top N preferred genres"""
@@ -112,6 +124,8 @@ class UserInteraction(models.Model):
     rating_value = models.IntegerField(null=True, blank=True)  # If interaction is rating
     timestamp = models.DateTimeField(auto_now_add=True)
     session_id = models.CharField(max_length=100, null=True, blank=True)
+    # Identical events folded into this row within INTERACTION_COALESCE_WINDOW (see users/interaction_buffer.py)
+    count = models.PositiveIntegerField(default=1)
     
     # Context information
     page_context = models.CharField(max_length=50, null=True, blank=True)  # 'home', 'search', 'detail'
@@ -1,9 +1,13 @@
 from .models import UserPreference, UserInteraction, Rating
 from .model_service import HybridModelService
-from movies.models import Movie, Genre
+from ai_models.engines import served_model_key
+from .interaction_buffer import record_interaction
+from movies.models import Movie
+from movies.genre_matrix import get_genre_matrix
+from movies.catalog import get_catalog, hydrate
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Count, Avg, Q, F
+from django.db.models import Avg, F, Sum
 from django.core.cache import cache
 import uuid
 import json
@@ -31,7 +35,7 @@ class RealTimePreferenceService:
       This is the heart of your upgraded recommendation system
       """
       # Determine strategy weights based on user engagement
-      interaction_count = UserInteraction.objects.filter(user=user).count()
+      interaction_count = UserInteraction.objects.filter(user=user).aggregate(total=Sum('count'))['total'] or 0
       # Determine strategy weights based on user engagement
       if interaction_count < 5:  # New users
         weights = {
@@ -130,26 +134,26 @@ class RealTimePreferenceService:
     @staticmethod
     def get_cached_hybrid_recommendations(user, limit=20):
         """Cached version of hybrid recommendations"""
-        cache_key = f"hybrid_recommendations_{user.id}_{limit}"
+        serving_key = served_model_key()
+        cache_key = HybridModelService.hybrid_cache_key(user.id, limit, serving_key)
         cached = cache.get(cache_key)
         
         if cached is not None:
             return cached
         
         recommendations = RealTimePreferenceService.get_hybrid_recommendations(user, limit)
-        cache.set(cache_key, recommendations, 900)  # Cache for 15 minutes
+        HybridModelService.cache_if_still_served(cache_key, serving_key, recommendations, 900)  # Cache for 15 minutes
         
         return recommendations
 
     @staticmethod
     def track_interaction(user, movie, interaction_type, rating_value=None, context=None):
-        """Track user interaction and update preferences immediately"""
+        """Track user interaction and update preferences (buffered, see users/interaction_buffer.py)"""
         if not user.is_authenticated:
             return None
         
         try:
-            # Create interaction record
-            interaction = UserInteraction.objects.create(
+            interaction = UserInteraction(
                 user=user,
                 movie=movie,
                 interaction_type=interaction_type,
@@ -159,28 +163,12 @@ class RealTimePreferenceService:
                 recommendation_source=context.get('source', '') if context else ''
             )
             
-            # Update user preferences in real-time
-            user_pref, created = UserPreference.objects.get_or_create(user=user)
-            
             # Calculate boost factor based on interaction type and rating
             boost_factor = RealTimePreferenceService._calculate_boost_factor(interaction_type, rating_value)
             
-            # Update genre preferences based on the interaction
-            for genre in movie.genres.all():
-                user_pref.update_genre_preference(
-                    genre.name, 
-                    interaction_type, 
-                    boost_factor
-                )
-            
-            # Clear user's recommendation cache to force refresh
-            cache_keys = [
-                f"recommendations_{user.id}",
-                f"personalized_movies_{user.id}",
-                f"genre_carousels_{user.id}"
-            ]
-            for key in cache_keys:
-                cache.delete(key)
+            # The record, the genre preference update and the cache refresh are written by the
+            # interaction buffer - in the background, or right here with INTERACTION_BUFFER_MODE='sync'
+            record_interaction(interaction, boost_factor)
             
             logger.info(f"Tracked interaction: {user.username} {interaction_type} {movie.title}")
             return interaction
@@ -244,53 +232,41 @@ class RealTimePreferenceService:
     
     @staticmethod
     def _get_weighted_recommendations(user, genre_preferences, limit):
-        """Get recommendations weighted by genre preferences"""
-        # Get movies from preferred genres, weighted by preference strength
-        movie_scores = {}
+        """Get recommendations weighted by genre preferences
         
+        A movie scores the sum of the user's strong (> 0.3) preference weights over its genres:
+        one sparse product with the catalog's movie x genre matrix, then a partial sort. Only
+        the final `limit` movies are loaded from the database.
+        """
         # Exclude already rated/watched movies
-        excluded_ids = set(UserInteraction.objects.filter(
+        excluded_ids = UserInteraction.objects.filter(
             user=user, 
             interaction_type__in=['rate', 'watchlist_add']
-        ).values_list('movie_id', flat=True))
+        ).values_list('movie_id', flat=True)
         
-        for genre_name, preference_weight in genre_preferences.items():
-            if preference_weight > 0.3:  # Only consider strong preferences
-                try:
-                    genre = Genre.objects.get(name=genre_name)
-                    movies = Movie.objects.filter(
-                        genres=genre
-                    ).exclude(id__in=excluded_ids).select_related().prefetch_related('genres')
-                    
-                    for movie in movies:
-                        if movie.id not in movie_scores:
-                            movie_scores[movie.id] = {
-                                'movie': movie,
-                                'score': 0
-                            }
-                        # Add weighted score
-                        movie_scores[movie.id]['score'] += preference_weight
-                        
-                except Genre.DoesNotExist:
-                    continue
-        
-        # Sort by score and return top movies
-        sorted_movies = sorted(
-            movie_scores.values(), 
-            key=lambda x: x['score'], 
-            reverse=True
-        )
+        # Only consider strong preferences
+        strong_preferences = {
+            genre_name: weight for genre_name, weight in genre_preferences.items() if weight > 0.3
+        }
+        if not strong_preferences:
+            return []
         
-        return [item['movie'] for item in sorted_movies[:limit]]
+        ranked = get_genre_matrix().top_movies(strong_preferences, limit, exclude_movie_ids=excluded_ids)
+        return hydrate([movie_id for movie_id, score in ranked])
     
     @staticmethod
     def _get_trending_movies(limit):
-        """Get trending movies based on recent interactions"""
-        return Movie.objects.annotate(
-            interaction_count=Count('userinteraction', 
-                filter=Q(userinteraction__timestamp__gte=timezone.now() - timezone.timedelta(days=7))
-            )
-        ).order_by('-interaction_count', '-average_rating')[:limit]
+        """Get trending movies based on recent interactions
+        
+        Last week's interaction counts come from one grouped query; ranking by count, then
+        average rating, runs on the catalog snapshot. Only the `limit` winners are loaded.
+        """
+        recent_counts = UserInteraction.objects.filter(
+            timestamp__gte=timezone.now() - timezone.timedelta(days=7)
+        ).values('movie_id').annotate(total=Sum('count')).values_list('movie_id', 'total')
+        
+        catalog = get_catalog()
+        return hydrate(catalog.top([catalog.column(recent_counts), catalog.average_rating], limit))
     
     @staticmethod
     def get_dynamic_genre_carousels(user, max_genres=3):
@@ -316,31 +292,29 @@ class RealTimePreferenceService:
                 reverse=True
             )[:max_genres]
             
+            catalog = get_catalog()
+            unrated = catalog.exclude(
+                UserInteraction.objects.filter(user=user, interaction_type='rate').values_list('movie_id', flat=True)
+            )
+            
+            sections = []
             for genre_name, weight in sorted_genres:
-                if weight > 0.4:  # Only show strong preferences
-                    try:
-                        genre = Genre.objects.get(name=genre_name)
-                        
-                        # Get movies from this genre, excluding already rated
-                        movies = Movie.objects.filter(
-                            genres=genre
-                        ).exclude(
-                            id__in=UserInteraction.objects.filter(
-                                user=user, 
-                                interaction_type='rate'
-                            ).values_list('movie_id', flat=True)
-                        ).select_related().prefetch_related('genres')[:8]
-                        
-                        if movies.exists():
-                            carousels.append({
-                                'title': f'More {genre_name} Movies for You',
-                                'subtitle': f'Based on your preferences (Score: {weight:.1f})',
-                                'movies': list(movies),
-                                'genre': genre_name.lower(),
-                                'weight': weight
-                            })
-                    except Genre.DoesNotExist:
-                        continue
+                if weight > 0.4 and genre_name in catalog.genre_ids:  # Only show strong preferences
+                    # Movies from this genre, excluding already rated
+                    movie_ids = catalog.top([], 8, mask=unrated & catalog.genre_mask([genre_name]))
+                    if movie_ids:
+                        sections.append((genre_name, weight, movie_ids))
+            
+            movies = hydrate([movie_id for _, _, movie_ids in sections for movie_id in movie_ids])
+            movies_by_id = {movie.id: movie for movie in movies}
+            for genre_name, weight, movie_ids in sections:
+                carousels.append({
+                    'title': f'More {genre_name} Movies for You',
+                    'subtitle': f'Based on your preferences (Score: {weight:.1f})',
+                    'movies': [movies_by_id[movie_id] for movie_id in movie_ids if movie_id in movies_by_id],
+                    'genre': genre_name.lower(),
+                    'weight': weight
+                })
             
             # Cache for 10 minutes
             cache.set(cache_key, carousels, 600)
@@ -362,7 +336,7 @@ class RealTimePreferenceService:
             recent_interactions = UserInteraction.objects.filter(
                 user=user,
                 timestamp__gte=timezone.now() - timezone.timedelta(days=30)
-            ).values('interaction_type').annotate(count=Count('id'))
+            ).values('interaction_type').annotate(count=Sum('count'))
             
             # Rating patterns
             ratings = Rating.objects.filter(user=user)
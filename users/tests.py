@@ -1,3 +1,264 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+import numpy as np
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from ai_models.ncf_service import NCFModelService
+from ai_models.registry import ModelRegistry
+from ai_models.tests import install_test_model
+from movies import catalog
+from movies.models import Movie, Genre
+from .interaction_buffer import InteractionBuffer, write_interactions
+from .model_service import HybridModelService
+from .models import Rating, UserInteraction, UserPreference
+from .preference_service import RealTimePreferenceService
 
-# Create your tests here.
+class InteractionTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('viewer', password='secret')
+        self.drama = Genre.objects.create(name='Drama')
+        self.comedy = Genre.objects.create(name='Comedy')
+        self.movie = Movie.objects.create(title='Movie', plot='', release_year=2001, duration_minutes=100)
+        self.movie.genres.add(self.drama, self.comedy)
+
+@override_settings(INTERACTION_BUFFER_MODE='sync')
+class SyncInteractionBufferTests(InteractionTestMixin, TestCase):
+    def test_interaction_is_written_in_the_request(self):
+        interaction = RealTimePreferenceService.track_interaction(self.user, self.movie, 'watchlist_add')
+
+        self.assertIsNotNone(interaction.pk)
+        self.assertEqual(UserInteraction.objects.filter(user=self.user, interaction_type='watchlist_add').count(), 1)
+
+        preferences = UserPreference.objects.get(user=self.user).genre_preferences
+        self.assertAlmostEqual(preferences['Drama'], 0.5 + 0.1 * 0.4)
+        self.assertAlmostEqual(preferences['Comedy'], 0.5 + 0.1 * 0.4)
+
+    def test_preference_caches_are_cleared(self):
+        cache.set(f"personalized_movies_{self.user.id}", ['stale'])
+        RealTimePreferenceService.track_interaction(self.user, self.movie, 'watchlist_add')
+        self.assertIsNone(cache.get(f"personalized_movies_{self.user.id}"))
+
+    def test_api_returns_the_written_id(self):
+        self.client.force_login(self.user)
+        response = self.client.post('/api/track/', json.dumps({
+            'movie_id': self.movie.id, 'interaction_type': 'watchlist_add'
+        }), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['queued'])
+        self.assertEqual(response.json()['interaction_id'], UserInteraction.objects.get().pk)
+
+@override_settings(INTERACTION_BUFFER_MODE='async')
+class AsyncInteractionBufferTests(InteractionTestMixin, TestCase):
+    def test_api_reports_queued_events_without_an_id(self):
+        buffer = mock.Mock()
+        with mock.patch('users.interaction_buffer.get_interaction_buffer', return_value=buffer), \
+                mock.patch('api.views.get_interaction_buffer', return_value=buffer):
+            self.client.force_login(self.user)
+            response = self.client.post('/api/track/', json.dumps({
+                'movie_id': self.movie.id, 'interaction_type': 'watchlist_add'
+            }), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['queued'])
+        self.assertNotIn('interaction_id', response.json())
+        self.assertEqual(buffer.submit.call_count, 1)
+        self.assertFalse(UserInteraction.objects.exists())
+
+class InteractionBufferWriterTests(InteractionTestMixin, TransactionTestCase):
+    """The real writer thread, so its own connection must see committed rows"""
+
+    def buffer(self, **kwargs):
+        buffer = InteractionBuffer(**kwargs)
+        self.addCleanup(buffer.close)
+        return buffer
+
+    def event(self):
+        return UserInteraction(user=self.user, movie=self.movie, interaction_type='watchlist_add'), 1.0
+
+    def written(self):
+        return UserInteraction.objects.filter(user=self.user).count()
+
+    def test_events_are_written_within_the_flush_window(self):
+        buffer = self.buffer(flush_interval_ms=50)
+        buffer.submit(*self.event())
+
+        # Not flush(): the writer must get there on its own once the window closes
+        deadline = time.monotonic() + 5
+        while buffer._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.written(), 1)
+        self.assertIn('Drama', UserPreference.objects.get(user=self.user).genre_preferences)
+
+    def test_full_queue_writes_in_the_caller(self):
+        release = threading.Event()
+        writer_started = threading.Event()
+
+        def blocking_write(events):
+            if threading.current_thread().name == 'interaction-buffer-writer':
+                writer_started.set()
+                release.wait(5)
+            write_interactions(events)
+
+        with mock.patch('users.interaction_buffer.write_interactions', side_effect=blocking_write):
+            buffer = self.buffer(flush_interval_ms=0, max_queue_size=1, put_timeout=0.01)
+            buffer.submit(*self.event())
+            self.assertTrue(writer_started.wait(5))
+            buffer.submit(*self.event())
+
+            # The writer is stuck and the queue is full, so this one is written right here
+            interaction, boost_factor = self.event()
+            buffer.submit(interaction, boost_factor)
+            self.assertIsNotNone(interaction.pk)
+            self.assertEqual(self.written(), 1)
+
+            release.set()
+            buffer.flush()
+        self.assertEqual(self.written(), 3)
+
+    def test_close_drains_pending_events(self):
+        buffer = self.buffer(flush_interval_ms=60000)
+        for _ in range(3):
+            buffer.submit(*self.event())
+        buffer.close()
+
+        self.assertFalse(buffer._worker.is_alive())
+        self.assertEqual(self.written(), 3)
+
+    def test_failed_batch_is_retried_then_written_per_event(self):
+        bad, bad_boost = self.event()
+
+        def failing_write(events):
+            if any(interaction is bad for interaction, _ in events):
+                raise DatabaseError('bad event')
+            write_interactions(events)
+
+        with mock.patch('users.interaction_buffer.write_interactions', side_effect=failing_write) as write:
+            buffer = self.buffer(flush_interval_ms=60000, write_retries=2, retry_backoff=0)
+            buffer.submit(*self.event())
+            buffer.submit(bad, bad_boost)
+            buffer.submit(*self.event())
+            buffer.close()
+
+        # Three attempts at the batch, then one write per event
+        self.assertEqual(write.call_count, 6)
+        self.assertEqual(buffer.dropped, 1)
+        self.assertEqual(self.written(), 2)
+
+    def test_transient_failure_is_retried(self):
+        with mock.patch('users.interaction_buffer.write_interactions',
+                        side_effect=[DatabaseError('database is locked'), None]) as write:
+            buffer = self.buffer(flush_interval_ms=60000, retry_backoff=0)
+            buffer.submit(*self.event())
+            buffer.close()
+
+        self.assertEqual(write.call_count, 2)
+        self.assertEqual(buffer.dropped, 0)
+
+@override_settings(INTERACTION_BUFFER_MODE='sync', INTERACTION_COALESCE_WINDOW=60)
+class InteractionCoalescingTests(InteractionTestMixin, TestCase):
+    def track(self, interaction_type, times, user=None):
+        for _ in range(times):
+            RealTimePreferenceService.track_interaction(user or self.user, self.movie, interaction_type)
+
+    def test_repeated_clicks_share_one_row(self):
+        self.track('click', 3)
+
+        interaction = UserInteraction.objects.get()
+        self.assertEqual(interaction.count, 3)
+
+        # Every event still moves the preferences, as if each had its own row
+        other = User.objects.create_user('other', password='secret')
+        with override_settings(INTERACTION_COALESCE_WINDOW=0):
+            self.track('click', 3, user=other)
+        self.assertEqual(
+            UserPreference.objects.get(user=self.user).genre_preferences,
+            UserPreference.objects.get(user=other).genre_preferences,
+        )
+
+    def test_other_types_are_not_coalesced(self):
+        self.track('watchlist_add', 2)
+        self.assertEqual(UserInteraction.objects.count(), 2)
+
+    @override_settings(INTERACTION_COALESCE_WINDOW=0)
+    def test_zero_window_disables_coalescing(self):
+        self.track('click', 3)
+        self.assertEqual(list(UserInteraction.objects.values_list('count', flat=True)), [1, 1, 1])
+
+    def test_insights_count_events(self):
+        self.track('click', 3)
+        self.track('watchlist_add', 1)
+
+        insights = RealTimePreferenceService.get_user_insights(self.user)
+        self.assertEqual(insights['recent_interactions'], {'click': 3, 'watchlist_add': 1})
+
+@override_settings(NCF_BACKEND='numpy', NCF_SHARED_ARRAYS=False, NCF_ANN_ENABLED=False,
+                   NCF_BATCHING_ENABLED=False, NCF_SHARDED_PROCESSES=0, CATALOG_CHECK_INTERVAL=0)
+class FoldInRecommendationTests(TestCase):
+    """A user the NCF encoder has never seen, served from a model where dramas and comedies form two clusters"""
+
+    def setUp(self):
+        cache.clear()
+        catalog._catalog = None
+        self.addCleanup(setattr, catalog, '_catalog', None)
+
+        drama = Genre.objects.create(name='Drama')
+        comedy = Genre.objects.create(name='Comedy')
+        self.dramas, self.comedies = [], []
+        for i in range(60):
+            movie = Movie.objects.create(title=f'Movie {i}', plot='', release_year=2000, duration_minutes=100)
+            is_drama = i % 2 == 0
+            movie.genres.add(drama if is_drama else comedy)
+            (self.dramas if is_drama else self.comedies).append(movie.id)
+
+        rng = np.random.default_rng(0)
+        movie_ids = np.array(sorted(self.dramas + self.comedies))
+        movie_vectors = rng.normal(scale=0.3, size=(len(movie_ids), 8))
+        movie_vectors[:, 0] += np.where(np.isin(movie_ids, self.dramas), 2.0, -2.0)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        registry = ModelRegistry(directory.name)
+        trained_users = np.arange(100000, 100010)
+        install_test_model(registry, 'v1', trained_users, movie_ids, rng.normal(size=(10, 8)), movie_vectors)
+        self.service = NCFModelService.for_registry(registry)
+
+        for target in ('ai_models.engines.recommendation_engine', 'users.model_service.recommendation_engine'):
+            patcher = mock.patch(target, self.service)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user('newcomer', password='secret')
+
+    def rate(self, movie_ids, rating):
+        for movie_id in movie_ids:
+            Rating.objects.create(user=self.user, movie_id=movie_id, rating=rating)
+
+    def recommended_ids(self):
+        return [movie.id for movie in HybridModelService.get_ncf_recommendations(self.user, limit=10)]
+
+    def test_history_genre_ranks_first(self):
+        self.assertIsNone(self.service.encode_user_id(self.user.id))
+        self.rate(self.dramas[:4], 5)
+
+        recommended = self.recommended_ids()
+        self.assertEqual(len(recommended), 10)
+        self.assertTrue(set(recommended) <= set(self.dramas[4:]))
+
+    def test_disliked_movies_push_the_vector_away(self):
+        self.rate(self.comedies[:4], 1)
+        self.assertTrue(set(self.recommended_ids()) <= set(self.dramas))
+
+    def test_empty_history_falls_back(self):
+        self.assertEqual(HybridModelService.get_fold_in_recommendations(self.user, 10), [])
+        self.assertEqual(self.recommended_ids(), [])
+
+    def test_unusable_history_gives_no_vector(self):
+        self.assertIsNone(self.service.fold_in_user([999999], [1.0]))
+        self.assertIsNone(self.service.fold_in_user(self.dramas[:1] * 2, [1.0, -1.0]))